@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark comparing the WSGI and ASGI deployments
+
+Start both servers against the same database, then point this script at them:
+
+    gunicorn regulatory_assistant.wsgi -w 2 -b 127.0.0.1:8000
+    uvicorn regulatory_assistant.asgi:application --workers 2 --port 8001
+    # or: gunicorn regulatory_assistant.asgi -k uvicorn.workers.UvicornWorker -w 2 -b 127.0.0.1:8001
+
+    python benchmark_asgi.py --wsgi http://127.0.0.1:8000/api --asgi http://127.0.0.1:8001/api
+
+Each scenario fires the same requests at both servers from a pool of client
+threads and prints throughput and p50/p99 latency.
+"""
+import argparse
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+SAMPLE_REPORTS = [
+    "Patient experienced severe nausea and headache after taking Drug X. Patient recovered.",
+    "Patient reported mild dizziness, fatigue, and skin rash after taking Aspirin 500mg. Symptoms are ongoing.",
+    "Patient developed life-threatening anaphylaxis after penicillin injection. Patient was hospitalized.",
+    "Elderly patient on warfarin had moderate bleeding and confusion. Outcome unknown.",
+]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of latencies"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_scenario(base_url, method, path, payloads, concurrency):
+    """Send every payload with ``concurrency`` client threads; returns (elapsed, latencies, errors)"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+
+    def send(payload):
+        start = time.perf_counter()
+        try:
+            if method == 'POST':
+                response = session.post(f"{base_url}{path}", json=payload, timeout=60)
+            else:
+                response = session.get(f"{base_url}{path}", timeout=60)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, payloads))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, ok in results if not ok)
+    return elapsed, latencies, errors
+
+
+def run_benchmark(servers, requests_per_scenario, concurrency):
+    """Run each scenario against each server and print a comparison table"""
+    scenarios = [
+        ('process-report', 'POST', '/process-report/',
+         [{'report': SAMPLE_REPORTS[i % len(SAMPLE_REPORTS)] + f' Case {i}.'} for i in range(requests_per_scenario)]),
+        ('analytics', 'GET', '/analytics/', [None] * requests_per_scenario),
+        ('report-list', 'GET', '/reports/', [None] * (requests_per_scenario // 4 or 1)),
+    ]
+
+    print("🧪 WSGI vs ASGI concurrency benchmark")
+    print("=" * 78)
+    print(f"{'scenario':<16}{'server':<8}{'requests':>10}{'req/s':>10}{'p50 (ms)':>12}{'p99 (ms)':>12}{'errors':>10}")
+
+    all_ok = True
+    for name, method, path, payloads in scenarios:
+        for label, base_url in servers:
+            # One untimed request so lazy model loading is not measured
+            run_scenario(base_url, method, path, payloads[:1], 1)
+            elapsed, latencies, errors = run_scenario(base_url, method, path, payloads, concurrency)
+            throughput = len(payloads) / elapsed if elapsed else 0.0
+            print(f"{name:<16}{label:<8}{len(payloads):>10}{throughput:>10.1f}"
+                  f"{statistics.median(latencies) * 1000:>12.1f}{percentile(latencies, 0.99) * 1000:>12.1f}{errors:>10}")
+            if errors:
+                all_ok = False
+
+    print("=" * 78)
+    if all_ok:
+        print("✅ All requests succeeded")
+    else:
+        print("❌ Some requests failed; check the server logs")
+    return all_ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--wsgi', default='http://127.0.0.1:8000/api', help='Base API URL of the WSGI server')
+    parser.add_argument('--asgi', default='http://127.0.0.1:8001/api', help='Base API URL of the ASGI server')
+    parser.add_argument('--requests', type=int, default=400, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client threads')
+    args = parser.parse_args()
+
+    servers = [('wsgi', args.wsgi.rstrip('/')), ('asgi', args.asgi.rstrip('/'))]
+    sys.exit(0 if run_benchmark(servers, args.requests, args.concurrency) else 1)
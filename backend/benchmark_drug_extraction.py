@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Pathological-input benchmark for drug extraction
+
+Compares the legacy regex drug patterns with the linear DrugExtractor on
+long runs of words, up to the 10,000 character limit accepted by the API,
+and times the full extraction pipeline (keyword matching, gazetteer, rule
+patterns and the fuzzy fallback) on the same inputs.
+"""
+import os
+import re
+import sys
+import time
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from reports.drug_extractor import DrugExtractor
+
+MAX_REPORT_LENGTH = 10000
+SIZES = [1250, 2500, 5000, MAX_REPORT_LENGTH]
+REPEATS = 3
+
+# Worst-case budget for a single 10k character report
+LATENCY_BUDGET_SECONDS = 0.05
+# Budget for the full pipeline without spaCy, which adds its own parse time
+PIPELINE_BUDGET_SECONDS = 0.25
+# 8x more text costs 8x when linear and 64x when quadratic
+MAX_GROWTH = 24
+
+LEGACY_PATTERNS = [
+    r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\s+(?:tablet|capsule|injection|dose|mg|ml|g)\b',
+    r'\bDrug\s+[A-Z]\b',
+    r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\s+(?:X|Y|Z)\b',
+    r'\b(?:aspirin|ibuprofen|acetaminophen|morphine|penicillin|insulin|warfarin|metformin)\b'
+]
+
+KNOWN_DRUGS = [
+    'aspirin', 'ibuprofen', 'acetaminophen', 'morphine',
+    'penicillin', 'insulin', 'warfarin', 'metformin'
+]
+DOSAGE_FORMS = ['tablet', 'capsule', 'injection', 'dose', 'mg', 'ml', 'g']
+
+
+def legacy_extract(text):
+    """Drug extraction as previously done in NLPProcessor.extract_drug"""
+    for pattern in LEGACY_PATTERNS:
+        matches = re.findall(pattern, text, re.IGNORECASE)
+        if matches:
+            return matches[0]
+    drug_match = re.search(r'\bDrug\s+[A-Z]\b', text, re.IGNORECASE)
+    if drug_match:
+        return drug_match.group()
+    return None
+
+
+def repeat_to_length(chunk, length):
+    """Repeat a chunk of text up to the given length"""
+    return (chunk * (length // len(chunk) + 1))[:length]
+
+
+def make_inputs(length):
+    """Build pathological reports of the given length"""
+    return {
+        'lowercase words': repeat_to_length('patient reported feeling unwell ', length),
+        'capitalised words': repeat_to_length('Patient Reported Feeling Unwell ', length),
+        'drug-like words': repeat_to_length('Drug Drug Drug Compound ', length),
+        'realistic report': repeat_to_length(
+            'Patient experienced severe nausea after taking Aspirin 500mg. ', length
+        ),
+        # Long unknown words reach the fuzzy fallback, one lookup per word
+        'unknown long words': repeat_to_length('zqxwvutsrq plorkamine vextrobane ', length),
+    }
+
+
+def time_call(func, text):
+    """Return the worst latency of several calls in seconds"""
+    worst = 0.0
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        func(text)
+        worst = max(worst, time.perf_counter() - started)
+    return worst
+
+
+def load_pipeline():
+    """Return a function running the full extraction pipeline, bypassing the cache"""
+    from reports.nlp_processor import nlp_processor
+
+    def extract(text):
+        return nlp_processor._extract(text, None, nlp_processor.rules)
+
+    # Load the rules, gazetteer and fuzzy index before timing
+    nlp_processor.warm_up()
+    extract('')
+    return extract
+
+
+def check_timings(name, timings, budget):
+    """Report growth and return True if the largest input stays within budget and scales linearly"""
+    ok = True
+    growth = timings[-1] / max(timings[0], 1e-6)
+    if timings[-1] > budget:
+        ok = False
+        print(f"❌ {name}: {timings[-1] * 1000:.2f} ms exceeds budget")
+    if growth > MAX_GROWTH:
+        ok = False
+        print(f"❌ {name}: {growth:.1f}x growth is not linear")
+    print(f"   {name} growth {SIZES[0]} -> {SIZES[-1]} chars: {growth:.1f}x")
+    return ok
+
+
+def run_benchmark(include_legacy=True, include_pipeline=True):
+    """Run the benchmark and return True if the latency budgets hold"""
+    extractor = DrugExtractor(KNOWN_DRUGS, DOSAGE_FORMS)
+    pipeline = load_pipeline() if include_pipeline else None
+    within_budget = True
+
+    print("🧪 Drug extraction pathological-input benchmark")
+    print("=" * 72)
+    print(f"{'input':<20}{'chars':>8}{'legacy (ms)':>14}{'extractor (ms)':>16}{'pipeline (ms)':>15}")
+
+    for name in make_inputs(SIZES[0]):
+        timings, pipeline_timings = [], []
+        for length in SIZES:
+            text = make_inputs(length)[name]
+            legacy = time_call(legacy_extract, text) if include_legacy else float('nan')
+            current = time_call(extractor.extract, text)
+            full = time_call(pipeline, text) if pipeline else float('nan')
+            timings.append(current)
+            pipeline_timings.append(full)
+            print(f"{name:<20}{length:>8}{legacy * 1000:>14.2f}{current * 1000:>16.2f}{full * 1000:>15.2f}")
+
+        within_budget &= check_timings(f'{name} (extractor)', timings, LATENCY_BUDGET_SECONDS)
+        if pipeline:
+            within_budget &= check_timings(f'{name} (pipeline)', pipeline_timings, PIPELINE_BUDGET_SECONDS)
+
+    print("=" * 72)
+    if within_budget:
+        print(f"✅ Worst case stays under {LATENCY_BUDGET_SECONDS * 1000:.0f} ms per report "
+              f"({PIPELINE_BUDGET_SECONDS * 1000:.0f} ms for the full pipeline) and scales linearly")
+    return within_budget
+
+
+if __name__ == "__main__":
+    include_legacy = '--skip-legacy' not in sys.argv
+    include_pipeline = '--skip-pipeline' not in sys.argv
+    sys.exit(0 if run_benchmark(include_legacy, include_pipeline) else 1)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Drug gazetteer benchmark at dictionary scale
+
+The shipped data/drug_gazetteer.tsv is a small sample. This script generates
+a synthetic gazetteer of realistic size (100,000 drugs with brand names and
+synonyms by default), then times compiling its trie and fuzzy indexes,
+memory-mapping the index, exact lookups and scanning 10,000 character
+reports.
+
+    python benchmark_gazetteer.py --drugs 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from reports.fuzzy import compile_fuzzy_index, load_fuzzy_index
+from reports.gazetteer import compile_gazetteer, load_gazetteer
+
+SYLLABLES = ['ab', 'ce', 'dol', 'fen', 'gli', 'ka', 'lo', 'mab', 'met', 'nib', 'ol', 'pra',
+             'quin', 'ri', 'sar', 'tan', 'tri', 'vir', 'xa', 'zol', 'cil', 'dine', 'mide', 'pam']
+SALTS = ['hydrochloride', 'sodium', 'potassium', 'sulfate', 'acetate']
+
+# Budgets for the default 100k drug dictionary
+LOAD_BUDGET_SECONDS = 0.05
+LOOKUP_BUDGET_MICROSECONDS = 50
+SCAN_BUDGET_SECONDS = 0.05
+
+
+def drug_name(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 5))).capitalize()
+
+
+def write_source(path, drugs, seed=0):
+    """Write ``drugs`` lines of canonical name, brand names and a salt form; returns the canonical names"""
+    rng = random.Random(seed)
+    seen = set()
+
+    def unique_name():
+        while True:
+            name = drug_name(rng)
+            if name not in seen:
+                seen.add(name)
+                return name
+
+    canonicals = []
+    with open(path, 'w', encoding='utf-8') as source:
+        while len(canonicals) < drugs:
+            name = unique_name()
+            canonicals.append(name)
+            synonyms = [unique_name() for _ in range(rng.randint(1, 3))]
+            synonyms.append(f'{name} {rng.choice(SALTS)}')
+            source.write('\t'.join([name] + synonyms) + '\n')
+    return canonicals
+
+
+def make_report(rng, names, length):
+    """Report text of ``length`` characters mentioning a few known names"""
+    words = ['patient', 'reported', 'severe', 'nausea', 'after', 'taking', 'the', 'dose', 'of']
+    parts = []
+    while sum(len(part) + 1 for part in parts) < length:
+        parts.append(rng.choice(names) if rng.random() < 0.02 else rng.choice(words))
+    return ' '.join(parts)[:length]
+
+
+def run_benchmark(drugs, lookups):
+    """Run the benchmark and return True if the budgets hold"""
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / 'gazetteer.tsv'
+        canonicals = write_source(source, drugs)
+
+        print(f"🧪 Drug gazetteer benchmark ({drugs} drugs, {source.stat().st_size / 1e6:.1f} MB source)")
+        print("=" * 72)
+
+        stats = compile_gazetteer(source, Path(tmp) / 'gazetteer.idx')
+        print(f"trie compile      {stats['seconds']:>8.2f} s   {stats['names']} names, "
+              f"{stats['nodes']} nodes, {stats['bytes'] / 1e6:.1f} MB")
+        fuzzy_stats = compile_fuzzy_index(source, Path(tmp) / 'gazetteer.fuzzy.idx')
+        print(f"fuzzy compile     {fuzzy_stats['seconds']:>8.2f} s   {fuzzy_stats['entries']} variants, "
+              f"{fuzzy_stats['bytes'] / 1e6:.1f} MB")
+
+        started = time.perf_counter()
+        gazetteer = load_gazetteer(source, Path(tmp) / 'gazetteer.idx')
+        fuzzy = load_fuzzy_index(source, Path(tmp) / 'gazetteer.fuzzy.idx')
+        load = time.perf_counter() - started
+        print(f"load (mmap)       {load * 1000:>8.2f} ms")
+
+        sample = [rng.choice(canonicals) for _ in range(lookups)]
+        started = time.perf_counter()
+        for name in sample:
+            assert gazetteer.lookup(name.lower()) == name
+        lookup = (time.perf_counter() - started) / lookups * 1e6
+        print(f"exact lookup      {lookup:>8.2f} µs")
+
+        started = time.perf_counter()
+        for name in sample[:1000]:
+            fuzzy.lookup(name[:-1] + 'x', 1)
+        fuzzy_lookup = (time.perf_counter() - started) / min(lookups, 1000) * 1e6
+        print(f"fuzzy lookup      {fuzzy_lookup:>8.2f} µs")
+
+        reports = [make_report(rng, canonicals, 10000) for _ in range(20)]
+        started = time.perf_counter()
+        found = sum(len(gazetteer.find_all(report)) for report in reports)
+        scan = (time.perf_counter() - started) / len(reports)
+        print(f"scan 10k chars    {scan * 1000:>8.2f} ms   {found / len(reports):.0f} matches per report")
+
+    print("=" * 72)
+    within_budget = (
+        load <= LOAD_BUDGET_SECONDS
+        and lookup <= LOOKUP_BUDGET_MICROSECONDS
+        and scan <= SCAN_BUDGET_SECONDS
+    )
+    if within_budget:
+        print("✅ Load, lookup and scan stay within budget")
+    else:
+        print(f"❌ Budgets: load {LOAD_BUDGET_SECONDS * 1000:.0f} ms, lookup {LOOKUP_BUDGET_MICROSECONDS} µs, "
+              f"scan {SCAN_BUDGET_SECONDS * 1000:.0f} ms")
+    return within_budget
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drugs', type=int, default=100000, help='Canonical drug names to generate')
+    parser.add_argument('--lookups', type=int, default=20000, help='Exact lookups to time')
+    args = parser.parse_args()
+    sys.exit(0 if run_benchmark(args.drugs, args.lookups) else 1)
@@ -6,6 +6,19 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'regulatory_assistant.settings')
+# Same settings, but with the native async views for the hot endpoints; if you
+# set DJANGO_SETTINGS_MODULE yourself, point it at settings_asgi for ASGI servers
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'regulatory_assistant.settings_asgi')
 
 application = get_asgi_application()
+
+# Optionally load the NLP model up front; /api/health/ready/ reports progress
+from django.conf import settings  # noqa: E402
+
+if settings.NLP_WARM_UP:
+    from reports.executor import extraction_executor
+    extraction_executor.warm_up(background=True)
+
+if settings.EXTRACTION_RULES_RELOAD_SIGNAL:
+    from reports.nlp_processor import nlp_processor
+    nlp_processor.rule_store.install_reload_signal(settings.EXTRACTION_RULES_RELOAD_SIGNAL)
@@ -0,0 +1,14 @@
+"""
+URL configuration used by the ASGI entry point.
+
+Routes the hot endpoints to the native async views and falls back to the
+regular (sync) views for everything else.
+"""
+from django.contrib import admin
+from django.urls import path, include
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/', include('reports.async_urls')),
+    path('api/', include('reports.urls')),
+]
@@ -47,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# The ASGI entry point uses settings_asgi, which routes the hot endpoints to async views
 ROOT_URLCONF = 'regulatory_assistant.urls'
 
 TEMPLATES = [
@@ -123,6 +124,92 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# NLP settings
+DRUG_GAZETTEER_PATH = os.getenv('DRUG_GAZETTEER_PATH', str(BASE_DIR / 'data' / 'drug_gazetteer.tsv'))
+DRUG_GAZETTEER_INDEX = os.getenv('DRUG_GAZETTEER_INDEX', str(BASE_DIR / 'data' / 'drug_gazetteer.idx'))
+DRUG_FUZZY_INDEX = os.getenv('DRUG_FUZZY_INDEX', str(BASE_DIR / 'data' / 'drug_gazetteer.fuzzy.idx'))
+# Drug lexicons, keyword synonyms and translation tables; edits are picked up without a restart
+EXTRACTION_RULES_PATH = os.getenv('EXTRACTION_RULES_PATH', str(BASE_DIR / 'data' / 'extraction_rules.json'))
+# Seconds between checks of the rules file's modification time
+EXTRACTION_RULES_CHECK_INTERVAL = float(os.getenv('EXTRACTION_RULES_CHECK_INTERVAL', '2'))
+# Optional signal that makes a worker reload the rules at once (e.g. 'SIGUSR2')
+EXTRACTION_RULES_RELOAD_SIGNAL = os.getenv('EXTRACTION_RULES_RELOAD_SIGNAL', '')
+NLP_SPACY_MODEL = os.getenv('NLP_SPACY_MODEL', 'en_core_web_sm')
+# Only doc.ents is used, so skip the components NER does not depend on
+NLP_SPACY_EXCLUDE = ['tagger', 'parser', 'attribute_ruler', 'lemmatizer']
+# Load the model in the background when the WSGI/ASGI application starts
+NLP_WARM_UP = os.getenv('NLP_WARM_UP', 'False').lower() == 'true'
+NLP_BATCH_SIZE = int(os.getenv('NLP_BATCH_SIZE', '64'))
+NLP_N_PROCESS = int(os.getenv('NLP_N_PROCESS', '1'))
+
+# Extraction executor: 'inline' runs NLP in the request thread, 'process' uses a process pool
+NLP_EXECUTOR = os.getenv('NLP_EXECUTOR', 'inline')
+NLP_EXECUTOR_WORKERS = int(os.getenv('NLP_EXECUTOR_WORKERS', '0')) or None  # defaults to CPU count
+NLP_EXECUTOR_TIMEOUT = float(os.getenv('NLP_EXECUTOR_TIMEOUT', '30'))  # seconds per round of WORKERS tasks in a batch
+NLP_EXECUTOR_RETRIES = int(os.getenv('NLP_EXECUTOR_RETRIES', '1'))
+NLP_EXECUTOR_START_METHOD = os.getenv('NLP_EXECUTOR_START_METHOD', 'spawn')
+
+# Threads used by the async views to wait on extraction without blocking the event loop
+ASYNC_NLP_THREADS = int(os.getenv('ASYNC_NLP_THREADS', '8'))
+
+# Asynchronous processing: queue reports and let 'manage.py process_jobs' extract them
+REPORT_PROCESSING_ASYNC = os.getenv('REPORT_PROCESSING_ASYNC', 'False').lower() == 'true'
+JOB_BATCH_SIZE = int(os.getenv('JOB_BATCH_SIZE', '100'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1.0'))
+JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', '600'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+
+# Signal detection: cached contingency counts are rebuilt from the rollups at this interval (seconds)
+SIGNAL_REBUILD_INTERVAL = float(os.getenv('SIGNAL_REBUILD_INTERVAL', '300'))
+SIGNAL_MIN_COUNT = int(os.getenv('SIGNAL_MIN_COUNT', '3'))
+
+# Approximate analytics (/api/analytics/?mode=approximate): sketch sizes and how often
+# each process merges its counts into the stored sketch (seconds)
+SKETCH_WIDTH = int(os.getenv('SKETCH_WIDTH', '2048'))
+SKETCH_DEPTH = int(os.getenv('SKETCH_DEPTH', '5'))
+SKETCH_HEAVY_HITTERS = int(os.getenv('SKETCH_HEAVY_HITTERS', '100'))
+SKETCH_HLL_PRECISION = int(os.getenv('SKETCH_HLL_PRECISION', '12'))
+SKETCH_PERSIST_INTERVAL = float(os.getenv('SKETCH_PERSIST_INTERVAL', '30'))
+
+# Streaming export (/api/reports/export/): rows fetched per database round trip
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Streaming ingest (/api/process-reports/ingest/): reports extracted and committed per batch
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', '500'))
+
+# Idempotency-Key support on /api/process-report/: how long stored responses are replayed,
+# and after how many seconds an unfinished first request is considered abandoned
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', str(24 * 3600)))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '60'))
+# Answer a report whose text was already processed this many seconds ago from the stored row (0 = off)
+REPORT_DEDUP_WINDOW = int(os.getenv('REPORT_DEDUP_WINDOW', '0'))
+
+# Near-duplicate detection: text shingle Jaccard similarity at which a report is linked to an earlier one
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.8'))
+
+# Progress file of 'manage.py reprocess_reports', so an interrupted re-extraction can resume
+REPROCESS_CHECKPOINT_PATH = os.getenv('REPROCESS_CHECKPOINT_PATH', str(BASE_DIR / 'data' / 'reprocess.checkpoint'))
+
+# Similar-report search: compiled TF-IDF index (its delta logs are written next to it)
+SIMILARITY_INDEX_PATH = os.getenv('SIMILARITY_INDEX_PATH', str(BASE_DIR / 'data' / 'similarity.idx'))
+
+# Extraction result cache: in-process LRU plus an optional shared Django cache alias
+EXTRACTION_CACHE_SIZE = int(os.getenv('EXTRACTION_CACHE_SIZE', '10000'))
+EXTRACTION_CACHE_BACKEND = os.getenv('EXTRACTION_CACHE_BACKEND') or None  # e.g. 'extraction'
+EXTRACTION_CACHE_TIMEOUT = int(os.getenv('EXTRACTION_CACHE_TIMEOUT', str(7 * 24 * 3600)))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared across gunicorn workers on one host
+    'extraction': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(BASE_DIR / 'cache' / 'extraction'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -141,6 +228,7 @@ CORS_ALLOW_HEADERS = [
     'authorization',
     'content-type',
     'dnt',
+    'idempotency-key',
     'origin',
     'user-agent',
     'x-csrftoken',
@@ -0,0 +1,10 @@
+"""
+Settings for the ASGI entry point.
+
+Identical to the main settings except that the hot endpoints are routed to
+the native async views. Kept as a separate module so importing asgi.py
+never changes the routing of WSGI code in the same process.
+"""
+from .settings import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'regulatory_assistant.asgi_urls'
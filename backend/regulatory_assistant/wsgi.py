@@ -9,3 +9,14 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'regulatory_assistant.settings')
 
 application = get_wsgi_application()
+
+# Optionally load the NLP model up front; /api/health/ready/ reports progress
+from django.conf import settings  # noqa: E402
+
+if settings.NLP_WARM_UP:
+    from reports.executor import extraction_executor
+    extraction_executor.warm_up(background=True)
+
+if settings.EXTRACTION_RULES_RELOAD_SIGNAL:
+    from reports.nlp_processor import nlp_processor
+    nlp_processor.rule_store.install_reload_signal(settings.EXTRACTION_RULES_RELOAD_SIGNAL)
@@ -1,5 +1,7 @@
-from django.contrib import admin
-from .models import Report
+from django.contrib import admin, messages
+from .models import Report, ProcessingJob, ReportRollup, AdverseEventRollup
+from .reprocess import reprocess_reports
+from .search import fts_available, matching_ids
 
 
 @admin.register(Report)
@@ -10,21 +12,87 @@ class ReportAdmin(admin.ModelAdmin):
         'id', 'drug', 'severity', 'outcome', 
         'adverse_events_list', 'created_at'
     ]
-    list_filter = ['severity', 'outcome', 'created_at']
-    search_fields = ['drug', 'original_report']
-    readonly_fields = ['created_at']
+    list_filter = ['severity', 'outcome', 'created_at', 'extractor_version']
+    search_fields = ['drug', 'drug_surface', 'original_report']
+    readonly_fields = ['created_at', 'extractor_version']
     ordering = ['-created_at']
+    actions = ['reextract_reports']
     
     fieldsets = (
         ('Report Information', {
             'fields': ('original_report', 'created_at')
         }),
         ('Extracted Data', {
-            'fields': ('drug', 'adverse_events', 'severity', 'outcome')
+            'fields': ('drug', 'drug_surface', 'adverse_events', 'severity', 'outcome', 'extractor_version')
         }),
     )
     
+    def get_search_results(self, request, queryset, search_term):
+        """Search through the full-text index instead of LIKE scans over the report text"""
+        if not search_term.strip() or not fts_available():
+            return super().get_search_results(request, queryset, search_term)
+        try:
+            return queryset.filter(id__in=matching_ids(search_term)), False
+        except ValueError:
+            return queryset.none(), False
+    
+    @admin.action(description='Re-extract selected reports with the current extractor')
+    def reextract_reports(self, request, queryset):
+        """Run extraction again over the selected reports and save the new results"""
+        try:
+            stats = reprocess_reports(queryset, chunk_size=500)
+        except Exception as e:
+            self.message_user(request, f'Error re-extracting reports: {str(e)}', messages.ERROR)
+            return
+        message = f"Re-extracted {stats['processed']} reports; {stats['changed']} had different results."
+        if stats['changed']:
+            # Recounting the sketch scans every report, so it is left to the offline command
+            message += ' Run "manage.py rebuild_sketches" to recount the approximate drug and event counts.'
+        self.message_user(request, message, messages.SUCCESS)
+    
     def adverse_events_list(self, obj):
         """Display adverse events as a comma-separated string"""
         return obj.adverse_events_list
     adverse_events_list.short_description = 'Adverse Events'
+
+
+@admin.register(ProcessingJob)
+class ProcessingJobAdmin(admin.ModelAdmin):
+    """Admin interface for ProcessingJob model"""
+    
+    list_display = ['id', 'status', 'attempts', 'report', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'claim_token']
+    ordering = ['-created_at']
+
+
+@admin.register(ReportRollup)
+class ReportRollupAdmin(admin.ModelAdmin):
+    """Read-only view of the report count rollups"""
+    
+    list_display = ['day', 'drug', 'severity', 'outcome', 'report_count']
+    list_filter = ['severity', 'outcome', 'day']
+    search_fields = ['drug']
+    ordering = ['-day', 'drug']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AdverseEventRollup)
+class AdverseEventRollupAdmin(admin.ModelAdmin):
+    """Read-only view of the adverse event count rollups"""
+    
+    list_display = ['day', 'drug', 'adverse_event', 'severity', 'outcome', 'report_count']
+    list_filter = ['severity', 'outcome', 'day']
+    search_fields = ['drug', 'adverse_event']
+    ordering = ['-day', 'drug', 'adverse_event']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
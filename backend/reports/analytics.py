@@ -0,0 +1,256 @@
+"""
+Database-side aggregation for the analytics endpoints
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db.models import Count, QuerySet, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Report, ReportAdverseEvent, ReportRollup, AdverseEventRollup, TrendRollup
+
+TOP_N = 10
+
+
+def count_by(queryset: QuerySet, field: str, limit: Optional[int] = None) -> Dict[str, int]:
+    """Group ``queryset`` by ``field`` and count rows in SQL"""
+    rows = (
+        queryset.order_by()
+        .values(field)
+        .annotate(count=Count('id'))
+        .order_by('-count', field)
+    )
+    if limit is not None:
+        rows = rows[:limit]
+    return {row[field]: row['count'] for row in rows}
+
+
+def count_adverse_events(queryset: QuerySet, limit: int = TOP_N) -> Dict[str, int]:
+    """Count adverse events across ``queryset`` from the normalised adverse event table"""
+    rows = ReportAdverseEvent.objects.all()
+    if queryset.query.where:
+        rows = rows.filter(report__in=queryset.order_by().values('id'))
+    return count_by(rows, 'event', limit=limit)
+
+
+def compute_analytics(queryset: Optional[QuerySet] = None) -> Dict[str, Any]:
+    """Build the /api/analytics/ payload with grouped queries instead of Python loops"""
+    if queryset is None:
+        queryset = Report.objects.all()
+
+    severity_counts = count_by(queryset, 'severity')
+    return {
+        'total_reports': sum(severity_counts.values()),
+        'severity_distribution': severity_counts,
+        'outcome_distribution': count_by(queryset, 'outcome'),
+        'common_adverse_events': count_adverse_events(queryset),
+        'common_drugs': count_by(queryset, 'drug', limit=TOP_N),
+    }
+
+
+def parse_date_range(params) -> Tuple[Optional[date], Optional[date]]:
+    """Read optional inclusive ``start``/``end`` dates (YYYY-MM-DD) from query parameters"""
+    bounds = []
+    for name in ('start', 'end'):
+        value = params.get(name)
+        if not value:
+            bounds.append(None)
+            continue
+        try:
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValueError(f"Invalid '{name}' date '{value}', expected YYYY-MM-DD")
+        bounds.append(parsed)
+    if bounds[0] and bounds[1] and bounds[0] > bounds[1]:
+        raise ValueError("'start' must not be after 'end'")
+    return bounds[0], bounds[1]
+
+
+ANALYTICS_MODES = ('exact', 'approximate', 'distinct')
+
+
+def check_analytics_mode(mode: str, start: Optional[date], end: Optional[date]) -> None:
+    """Validate the ``mode`` query parameter of /api/analytics/"""
+    if mode not in ANALYTICS_MODES:
+        raise ValueError(f"Invalid mode '{mode}', expected one of: {', '.join(ANALYTICS_MODES)}")
+    if mode == 'approximate' and (start or end):
+        raise ValueError('Date ranges are only supported in exact mode')
+
+
+def filter_days(queryset: QuerySet, start: Optional[date], end: Optional[date]) -> QuerySet:
+    if start:
+        queryset = queryset.filter(day__gte=start)
+    if end:
+        queryset = queryset.filter(day__lte=end)
+    return queryset
+
+
+def _sums_query(queryset: QuerySet, field: str, limit: Optional[int] = None) -> QuerySet:
+    """Group rollup rows by ``field`` and add up their counts, largest first"""
+    rows = (
+        queryset.values(field)
+        .annotate(count=Sum('report_count'))
+        .order_by('-count', field)
+    )
+    return rows[:limit] if limit is not None else rows
+
+
+def _rollup_queries(start: Optional[date], end: Optional[date],
+                    representative_only: bool) -> List[Tuple[str, str, QuerySet]]:
+    """(payload key, field, grouped sums) of each distribution in the /api/analytics/ payload"""
+    reports = filter_days(ReportRollup.objects.all(), start, end)
+    events = filter_days(AdverseEventRollup.objects.all(), start, end)
+    if representative_only:
+        reports = reports.filter(is_representative=True)
+        events = events.filter(is_representative=True)
+    return [
+        ('severity_distribution', 'severity', _sums_query(reports, 'severity')),
+        ('outcome_distribution', 'outcome', _sums_query(reports, 'outcome')),
+        ('common_adverse_events', 'adverse_event', _sums_query(events, 'adverse_event', limit=TOP_N)),
+        ('common_drugs', 'drug', _sums_query(reports, 'drug', limit=TOP_N)),
+    ]
+
+
+def _rollup_payload(distributions: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+    return {'total_reports': sum(distributions['severity_distribution'].values()), **distributions}
+
+
+def rollup_analytics(start: Optional[date] = None, end: Optional[date] = None,
+                     representative_only: bool = False) -> Dict[str, Any]:
+    """Build the /api/analytics/ payload from the rollup tables, optionally for a date range"""
+    return _rollup_payload({
+        key: {row[field]: row['count'] for row in rows}
+        for key, field, rows in _rollup_queries(start, end, representative_only)
+    })
+
+
+async def arollup_analytics(start: Optional[date] = None, end: Optional[date] = None,
+                            representative_only: bool = False) -> Dict[str, Any]:
+    """rollup_analytics() for async views, reading the rollups with the async ORM"""
+    distributions = {}
+    for key, field, rows in _rollup_queries(start, end, representative_only):
+        distributions[key] = {row[field]: row['count'] async for row in rows}
+    return _rollup_payload(distributions)
+
+
+def distinct_analytics(start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, Any]:
+    """Build the /api/analytics/ payload counting each cluster of near-duplicate reports once"""
+    return rollup_analytics(start, end, representative_only=True)
+
+
+async def adistinct_analytics(start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, Any]:
+    """distinct_analytics() for async views"""
+    return await arollup_analytics(start, end, representative_only=True)
+
+
+TREND_INTERVALS = ('hour', 'day', 'week')
+
+# Range used when no start date is given, and the widest range allowed
+TREND_DEFAULT_SPAN = {'hour': timedelta(days=7), 'day': timedelta(days=90), 'week': timedelta(weeks=52)}
+TREND_MAX_SPAN = {'hour': timedelta(days=31), 'day': timedelta(days=731), 'week': timedelta(weeks=520)}
+
+
+def day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def trend_range(interval: str, start: Optional[date], end: Optional[date]) -> Tuple[date, date]:
+    """Resolve the inclusive date range of a trend query, applying defaults and limits"""
+    if interval not in TREND_INTERVALS:
+        raise ValueError(f"Invalid interval '{interval}', expected one of: {', '.join(TREND_INTERVALS)}")
+    end = end or timezone.localdate()
+    start = start or end - TREND_DEFAULT_SPAN[interval] + timedelta(days=1)
+    if end - start >= TREND_MAX_SPAN[interval]:
+        raise ValueError(f"Range too large for '{interval}' buckets; at most {TREND_MAX_SPAN[interval].days} days")
+    return start, end
+
+
+def trend_buckets(interval: str, start: date, end: date) -> List[Any]:
+    """Every bucket between ``start`` and ``end``, so gaps show up as zeros"""
+    if interval == 'hour':
+        first = day_start(start)
+        return [first + timedelta(hours=i) for i in range(((end - start).days + 1) * 24)]
+    if interval == 'week':
+        start = start - timedelta(days=start.weekday())
+        return [start + timedelta(weeks=i) for i in range((end - start).days // 7 + 1)]
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _rollup_trends(interval: str, start: date, end: date, drug: Optional[str]):
+    """Report and adverse event counts per bucket, read from the trend rollups"""
+    rows = TrendRollup.objects.filter(
+        interval=interval,
+        drug=drug or '',
+        bucket__gte=day_start(start - timedelta(days=start.weekday()) if interval == 'week' else start),
+        bucket__lt=day_start(end + timedelta(days=1)),
+    ).values_list('bucket', 'adverse_event', 'report_count')
+
+    report_rows, event_rows = [], []
+    for bucket, event, count in rows:
+        if interval != 'hour':
+            bucket = timezone.localtime(bucket).date()
+        if event:
+            event_rows.append((bucket, event, count))
+        else:
+            report_rows.append((bucket, count))
+    return report_rows, event_rows
+
+
+def _hourly_drug_trends(start: date, end: date, drug: str):
+    """Report and adverse event counts per hour for one drug, grouped in SQL over the reports tables"""
+    reports = Report.objects.order_by().filter(
+        drug=drug,
+        created_at__gte=day_start(start),
+        created_at__lt=day_start(end + timedelta(days=1)),
+    )
+    report_rows = reports.annotate(bucket=TruncHour('created_at')).values_list('bucket').annotate(count=Count('id'))
+    event_rows = (
+        ReportAdverseEvent.objects.order_by().filter(
+            report__drug=drug,
+            report__created_at__gte=day_start(start),
+            report__created_at__lt=day_start(end + timedelta(days=1)),
+        )
+        .annotate(bucket=TruncHour('report__created_at'))
+        .values_list('bucket', 'event')
+        .annotate(count=Count('id'))
+    )
+    return report_rows, event_rows
+
+
+def trend_series(interval: str = 'day', start: Optional[date] = None, end: Optional[date] = None,
+                 drug: Optional[str] = None) -> Dict[str, Any]:
+    """Build the /api/analytics/trends/ payload: report and adverse event counts per bucket"""
+    start, end = trend_range(interval, start, end)
+    # Hourly rollups are kept for all drugs only; per-drug hours come from the reports table
+    if interval == 'hour' and drug:
+        report_rows, event_rows = _hourly_drug_trends(start, end, drug)
+    else:
+        report_rows, event_rows = _rollup_trends(interval, start, end, drug)
+
+    report_counts = dict(report_rows)
+    event_counts = defaultdict(dict)
+    totals = defaultdict(int)
+    for bucket, event, count in event_rows:
+        event_counts[bucket][event] = count
+        totals[event] += count
+
+    return {
+        'interval': interval,
+        'start': start,
+        'end': end,
+        'drug': drug,
+        'adverse_events': sorted(totals, key=lambda event: (-totals[event], event)),
+        'buckets': [
+            {
+                'bucket': bucket,
+                'reports': report_counts.get(bucket, 0),
+                'adverse_events': event_counts.get(bucket, {}),
+            }
+            for bucket in trend_buckets(interval, start, end)
+        ],
+    }
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    """Re-create the search triggers if a migration rebuilt the reports table"""
+    from .search import install_search_index
+    install_search_index(connections[using], create=False)
 
 
 class ReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reports'
+
+    def ready(self):
+        # Keep the analytics rollups in step with report writes
+        from . import signals  # noqa: F401
+        post_migrate.connect(ensure_search_index, sender=self)
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import async_views
+
+# Async replacements for the hot endpoints; everything else falls through to reports.urls
+urlpatterns = [
+    path('process-report/', async_views.process_report, name='process_report'),
+    path('reports/', async_views.get_reports, name='get_reports'),
+    path('reports/<int:report_id>/', async_views.get_report_detail, name='get_report_detail'),
+    path('analytics/', async_views.get_analytics, name='get_analytics'),
+]
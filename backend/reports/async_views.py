@@ -0,0 +1,139 @@
+"""
+Native async versions of the hot API views, served by the ASGI entry point
+
+These use Django's async ORM and hand NLP work to a thread pool (which in
+turn may use the extraction process pool), so a single ASGI worker can keep
+many requests in flight while extraction and database I/O are pending.
+Saving a report and loading the approximate-analytics sketch still run in a
+sync thread: the first needs a transaction and the second merges files.
+"""
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import status
+
+from .models import Report
+from .serializers import ReportSerializer, ProcessReportSerializer
+from .idempotency import IdempotencyError, aclaim_key, acomplete_key, clean_key
+from .processing import process_report_text
+from .sketches import sketch_store
+from .pagination import alist_reports, next_page_url
+from .analytics import adistinct_analytics, arollup_analytics, check_analytics_mode, parse_date_range
+
+
+def async_api_view(methods):
+    """Restrict an async view to the given methods and exempt it from CSRF, like DRF's api_view"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse(
+                    {'detail': f'Method "{request.method}" not allowed.'},
+                    status=status.HTTP_405_METHOD_NOT_ALLOWED
+                )
+            return await view(request, *args, **kwargs)
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def parse_json(request):
+    """Decode a JSON request body, returning None if it is malformed"""
+    try:
+        return json.loads(request.body or b'{}')
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+@async_api_view(['POST'])
+async def process_report(request):
+    """Process adverse event report and extract structured data"""
+    data = parse_json(request)
+    if data is None:
+        return JsonResponse({'detail': 'JSON parse error'}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = ProcessReportSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    report_text = serializer.validated_data['report']
+    try:
+        key = clean_key(request.headers.get('Idempotency-Key'))
+        stored = await aclaim_key(key, report_text) if key else None
+    except IdempotencyError as e:
+        return JsonResponse({'error': str(e)}, status=e.status_code)
+
+    # A retry of a request that already finished gets the same response again
+    if stored is not None:
+        response = JsonResponse(stored[1], status=stored[0])
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    body, status_code, headers = await process_report_text(report_text)
+    if key:
+        await acomplete_key(key, status_code, body)
+    return JsonResponse(body, status=status_code, headers=headers)
+
+
+@async_api_view(['GET'])
+async def get_reports(request):
+    """Get processed reports, newest first, one page at a time"""
+    try:
+        reports, next_cursor, size = await alist_reports(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        serializer = ReportSerializer(reports, many=True)
+        return JsonResponse({
+            'reports': serializer.data,
+            'page_size': size,
+            'next_cursor': next_cursor,
+            'next': next_page_url(request, next_cursor)
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Error fetching reports: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@async_api_view(['GET'])
+async def get_report_detail(request, report_id):
+    """Get a specific report by ID"""
+    try:
+        report = await Report.objects.aget(id=report_id)
+    except Report.DoesNotExist:
+        return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = ReportSerializer(report)
+    return JsonResponse(serializer.data, status=status.HTTP_200_OK)
+
+
+@async_api_view(['GET'])
+async def get_analytics(request):
+    """Get analytics data for reports"""
+    mode = request.GET.get('mode', 'exact')
+    try:
+        start, end = parse_date_range(request.GET)
+        check_analytics_mode(mode, start, end)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        if mode == 'approximate':
+            analytics_data = await sync_to_async(sketch_store.load)()
+            analytics_data = analytics_data.analytics()
+        elif mode == 'distinct':
+            analytics_data = await adistinct_analytics(start, end)
+        else:
+            analytics_data = await arollup_analytics(start, end)
+        return JsonResponse(analytics_data, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'Error generating analytics: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
@@ -0,0 +1,127 @@
+"""
+Content-addressed cache for extraction results
+"""
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def normalise_text(text: str) -> str:
+    """Collapse whitespace so trivially different submissions share a key"""
+    return ' '.join(text.split())
+
+
+def text_digest(text: str) -> str:
+    """SHA-256 of the whitespace-normalised text"""
+    return hashlib.sha256(normalise_text(text).encode('utf-8')).hexdigest()
+
+
+def cache_key(text: str, version: str) -> str:
+    """Key for a report text under a given extractor version"""
+    return f'extraction:{version}:{text_digest(text)}'
+
+
+class ExtractionCache:
+    """Two-tier cache of extraction results keyed by text hash and extractor version.
+
+    The first tier is a bounded in-process LRU. The optional second tier is a
+    Django cache backend alias (for example a file-based or database cache)
+    shared by every worker process. Changing the extractor version changes
+    every key, so stale results are never returned.
+    """
+
+    def __init__(self, max_entries: int = 10000, shared_alias: Optional[str] = None,
+                 shared_timeout: Optional[int] = None):
+        """Create an empty cache"""
+        self.max_entries = max_entries
+        self.shared_alias = shared_alias
+        self.shared_timeout = shared_timeout
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'shared_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'shared_errors': 0,
+        }
+
+    @property
+    def shared(self):
+        """The shared Django cache backend, or None if not configured"""
+        if not self.shared_alias:
+            return None
+        from django.core.cache import caches
+        return caches[self.shared_alias]
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _store_local(self, key: str, value: Dict[str, Any]) -> None:
+        """Insert into the LRU tier, evicting the least recently used entries"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def get(self, text: str, version: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached result for ``text``, or None"""
+        key = cache_key(text, version)
+
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return copy.deepcopy(value)
+
+        if self.shared_alias:
+            try:
+                value = self.shared.get(key)
+            except Exception:
+                self._count('shared_errors')
+                value = None
+            if value is not None:
+                self._count('shared_hits')
+                self._store_local(key, value)
+                return copy.deepcopy(value)
+
+        self._count('misses')
+        return None
+
+    def set(self, text: str, version: str, value: Dict[str, Any]) -> None:
+        """Store a result in both tiers"""
+        key = cache_key(text, version)
+        value = copy.deepcopy(value)
+        self._store_local(key, value)
+
+        if self.shared_alias:
+            try:
+                self.shared.set(key, value, self.shared_timeout)
+            except Exception:
+                self._count('shared_errors')
+
+    def clear(self) -> None:
+        """Drop every entry from the in-process tier"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and the current size"""
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['shared_hits'] + self._counters['misses']
+            hits = self._counters['hits'] + self._counters['shared_hits']
+            return {
+                **self._counters,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'shared_backend': self.shared_alias,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,279 @@
+"""
+Disproportionality signal detection (PRR, ROR, chi-square) over stored reports
+
+Counts are kept as a drug x adverse-event NumPy matrix plus per-drug and
+total report counts. The matrix is built from the rollup tables once, then
+brought up to date by adding only reports with a higher id than the last
+one seen. Deletes and edits bump a generation counter in the database, so
+every worker process rebuilds on its next request; a periodic full rebuild
+covers everything else.
+Every statistic is computed for all pairs at once with array arithmetic.
+"""
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Max, Sum
+
+from .models import AnalyticsGeneration, Report, ReportAdverseEvent, ReportRollup, AdverseEventRollup
+from .nlp_processor import get_setting
+
+# Two-sided 95% normal quantile
+Z_95 = 1.959963984540054
+
+SIGNAL_ORDERINGS = ('prr', 'ror', 'chi2', 'count')
+
+GENERATION_NAME = 'signals'
+
+
+def current_generation(name: str = GENERATION_NAME) -> int:
+    """A shared generation counter; the signal counts one changes after any delete or edit in any process"""
+    generation = AnalyticsGeneration.objects.filter(name=name).values_list('generation', flat=True)
+    return generation.first() or 0
+
+
+def bump_generation(name: str = GENERATION_NAME) -> None:
+    """Advance a shared generation counter, e.g. so every process rebuilds its signal counts on next use"""
+    AnalyticsGeneration.objects.bulk_create([AnalyticsGeneration(name=name)], ignore_conflicts=True)
+    AnalyticsGeneration.objects.filter(name=name).update(generation=F('generation') + 1)
+
+
+class ContingencyCounts:
+    """Drug x adverse-event report counts with growable categorical codes"""
+
+    def __init__(self):
+        self.drugs: List[str] = []
+        self.events: List[str] = []
+        self.drug_codes: Dict[str, int] = {}
+        self.event_codes: Dict[str, int] = {}
+        self.pairs = np.zeros((0, 0), dtype=np.int64)
+        self.drug_totals = np.zeros(0, dtype=np.int64)
+        self.total = 0
+
+    def _codes(self, names: Iterable[str], codes: Dict[str, int], vocabulary: List[str]) -> np.ndarray:
+        """Map names to integer codes, assigning new codes to unseen names"""
+        result = []
+        for name in names:
+            code = codes.get(name)
+            if code is None:
+                code = codes[name] = len(vocabulary)
+                vocabulary.append(name)
+            result.append(code)
+        return np.asarray(result, dtype=np.int64)
+
+    def _grow(self) -> None:
+        """Resize the arrays after new drugs or events were coded"""
+        n_drugs, n_events = len(self.drugs), len(self.events)
+        if self.pairs.shape != (n_drugs, n_events):
+            pairs = np.zeros((n_drugs, n_events), dtype=np.int64)
+            pairs[:self.pairs.shape[0], :self.pairs.shape[1]] = self.pairs
+            self.pairs = pairs
+        if self.drug_totals.shape[0] != n_drugs:
+            self.drug_totals = np.concatenate(
+                [self.drug_totals, np.zeros(n_drugs - self.drug_totals.shape[0], dtype=np.int64)]
+            )
+
+    def add_totals(self, drugs: Iterable[str], counts: Iterable[int]) -> None:
+        """Add report counts per drug"""
+        counts = np.asarray(list(counts), dtype=np.int64)
+        codes = self._codes(drugs, self.drug_codes, self.drugs)
+        self._grow()
+        np.add.at(self.drug_totals, codes, counts)
+        self.total += int(counts.sum())
+
+    def add_pairs(self, drugs: Iterable[str], events: Iterable[str], counts: Iterable[int]) -> None:
+        """Add report counts per (drug, adverse event) pair"""
+        counts = np.asarray(list(counts), dtype=np.int64)
+        drug_codes = self._codes(drugs, self.drug_codes, self.drugs)
+        event_codes = self._codes(events, self.event_codes, self.events)
+        self._grow()
+        np.add.at(self.pairs, (drug_codes, event_codes), counts)
+
+    def add_reports(self, rows: Iterable[Tuple[str, List[str]]]) -> None:
+        """Add (drug, adverse_events) rows of individual reports"""
+        drugs, pair_drugs, pair_events = [], [], []
+        for drug, adverse_events in rows:
+            drugs.append(drug)
+            for event in set(adverse_events or []):
+                pair_drugs.append(drug)
+                pair_events.append(event)
+        if drugs:
+            self.add_totals(drugs, [1] * len(drugs))
+        if pair_drugs:
+            self.add_pairs(pair_drugs, pair_events, [1] * len(pair_drugs))
+
+
+def disproportionality(pairs: np.ndarray, drug_totals: np.ndarray, total: int) -> Dict[str, np.ndarray]:
+    """PRR, ROR and Yates chi-square with 95% confidence intervals for every drug/event pair.
+
+    For each pair the 2x2 table is a = reports with the drug and the event,
+    b = the drug without the event, c = the event with other drugs and
+    d = neither. Tables with an empty cell get the Haldane-Anscombe +0.5
+    correction so the ratios and their intervals stay finite.
+    """
+    a = pairs.astype(np.float64)
+    b = drug_totals[:, None] - a
+    event_totals = pairs.sum(axis=0)
+    c = event_totals[None, :] - a
+    d = total - a - b - c
+
+    # Chi-square uses the raw counts
+    n = float(total)
+    numerator = n * np.maximum(np.abs(a * d - b * c) - n / 2, 0) ** 2
+    denominator = (a + b) * (c + d) * (a + c) * (b + d)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        chi2 = np.where(denominator > 0, numerator / denominator, 0.0)
+
+    corrected = (a == 0) | (b == 0) | (c == 0) | (d == 0)
+    a, b, c, d = (np.where(corrected, cell + 0.5, cell) for cell in (a, b, c, d))
+
+    prr = (a / (a + b)) / (c / (c + d))
+    prr_se = np.sqrt(1 / a - 1 / (a + b) + 1 / c - 1 / (c + d))
+    ror = (a * d) / (b * c)
+    ror_se = np.sqrt(1 / a + 1 / b + 1 / c + 1 / d)
+
+    return {
+        'prr': prr,
+        'prr_lower': np.exp(np.log(prr) - Z_95 * prr_se),
+        'prr_upper': np.exp(np.log(prr) + Z_95 * prr_se),
+        'ror': ror,
+        'ror_lower': np.exp(np.log(ror) - Z_95 * ror_se),
+        'ror_upper': np.exp(np.log(ror) + Z_95 * ror_se),
+        'chi2': chi2,
+    }
+
+
+class SignalEngine:
+    """Cached contingency counts with incremental refresh and vectorised signal scoring"""
+
+    def __init__(self, rebuild_interval: Optional[float] = None):
+        """Create an empty engine; counts are loaded on first use"""
+        self._rebuild_interval = rebuild_interval
+        self._counts: Optional[ContingencyCounts] = None
+        self._last_id = 0
+        self._generation = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rebuild_interval(self) -> float:
+        if self._rebuild_interval is not None:
+            return self._rebuild_interval
+        return get_setting('SIGNAL_REBUILD_INTERVAL', 300.0)
+
+    def invalidate(self) -> None:
+        """Force a full rebuild on next use in every process, e.g. after reports were edited or deleted"""
+        bump_generation()
+        with self._lock:
+            self._counts = None
+
+    def _rebuild(self) -> None:
+        """Load the counts from the rollup tables.
+
+        Under concurrent writes a report can briefly be counted twice or not
+        at all; the periodic rebuild puts that right.
+        """
+        counts = ContingencyCounts()
+        with transaction.atomic():
+            generation = current_generation()
+            last_id = Report.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+            totals = list(ReportRollup.objects.values_list('drug').annotate(count=Sum('report_count')))
+            pairs = list(
+                AdverseEventRollup.objects.values_list('drug', 'adverse_event').annotate(count=Sum('report_count'))
+            )
+        if totals:
+            counts.add_totals(*zip(*totals))
+        if pairs:
+            counts.add_pairs(*zip(*pairs))
+        self._counts = counts
+        self._last_id = last_id
+        self._generation = generation
+        self._built_at = time.monotonic()
+
+    def _add_new_reports(self) -> None:
+        """Add reports saved since the counts were last refreshed"""
+        with transaction.atomic():
+            totals = list(Report.objects.filter(id__gt=self._last_id).order_by('id').values_list('id', 'drug'))
+            if not totals:
+                return
+            last_id = totals[-1][0]
+            pairs = list(
+                ReportAdverseEvent.objects.filter(report_id__gt=self._last_id, report_id__lte=last_id)
+                .values_list('report__drug', 'event')
+            )
+        self._counts.add_totals([drug for _, drug in totals], [1] * len(totals))
+        if pairs:
+            self._counts.add_pairs(*zip(*pairs), [1] * len(pairs))
+        self._last_id = last_id
+
+    def refresh(self) -> ContingencyCounts:
+        """Bring the cached counts up to date and return them"""
+        generation = current_generation()
+        with self._lock:
+            if (self._counts is None or generation != self._generation
+                    or time.monotonic() - self._built_at > self.rebuild_interval):
+                self._rebuild()
+            else:
+                self._add_new_reports()
+            return self._counts
+
+    def signals(self, min_count: int = 3, min_prr: float = 0.0, min_ror: float = 0.0, min_chi2: float = 0.0,
+                drug: Optional[str] = None, adverse_event: Optional[str] = None,
+                order_by: str = 'prr', limit: int = 100) -> Dict[str, Any]:
+        """Score every drug/event pair and return those passing the thresholds"""
+        if order_by not in SIGNAL_ORDERINGS:
+            raise ValueError(f"Invalid order_by '{order_by}', expected one of: {', '.join(SIGNAL_ORDERINGS)}")
+        if limit < 1:
+            raise ValueError('limit must be at least 1')
+
+        counts = self.refresh()
+        with self._lock:
+            pairs = counts.pairs.copy()
+            drug_totals = counts.drug_totals.copy()
+            total = counts.total
+            drugs = list(counts.drugs)
+            events = list(counts.events)
+
+        result = {'total_reports': total, 'pairs_tested': 0, 'signals': []}
+        if not pairs.size or not total:
+            return result
+
+        stats = disproportionality(pairs, drug_totals, total)
+        mask = (
+            (pairs >= min_count)
+            & (stats['prr'] >= min_prr)
+            & (stats['ror'] >= min_ror)
+            & (stats['chi2'] >= min_chi2)
+        )
+        if drug is not None:
+            mask &= (np.arange(len(drugs)) == counts.drug_codes.get(drug, -1))[:, None]
+        if adverse_event is not None:
+            mask &= (np.arange(len(events)) == counts.event_codes.get(adverse_event, -1))[None, :]
+        result['pairs_tested'] = int((pairs > 0).sum())
+
+        drug_index, event_index = np.nonzero(mask)
+        key = pairs if order_by == 'count' else stats[order_by]
+        order = np.argsort(-key[drug_index, event_index], kind='stable')[:limit]
+        drug_index, event_index = drug_index[order], event_index[order]
+
+        event_totals = pairs.sum(axis=0)
+        for i, j in zip(drug_index.tolist(), event_index.tolist()):
+            result['signals'].append({
+                'drug': drugs[i],
+                'adverse_event': events[j],
+                'count': int(pairs[i, j]),
+                'drug_reports': int(drug_totals[i]),
+                'event_reports': int(event_totals[j]),
+                'prr': round(float(stats['prr'][i, j]), 4),
+                'prr_ci': [round(float(stats['prr_lower'][i, j]), 4), round(float(stats['prr_upper'][i, j]), 4)],
+                'ror': round(float(stats['ror'][i, j]), 4),
+                'ror_ci': [round(float(stats['ror_lower'][i, j]), 4), round(float(stats['ror_upper'][i, j]), 4)],
+                'chi2': round(float(stats['chi2'][i, j]), 4),
+            })
+        return result
+
+
+# Global instance
+signal_engine = SignalEngine()
@@ -0,0 +1,112 @@
+"""
+Linear-time drug name extraction from report text
+"""
+import re
+from typing import Iterable, List, NamedTuple, Optional
+
+
+# Words, and numbers with an optional attached unit ("500mg")
+TOKEN_PATTERN = re.compile(r"[A-Za-z][A-Za-z'\-]*|\d+(?:\.\d+)?[A-Za-z]*")
+CAPITALISED_PATTERN = re.compile(r"[A-Z][a-z]+")
+STRENGTH_PATTERN = re.compile(r"(\d+(?:\.\d+)?)([A-Za-z]*)")
+
+# Candidate kinds, in the order they are preferred
+DOSAGE_FORM = 0
+PLACEHOLDER = 1
+KNOWN_NAME = 2
+
+
+class DrugCandidate(NamedTuple):
+    """A drug mention found in the text"""
+    start: int
+    end: int
+    text: str
+    kind: int
+
+
+class DrugExtractor:
+    """Find drug mentions with a single tokenising pass over the text.
+
+    Recognises, in order of preference:
+
+    * capitalised words followed by a dosage form or unit
+      (``Penicillin injection``, ``Aspirin 500mg``),
+    * placeholder names (``Drug X``, ``Compound Y``),
+    * known drug names, case-insensitively.
+
+    Every token is visited once and only the last ``max_name_words``
+    capitalised words are kept as a possible name, so run time grows
+    linearly with the length of the report.
+    """
+
+    def __init__(self, known_drugs: Iterable[str], dosage_forms: Iterable[str],
+                 placeholder_letters: str = 'XYZ', max_name_words: int = 4):
+        """Prepare the lookup tables used while scanning"""
+        self.known_drugs = {drug.lower() for drug in known_drugs}
+        self.dosage_forms = {form.lower() for form in dosage_forms}
+        self.placeholder_letters = set(placeholder_letters)
+        self.max_name_words = max_name_words
+
+    def find_all(self, text: str) -> List[DrugCandidate]:
+        """Return every drug candidate in text order"""
+        candidates = []
+        name_run = []  # trailing capitalised tokens as (start, end, text)
+        strength_seen = False
+
+        def emit_run(end: int, kind: int, from_last: bool = False) -> None:
+            start = name_run[-1][0] if from_last else name_run[0][0]
+            candidates.append(DrugCandidate(start, end, text[start:end], kind))
+
+        for match in TOKEN_PATTERN.finditer(text):
+            token = match.group()
+            lower = token.lower()
+
+            if lower in self.known_drugs:
+                candidates.append(DrugCandidate(match.start(), match.end(), token, KNOWN_NAME))
+
+            if name_run and not strength_seen:
+                # "Drug X", "Compound Y"
+                if len(token) == 1 and token.isupper():
+                    if name_run[-1][2].lower() == 'drug':
+                        emit_run(match.end(), PLACEHOLDER, from_last=True)
+                        name_run = []
+                        continue
+                    if token in self.placeholder_letters:
+                        emit_run(match.end(), PLACEHOLDER)
+                        name_run = []
+                        continue
+
+                # "Penicillin injection", "Aspirin 500 mg", "Aspirin 500mg"
+                strength = STRENGTH_PATTERN.fullmatch(token)
+                if lower in self.dosage_forms or (strength and strength.group(2).lower() in self.dosage_forms):
+                    emit_run(name_run[-1][1], DOSAGE_FORM)
+                    name_run = []
+                    continue
+                if strength and not strength.group(2):
+                    strength_seen = True
+                    continue
+            elif name_run and lower in self.dosage_forms:
+                emit_run(name_run[-1][1], DOSAGE_FORM)
+                name_run = []
+                strength_seen = False
+                continue
+
+            if strength_seen:
+                name_run = []
+                strength_seen = False
+            if CAPITALISED_PATTERN.fullmatch(token) or lower == 'drug':
+                name_run.append((match.start(), match.end(), token))
+                if len(name_run) > self.max_name_words:
+                    name_run.pop(0)
+            else:
+                name_run = []
+
+        return candidates
+
+    def extract(self, text: str) -> Optional[str]:
+        """Return the preferred drug mention, or None if there is none"""
+        best = None
+        for candidate in self.find_all(text):
+            if best is None or candidate.kind < best.kind:
+                best = candidate
+        return best.text if best else None
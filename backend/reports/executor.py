@@ -0,0 +1,241 @@
+"""
+Extraction executor that can offload CPU-bound NLP work to a process pool
+
+Under sync or threaded WSGI workers, spaCy parsing holds the GIL, so
+threads of one worker cannot extract in parallel. In ``process`` mode every
+extraction runs in a pool of processes that each load the model once,
+letting a few light web workers use every core.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from .nlp_processor import get_setting, nlp_processor
+
+
+class ExtractionTimeout(Exception):
+    """Raised when a pool process does not finish extraction in time"""
+
+
+def _init_worker() -> None:
+    """Set up Django and warm-load the model once per pool process"""
+    if os.environ.get('DJANGO_SETTINGS_MODULE'):
+        import django
+        django.setup()
+    from reports.nlp_processor import nlp_processor as worker_processor
+    worker_processor.warm_up()
+
+
+def _process_report(report_text: str) -> Dict[str, Any]:
+    from reports.nlp_processor import nlp_processor as worker_processor
+    return worker_processor.process_report(report_text)
+
+
+def _process_reports(report_texts: List[str]) -> List[Dict[str, Any]]:
+    from reports.nlp_processor import nlp_processor as worker_processor
+    return worker_processor.process_reports(report_texts)
+
+
+class ExtractionExecutor:
+    """Run extraction inline or in a process pool, with timeouts and recovery"""
+
+    def __init__(self, mode: Optional[str] = None, workers: Optional[int] = None,
+                 timeout: Optional[float] = None, retries: Optional[int] = None,
+                 start_method: Optional[str] = None):
+        """Configure the executor; the pool itself is started on first use"""
+        self._mode = mode
+        self._workers = workers
+        self._timeout = timeout
+        self._retries = retries
+        self._start_method = start_method
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_warm = False
+        # Futures not yet finished, per pool, so a retired pool can drain before it is killed
+        self._inflight: Dict[ProcessPoolExecutor, Set[Future]] = {}
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    @property
+    def mode(self) -> str:
+        return self._mode or get_setting('NLP_EXECUTOR', 'inline')
+
+    @property
+    def workers(self) -> int:
+        return self._workers or get_setting('NLP_EXECUTOR_WORKERS', None) or os.cpu_count() or 1
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout or get_setting('NLP_EXECUTOR_TIMEOUT', 30.0)
+
+    @property
+    def retries(self) -> int:
+        return self._retries if self._retries is not None else get_setting('NLP_EXECUTOR_RETRIES', 1)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(
+                    self._start_method or get_setting('NLP_EXECUTOR_START_METHOD', 'spawn')
+                )
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context, initializer=_init_worker
+                )
+            return self._pool
+
+    def _submit(self, pool: ProcessPoolExecutor, func, arguments: List[Any]) -> List[Future]:
+        futures = [pool.submit(func, argument) for argument in arguments]
+        with self._lock:
+            inflight = self._inflight.setdefault(pool, set())
+            inflight.update(futures)
+        for future in futures:
+            future.add_done_callback(inflight.discard)
+        return futures
+
+    def _detach_pool(self, pool: ProcessPoolExecutor) -> bool:
+        """Stop handing out ``pool``; False if another thread already replaced it"""
+        with self._lock:
+            if self._pool is not pool:
+                return False
+            self._pool = None
+            self._pool_warm = False
+            self.restarts += 1
+            return True
+
+    def _kill_pool(self, pool: ProcessPoolExecutor) -> None:
+        # A stuck process never finishes on its own; ProcessPoolExecutor has no
+        # public way to kill running tasks, so terminate its processes directly.
+        for process in list((getattr(pool, '_processes', None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            self._inflight.pop(pool, None)
+
+    def _restart_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Replace a broken pool; its tasks have all failed already, so kill it right away"""
+        if self._detach_pool(pool):
+            self._kill_pool(pool)
+
+    def _retire_pool(self, pool: ProcessPoolExecutor, stuck: Sequence[Future]) -> None:
+        """Replace a pool with a stuck process without failing other threads' work on it.
+
+        New work goes to a fresh pool at once. The old pool finishes the
+        tasks other requests already submitted (for up to one more timeout)
+        and is killed after that, together with the stuck process.
+        """
+        if not self._detach_pool(pool):
+            return
+
+        def drain():
+            pool.shutdown(wait=False)
+            with self._lock:
+                others = self._inflight.get(pool, set()).difference(stuck)
+            wait(others, timeout=self.timeout)
+            self._kill_pool(pool)
+
+        threading.Thread(target=drain, name='extraction-pool-drain', daemon=True).start()
+
+    def _run(self, func, arguments: List[Any]) -> List[Any]:
+        """Run ``func`` over every argument in the pool, retrying after crashes or timeouts.
+
+        All arguments are submitted at once so the pool processes work in
+        parallel. The batch has one deadline: the timeout for each round of
+        ``workers`` tasks it needs. Only the arguments that did not finish
+        are retried.
+        """
+        results: List[Any] = [None] * len(arguments)
+        pending = list(range(len(arguments)))
+        for attempt in range(self.retries + 1):
+            pool = self._get_pool()
+            futures = self._submit(pool, func, [arguments[index] for index in pending])
+            deadline = self.timeout * -(-len(futures) // self.workers)
+            done, _ = wait(futures, timeout=deadline)
+
+            unfinished, broken = [], None
+            for index, future in zip(pending, futures):
+                if future not in done:
+                    future.cancel()
+                    unfinished.append((index, future))
+                    continue
+                try:
+                    results[index] = future.result()
+                except BrokenProcessPool as e:
+                    broken = e
+                    unfinished.append((index, future))
+            if not unfinished:
+                self._pool_warm = True
+                return results
+
+            if broken is not None:
+                self._restart_pool(pool)
+                if attempt == self.retries:
+                    raise broken
+            else:
+                self._retire_pool(pool, [future for _, future in unfinished])
+                if attempt == self.retries:
+                    raise ExtractionTimeout(f'Extraction did not finish within {deadline:.0f}s')
+            pending = [index for index, _ in unfinished]
+
+    def process_report(self, report_text: str) -> Dict[str, Any]:
+        """Extract one report, answering from the cache without a round trip when possible"""
+        if self.mode != 'process':
+            return nlp_processor.process_report(report_text)
+
+        version = nlp_processor.version
+        cached = nlp_processor.cache.get(report_text, version)
+        if cached is not None:
+            return cached
+        result = self._run(_process_report, [report_text])[0]
+        nlp_processor.cache.set(report_text, version, result)
+        return result
+
+    def process_reports(self, report_texts: Sequence[str]) -> List[Dict[str, Any]]:
+        """Extract many reports, spreading batches over the pool processes"""
+        report_texts = list(report_texts)
+        if self.mode != 'process' or not report_texts:
+            return nlp_processor.process_reports(report_texts)
+
+        batch_size = get_setting('NLP_BATCH_SIZE', 64)
+        chunks = [report_texts[i:i + batch_size] for i in range(0, len(report_texts), batch_size)]
+        return [result for chunk in self._run(_process_reports, chunks) for result in chunk]
+
+    def warm_up(self, background: bool = False) -> None:
+        """Start the pool processes (or load the model inline) ahead of traffic"""
+        if background:
+            threading.Thread(target=self.warm_up, name='extraction-warm-up', daemon=True).start()
+            return
+        if self.mode != 'process':
+            nlp_processor.warm_up()
+            return
+        self._run(_process_report, [''] * self.workers)
+
+    def shutdown(self) -> None:
+        """Stop the pool processes"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._pool_warm = False
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+            with self._lock:
+                self._inflight.pop(pool, None)
+
+    def status(self) -> Dict[str, Any]:
+        """Describe the executor configuration and health"""
+        if self.mode == 'process':
+            ready = self._pool_warm
+        else:
+            ready = nlp_processor.status()['ready']
+        return {
+            'ready': ready,
+            'mode': self.mode,
+            'workers': self.workers if self.mode == 'process' else 0,
+            'pool_started': self._pool is not None,
+            'restarts': self.restarts,
+            'timeout': self.timeout,
+        }
+
+
+# Global instance
+extraction_executor = ExtractionExecutor()
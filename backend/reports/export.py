@@ -0,0 +1,90 @@
+"""
+Streaming export of reports as NDJSON or CSV, optionally gzip-compressed
+
+Rows are read with QuerySet.iterator() and encoded one database chunk at a
+time, so memory use does not grow with the size of the export and the
+first bytes are sent as soon as the first chunk is read.
+"""
+import csv
+import io
+import json
+import zlib
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator
+
+from django.db.models import QuerySet
+from rest_framework import serializers
+
+from .nlp_processor import get_setting
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+EXPORT_FIELDS = (
+    'id', 'original_report', 'drug', 'drug_surface', 'adverse_events', 'severity', 'outcome', 'created_at'
+)
+
+# Same timestamp format as the JSON API
+_datetime_field = serializers.DateTimeField()
+
+
+def check_export_format(export_format: str) -> None:
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid format '{export_format}', expected one of: {', '.join(EXPORT_FORMATS)}")
+
+
+def export_rows(queryset: QuerySet, chunk_size: int) -> Iterator[Dict[str, Any]]:
+    """Report rows as plain dicts in id order, fetched ``chunk_size`` at a time"""
+    for row in queryset.order_by('id').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        row['created_at'] = _datetime_field.to_representation(row['created_at'])
+        yield row
+
+
+def _chunks(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[list]:
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ndjson_lines(rows: Iterable[Dict[str, Any]], chunk_size: int) -> Iterator[bytes]:
+    """One JSON object per line"""
+    for chunk in _chunks(rows, chunk_size):
+        yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in chunk).encode('utf-8')
+
+
+def csv_lines(rows: Iterable[Dict[str, Any]], chunk_size: int) -> Iterator[bytes]:
+    """CSV with a header row; adverse events are joined with '; '"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue().encode('utf-8')
+    for chunk in _chunks(rows, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in chunk:
+            row['adverse_events'] = '; '.join(row['adverse_events'] or [])
+            writer.writerow([row[field] for field in EXPORT_FIELDS])
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip ``chunks`` incrementally, flushing after each one so the client is never kept waiting"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def export_stream(queryset: QuerySet, export_format: str, compress: bool = False) -> Iterator[bytes]:
+    """Encoded export of ``queryset`` as a stream of byte chunks"""
+    check_export_format(export_format)
+    chunk_size = get_setting('EXPORT_CHUNK_SIZE', 2000)
+    rows = export_rows(queryset, chunk_size)
+    encode = ndjson_lines if export_format == 'ndjson' else csv_lines
+    stream = encode(rows, chunk_size)
+    return gzip_stream(stream) if compress else stream
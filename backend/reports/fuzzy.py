@@ -0,0 +1,232 @@
+"""
+Fuzzy drug name normalisation with a SymSpell-style deletes index
+
+For every known name, all variants of its first ``prefix_length`` characters
+with up to ``max_distance`` characters deleted are hashed and stored in a
+sorted array. A query generates the same deletes for itself, so candidate
+names are found with a handful of binary searches instead of a comparison
+against every name; only those candidates are checked with a real edit
+distance. The index is written to disk and memory-mapped like the gazetteer.
+"""
+import os
+import struct
+import tempfile
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Set
+
+import numpy as np
+
+from .gazetteer import ensure_index, normalise_name, read_source
+
+MAGIC = b'DFZ1'
+# magic, max distance, prefix length, term count, entry count, names blob size
+HEADER = struct.Struct('=4sIIIII')
+HASH_SEED = 0x9E3779B9
+
+
+class FuzzyMatch(NamedTuple):
+    """Closest known name for a query"""
+    name: str
+    canonical_id: int
+    distance: int
+
+
+def _hash(variant: str) -> int:
+    """Stable 64-bit hash of a delete variant (two seeded CRC-32s)"""
+    data = variant.encode('utf-8')
+    return zlib.crc32(data) << 32 | zlib.crc32(data, HASH_SEED)
+
+
+def deletes(word: str, max_distance: int) -> Set[str]:
+    """Return ``word`` and every variant with up to ``max_distance`` deletions"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {
+            variant[:i] + variant[i + 1:]
+            for variant in frontier if len(variant) > 1
+            for i in range(len(variant))
+        }
+        variants |= frontier
+    return variants
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """Linear-time check for one substitution, insertion, deletion or transposition"""
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > 1:
+        return False
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        if a[i + 1:] == b[i + 1:]:
+            return True
+        transposed = i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i]
+        return transposed and a[i + 2:] == b[i + 2:]
+    return a[i:] == b[i + 1:]
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance, or ``limit + 1`` once it is exceeded.
+
+    Only the diagonal band of width ``2 * limit + 1`` is computed.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if a == b:
+        return 0
+
+    over = limit + 1
+    previous_previous = None
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        row_min = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return over
+        previous_previous, previous = previous, current
+    return min(previous[-1], over)
+
+
+def compile_fuzzy_index(source_path, index_path, max_distance: int = 2,
+                        prefix_length: int = 7) -> Dict[str, float]:
+    """Compile the deletes index for every name in a gazetteer source file"""
+    started = time.perf_counter()
+    _, entries = read_source(source_path)
+    terms = sorted(entries)
+
+    hashes = []
+    term_ids = []
+    for term_id, term in enumerate(terms):
+        for variant in deletes(term[:prefix_length], max_distance):
+            hashes.append(_hash(variant))
+            term_ids.append(term_id)
+
+    hashes = np.array(hashes, dtype=np.uint64)
+    term_ids = np.array(term_ids, dtype=np.uint32)
+    order = np.argsort(hashes, kind='stable')
+    hashes = hashes[order]
+    term_ids = term_ids[order]
+
+    blob = bytearray()
+    offsets = np.zeros(len(terms) + 1, dtype=np.uint32)
+    for term_id, term in enumerate(terms):
+        blob += term.encode('utf-8')
+        offsets[term_id + 1] = len(blob)
+    canonical_ids = np.array([entries[term] for term in terms], dtype=np.uint32)
+
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=index_path.parent, prefix=index_path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as index:
+            index.write(HEADER.pack(MAGIC, max_distance, prefix_length, len(terms), len(hashes), len(blob)))
+            for section in (hashes, term_ids, offsets, canonical_ids):
+                index.write(section.tobytes())
+            index.write(bytes(blob))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return {
+        'names': len(terms),
+        'entries': len(hashes),
+        'bytes': index_path.stat().st_size,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+class FuzzyIndex:
+    """Read-only, memory-mapped view over a compiled deletes index"""
+
+    def __init__(self, index_path):
+        """Memory-map the index sections"""
+        self.index_path = Path(index_path)
+        raw = np.memmap(self.index_path, dtype=np.uint8, mode='r').view(np.ndarray)
+        magic, max_distance, prefix_length, term_count, entry_count, blob_size = HEADER.unpack_from(raw)
+        if magic != MAGIC:
+            raise ValueError(f'{self.index_path} is not a fuzzy drug index')
+
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        offset = HEADER.size
+
+        def section(dtype, length):
+            nonlocal offset
+            data = raw[offset:offset + length * np.dtype(dtype).itemsize].view(dtype)
+            offset += length * np.dtype(dtype).itemsize
+            return data
+
+        self._hashes = section(np.uint64, entry_count)
+        self._term_ids = section(np.uint32, entry_count)
+        self._offsets = section(np.uint32, term_count + 1)
+        self._canonical_ids = section(np.uint32, term_count)
+        self._blob = raw[offset:offset + blob_size]
+        self._terms: Dict[int, str] = {}
+
+    def _term(self, term_id: int) -> str:
+        """Decode a stored name, caching it for later queries"""
+        term = self._terms.get(term_id)
+        if term is None:
+            term = self._blob[self._offsets[term_id]:self._offsets[term_id + 1]].tobytes().decode('utf-8')
+            self._terms[term_id] = term
+        return term
+
+    def lookup(self, word: str, max_distance: Optional[int] = None) -> Optional[FuzzyMatch]:
+        """Return the closest known name within ``max_distance`` edits"""
+        word = normalise_name(word)
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        if not word:
+            return None
+
+        queries = np.array([_hash(variant) for variant in deletes(word[:self.prefix_length], limit)],
+                           dtype=np.uint64)
+        starts = np.searchsorted(self._hashes, queries, side='left')
+        ends = np.searchsorted(self._hashes, queries, side='right')
+
+        candidates = set()
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            candidates.update(self._term_ids[start:end].tolist())
+
+        # Cheap pass for exact and single-edit matches before the banded DP
+        best = None
+        candidates = sorted(candidates)
+        for term_id in candidates:
+            term = self._term(term_id)
+            if term == word:
+                return FuzzyMatch(term, int(self._canonical_ids[term_id]), 0)
+            if best is None and within_one_edit(word, term):
+                best = FuzzyMatch(term, int(self._canonical_ids[term_id]), 1)
+        if best is not None or limit < 2:
+            return best
+
+        for term_id in candidates:
+            term = self._term(term_id)
+            distance = edit_distance(word, term, limit)
+            if distance <= limit and (best is None or distance < best.distance):
+                best = FuzzyMatch(term, int(self._canonical_ids[term_id]), distance)
+        return best
+
+
+def load_fuzzy_index(source_path, index_path=None) -> FuzzyIndex:
+    """Load the fuzzy index, compiling it first if it is missing or stale"""
+    source_path = Path(source_path)
+    index_path = index_path or source_path.with_suffix('.fuzzy.idx')
+    return FuzzyIndex(ensure_index(source_path, index_path, compile_fuzzy_index))
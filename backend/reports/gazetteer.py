@@ -0,0 +1,256 @@
+"""
+Drug name gazetteer backed by a compact, memory-mapped trie index
+
+The source gazetteer is a UTF-8 text file with one drug per line::
+
+    # canonical<TAB>synonym<TAB>synonym...
+    Acetaminophen	paracetamol	Tylenol	APAP
+
+It is compiled once into a binary index of flat uint32 arrays which is
+memory-mapped read-only, so loading takes milliseconds and all worker
+processes share the same pages through the OS page cache.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import time
+from array import array
+from bisect import bisect_left
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+MAGIC = b'DGZ1'
+# magic, node count, edge count, canonical count, canonical blob size
+HEADER = struct.Struct('=4sIIII')
+SPACE = ord(' ')
+
+
+class GazetteerMatch(NamedTuple):
+    """A gazetteer entry found in a text"""
+    start: int
+    end: int
+    surface: str
+    canonical: str
+
+
+def normalise_name(name: str) -> str:
+    """Lowercase a drug name and collapse internal whitespace"""
+    return ' '.join(name.lower().split())
+
+
+def read_source(source_path) -> Tuple[List[str], Dict[str, int]]:
+    """Read canonical names and a normalised name -> canonical id map"""
+    canonicals: List[str] = []
+    entries: Dict[str, int] = {}
+
+    with open(source_path, encoding='utf-8') as source:
+        for line in source:
+            line = line.rstrip('\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            names = [name.strip() for name in line.split('\t') if name.strip()]
+            canonical_id = len(canonicals)
+            canonicals.append(names[0])
+            for name in names:
+                entries.setdefault(normalise_name(name), canonical_id)
+
+    return canonicals, entries
+
+
+def compile_gazetteer(source_path, index_path) -> Dict[str, float]:
+    """Compile a gazetteer source file into a binary trie index.
+
+    Names are sorted so that every trie node covers a contiguous range of
+    them; nodes are numbered breadth-first, which keeps the edges of each
+    node contiguous and sorted by character for binary search. The index is
+    written to a temporary file and atomically renamed into place.
+    """
+    started = time.perf_counter()
+    canonicals, entries = read_source(source_path)
+    names = sorted(entries)
+
+    first_edge = array('I', [0])
+    values = array('I')
+    edge_chars = array('I')
+    edge_targets = array('I')
+
+    queue = deque([(0, len(names), 0)])
+    next_node = 1
+    while queue:
+        lo, hi, depth = queue.popleft()
+        value = 0
+        if lo < hi and len(names[lo]) == depth:
+            value = entries[names[lo]] + 1
+            lo += 1
+        values.append(value)
+
+        i = lo
+        while i < hi:
+            char = names[i][depth]
+            j = i + 1
+            while j < hi and names[j][depth] == char:
+                j += 1
+            edge_chars.append(ord(char))
+            edge_targets.append(next_node)
+            queue.append((i, j, depth + 1))
+            next_node += 1
+            i = j
+        first_edge.append(len(edge_chars))
+
+    blob = bytearray()
+    offsets = array('I', [0])
+    for canonical in canonicals:
+        blob += canonical.encode('utf-8')
+        offsets.append(len(blob))
+    blob += b'\0' * (-len(blob) % 4)
+
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=index_path.parent, prefix=index_path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as index:
+            index.write(HEADER.pack(MAGIC, len(values), len(edge_chars), len(canonicals), len(blob)))
+            for section in (first_edge, values, edge_chars, edge_targets, offsets):
+                section.tofile(index)
+            index.write(blob)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return {
+        'canonical_names': len(canonicals),
+        'names': len(names),
+        'nodes': len(values),
+        'bytes': index_path.stat().st_size,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+class DrugGazetteer:
+    """Read-only view over a compiled gazetteer index"""
+
+    def __init__(self, index_path):
+        """Memory-map the index; no per-entry work happens here"""
+        self.index_path = Path(index_path)
+        with open(self.index_path, 'rb') as index:
+            self._mmap = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, node_count, edge_count, canonical_count, blob_size = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f'{self.index_path} is not a drug gazetteer index')
+
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+
+        def section(length):
+            nonlocal offset
+            data = view[offset:offset + length * 4].cast('I')
+            offset += length * 4
+            return data
+
+        self._first_edge = section(node_count + 1)
+        self._values = section(node_count)
+        self._edge_chars = section(edge_count)
+        self._edge_targets = section(edge_count)
+        self._offsets = section(canonical_count + 1)
+        self._blob = view[offset:offset + blob_size]
+        self.size = canonical_count
+
+    def _child(self, node: int, code: int) -> int:
+        """Follow the edge labelled ``code`` from ``node``, or return -1"""
+        lo = self._first_edge[node]
+        hi = self._first_edge[node + 1]
+        i = bisect_left(self._edge_chars, code, lo, hi)
+        if i < hi and self._edge_chars[i] == code:
+            return self._edge_targets[i]
+        return -1
+
+    def canonical(self, canonical_id: int) -> str:
+        """Return the canonical name stored under ``canonical_id``"""
+        start = self._offsets[canonical_id]
+        end = self._offsets[canonical_id + 1]
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    def canonical_names(self) -> List[str]:
+        """Return every canonical name in the gazetteer"""
+        return [self.canonical(canonical_id) for canonical_id in range(self.size)]
+
+    def lookup(self, name: str) -> Optional[str]:
+        """Return the canonical name for an exact (normalised) name"""
+        node = 0
+        for char in normalise_name(name):
+            node = self._child(node, ord(char))
+            if node < 0:
+                return None
+        value = self._values[node]
+        return self.canonical(value - 1) if value else None
+
+    def find_all(self, text: str) -> List[GazetteerMatch]:
+        """Return the leftmost-longest gazetteer matches in ``text``.
+
+        The trie is walked from each word start, so the cost per report is
+        bounded by its length and the longest name, not by the number of
+        entries in the gazetteer. Spans index into ``text`` itself, even where
+        lower-casing changes the length of a character (e.g. 'İ').
+        """
+        lower = text.lower()
+        origin = None
+        if len(lower) != len(text):
+            # Original index of every lower-cased character
+            lower = ''.join(char.lower() for char in text)
+            origin = [index for index, char in enumerate(text) for _ in range(len(char.lower()))]
+        length = len(lower)
+        matches = []
+        i = 0
+
+        while i < length:
+            if not lower[i].isalnum() or (i and lower[i - 1].isalnum()):
+                i += 1
+                continue
+
+            node = 0
+            j = i
+            best = None
+            while j < length:
+                if lower[j].isspace():
+                    while j < length and lower[j].isspace():
+                        j += 1
+                    node = self._child(node, SPACE)
+                else:
+                    node = self._child(node, ord(lower[j]))
+                    j += 1
+                if node < 0:
+                    break
+                if self._values[node] and (j == length or not lower[j].isalnum()):
+                    best = (j, self._values[node] - 1)
+
+            if best:
+                end, canonical_id = best
+                start, stop = (i, end) if origin is None else (origin[i], origin[end - 1] + 1)
+                matches.append(GazetteerMatch(start, stop, text[start:stop], self.canonical(canonical_id)))
+                i = end
+            else:
+                i += 1
+
+        return matches
+
+
+def ensure_index(source_path, index_path, compiler) -> Path:
+    """Run ``compiler`` if the index is missing or not newer than its source"""
+    source_path = Path(source_path)
+    index_path = Path(index_path)
+    # An index stamped in the same clock tick as an edit of its source may predate the edit
+    if not index_path.exists() or index_path.stat().st_mtime_ns <= source_path.stat().st_mtime_ns:
+        compiler(source_path, index_path)
+    return index_path
+
+
+def load_gazetteer(source_path, index_path=None) -> DrugGazetteer:
+    """Load a gazetteer, compiling its index first if it is missing or stale"""
+    source_path = Path(source_path)
+    index_path = index_path or source_path.with_suffix('.idx')
+    return DrugGazetteer(ensure_index(source_path, index_path, compile_gazetteer))
@@ -0,0 +1,181 @@
+"""
+Idempotency keys and duplicate suppression for /api/process-report/
+
+A client that sends an Idempotency-Key header gets the stored response of
+the first request with that key on every retry, without extraction running
+again or another report being saved. Separately, when REPORT_DEDUP_WINDOW is
+set, a report whose normalised text was already processed within that many
+seconds is answered from the existing row.
+"""
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .cache import text_digest
+from .models import IdempotencyKey, Report
+from .nlp_processor import get_setting
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    """Raised when a request cannot be matched to its Idempotency-Key"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def clean_key(key: Optional[str]) -> Optional[str]:
+    """Validate an Idempotency-Key header value; None if the header was not sent"""
+    if key is None or not key.strip():
+        return None
+    key = key.strip()
+    if len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters', 400)
+    return key
+
+
+# What claim_key() must do about the record already holding a key
+_EXPIRED = 'expired'
+_TAKE_OVER = 'take over'
+
+
+def _in_progress() -> IdempotencyError:
+    return IdempotencyError('A request with this Idempotency-Key is still being processed', 409)
+
+
+def _existing_claim(record: IdempotencyKey, fingerprint: str, now):
+    """Decide what a new claim does about ``record``, which already holds its key.
+
+    Returns _EXPIRED (delete it and claim again), _TAKE_OVER (its request
+    died without finishing) or the stored (status, body). Raises
+    IdempotencyError if the key belongs to a different report or its first
+    request is still in progress.
+    """
+    if record.created_at < now - timedelta(seconds=get_setting('IDEMPOTENCY_KEY_TTL', 86400)):
+        # Expired keys behave as if they were never used
+        return _EXPIRED
+    if record.fingerprint != fingerprint:
+        raise IdempotencyError('Idempotency-Key was already used with a different report', 422)
+    if record.status_code is not None:
+        return record.status_code, record.response
+    if record.created_at < now - timedelta(seconds=get_setting('IDEMPOTENCY_LOCK_TIMEOUT', 60)):
+        return _TAKE_OVER
+    raise _in_progress()
+
+
+def claim_key(key: str, report_text: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """Claim ``key`` for this request, or return the (status, body) stored for it.
+
+    Returns None when the caller now owns the key and must process the
+    request and then call complete_key() or release_key(). Raises
+    IdempotencyError if the key was used with a different report, or if
+    the first request with it is still in progress.
+    """
+    fingerprint = text_digest(report_text)
+    now = timezone.now()
+
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(key=key, fingerprint=fingerprint, created_at=now)
+            return None
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is None:
+            # Deleted between our insert and read; try the insert again
+            continue
+        claim = _existing_claim(record, fingerprint, now)
+        if claim == _EXPIRED:
+            IdempotencyKey.objects.filter(id=record.id, created_at=record.created_at).delete()
+            continue
+        if claim != _TAKE_OVER:
+            return claim
+        taken = IdempotencyKey.objects.filter(
+            id=record.id, created_at=record.created_at, status_code__isnull=True
+        ).update(created_at=now)
+        if taken:
+            return None
+        raise _in_progress()
+
+    raise _in_progress()
+
+
+async def aclaim_key(key: str, report_text: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """claim_key() for async views, with the async ORM.
+
+    Async views never run inside a transaction, so an insert that loses a
+    race needs no savepoint; reading first keeps retries from attempting it.
+    """
+    fingerprint = text_digest(report_text)
+    now = timezone.now()
+
+    for _ in range(2):
+        record = await IdempotencyKey.objects.filter(key=key).afirst()
+        if record is None:
+            try:
+                await IdempotencyKey.objects.acreate(key=key, fingerprint=fingerprint, created_at=now)
+                return None
+            except IntegrityError:
+                # Another request inserted it first; read its record
+                continue
+        claim = _existing_claim(record, fingerprint, now)
+        if claim == _EXPIRED:
+            await IdempotencyKey.objects.filter(id=record.id, created_at=record.created_at).adelete()
+            continue
+        if claim != _TAKE_OVER:
+            return claim
+        taken = await IdempotencyKey.objects.filter(
+            id=record.id, created_at=record.created_at, status_code__isnull=True
+        ).aupdate(created_at=now)
+        if taken:
+            return None
+        raise _in_progress()
+
+    raise _in_progress()
+
+
+def complete_key(key: str, status_code: int, body: Dict[str, Any]) -> None:
+    """Store the response of a claimed key; server errors release it so the client can retry"""
+    if status_code >= 500:
+        release_key(key)
+        return
+    IdempotencyKey.objects.filter(key=key).update(status_code=status_code, response=body)
+
+
+async def acomplete_key(key: str, status_code: int, body: Dict[str, Any]) -> None:
+    """complete_key() for async views"""
+    if status_code >= 500:
+        await IdempotencyKey.objects.filter(key=key, status_code__isnull=True).adelete()
+        return
+    await IdempotencyKey.objects.filter(key=key).aupdate(status_code=status_code, response=body)
+
+
+def release_key(key: str) -> None:
+    IdempotencyKey.objects.filter(key=key, status_code__isnull=True).delete()
+
+
+def purge_keys() -> int:
+    """Delete keys older than IDEMPOTENCY_KEY_TTL; returns the number removed"""
+    cutoff = timezone.now() - timedelta(seconds=get_setting('IDEMPOTENCY_KEY_TTL', 86400))
+    return IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()[0]
+
+
+async def afind_duplicate(report_text: str) -> Optional[Report]:
+    """Most recent report with the same normalised text within REPORT_DEDUP_WINDOW seconds"""
+    window = get_setting('REPORT_DEDUP_WINDOW', 0)
+    if not window:
+        return None
+    return await (
+        Report.objects.filter(
+            content_hash=text_digest(report_text),
+            created_at__gte=timezone.now() - timedelta(seconds=window),
+        )
+        .order_by('-created_at')
+        .afirst()
+    )
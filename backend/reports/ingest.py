@@ -0,0 +1,169 @@
+"""
+Streaming bulk ingest of raw reports from NDJSON or CSV uploads
+
+The request body is read line by line rather than parsed as one document.
+Reports are extracted and stored in fixed-size batches, each committed with
+one bulk insert, and a result or error for every input line is streamed
+back as soon as its batch is done.
+"""
+import csv
+import json
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .executor import extraction_executor
+from .nlp_processor import get_setting
+from .serializers import ProcessReportSerializer, ReportResponseSerializer
+from .services import create_reports
+
+INGEST_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'application/jsonl', 'application/json'),
+    'csv': ('text/csv',),
+}
+
+# Longest NDJSON line read into memory; longer lines are skipped with an error
+MAX_LINE_BYTES = 1024 * 1024
+
+# (line number, report text or None, error or None)
+Record = Tuple[int, Optional[str], Optional[str]]
+
+
+def ingest_format(explicit: Optional[str], content_type: str) -> str:
+    """Upload format from the ``format`` parameter, else from the Content-Type header"""
+    if explicit:
+        if explicit not in INGEST_FORMATS:
+            raise ValueError(f"Invalid format '{explicit}', expected one of: {', '.join(INGEST_FORMATS)}")
+        return explicit
+    for name, content_types in INGEST_FORMATS.items():
+        if content_type in content_types:
+            return name
+    raise ValueError(
+        f"Unsupported Content-Type '{content_type}'; send application/x-ndjson or text/csv, or pass ?format="
+    )
+
+
+def _validate(line: int, text: Any) -> Record:
+    serializer = ProcessReportSerializer(data={'report': text})
+    if not serializer.is_valid():
+        return line, None, '; '.join(str(error) for error in serializer.errors['report'])
+    return line, serializer.validated_data['report'], None
+
+
+def ndjson_records(stream) -> Iterator[Record]:
+    """Records from NDJSON lines, each {"report": "..."} or a bare JSON string"""
+    readline = stream.readline
+    line = 0
+    while True:
+        raw = readline(MAX_LINE_BYTES)
+        if not raw:
+            return
+        line += 1
+        if len(raw) >= MAX_LINE_BYTES and not raw.endswith(b'\n'):
+            # Drain the rest of the oversized line
+            while raw and not raw.endswith(b'\n'):
+                raw = readline(MAX_LINE_BYTES)
+            yield line, None, f'Line longer than {MAX_LINE_BYTES} bytes'
+            continue
+
+        text = raw.decode('utf-8', errors='replace').lstrip('\ufeff').strip()
+        if not text:
+            continue
+        try:
+            value = json.loads(text)
+        except ValueError as e:
+            yield line, None, f'Invalid JSON: {e}'
+            continue
+        if isinstance(value, dict):
+            if 'report' not in value:
+                yield line, None, "Expected an object with a 'report' field"
+                continue
+            value = value['report']
+        yield _validate(line, value)
+
+
+def csv_records(stream) -> Iterator[Record]:
+    """Records from a CSV upload with a 'report' column.
+
+    The header is read immediately so a missing column raises ValueError
+    before any response is sent.
+    """
+    lines = (raw.decode('utf-8', errors='replace') for raw in stream)
+    reader = csv.reader(lines)
+    header = [name.lstrip('\ufeff').strip().lower() for name in next(reader, [])]
+    if 'report' not in header:
+        raise ValueError("CSV upload needs a header row with a 'report' column")
+    column = header.index('report')
+
+    def records() -> Iterator[Record]:
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield reader.line_num, None, f'Invalid CSV: {e}'
+                return
+            if not any(field.strip() for field in row):
+                continue
+            yield _validate(reader.line_num, row[column] if column < len(row) else '')
+
+    return records()
+
+
+def _store_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    """Extract and bulk insert a batch; returns each stored report's id and extracted fields"""
+    processed_reports = extraction_executor.process_reports(texts)
+    reports = create_reports(texts, processed_reports)
+    return [
+        dict(ReportResponseSerializer(processed_data).data, id=report.id)
+        for report, processed_data in zip(reports, processed_reports)
+    ]
+
+
+def _store_individually(texts: List[str]) -> List[Dict[str, Any]]:
+    """Store reports one at a time so one bad report only fails its own line"""
+    results = []
+    for text in texts:
+        try:
+            results.append(_store_batch([text])[0])
+        except Exception as e:
+            results.append({'error': f'Error processing report: {str(e)}'})
+    return results
+
+
+def ingest_batches(records: Iterable[Record], batch_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Store valid records batch by batch, yielding the results of each batch and then a summary"""
+    batch_size = batch_size or get_setting('INGEST_BATCH_SIZE', 500)
+    records = iter(records)
+    created = failed = 0
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        texts = [text for _, text, error in batch if error is None]
+        stored = []
+        if texts:
+            try:
+                stored = _store_batch(texts)
+            except Exception:
+                # A single bad report must not fail the whole batch
+                stored = _store_individually(texts)
+
+        stored = iter(stored)
+        results = []
+        for line, _, error in batch:
+            result = {'error': error} if error is not None else next(stored)
+            if 'error' in result:
+                failed += 1
+            else:
+                created += 1
+            results.append(dict(line=line, **result))
+        yield results
+
+    yield [{'summary': {'created': created, 'failed': failed}}]
+
+
+def ingest_stream(records: Iterable[Record], batch_size: Optional[int] = None) -> Iterator[bytes]:
+    """NDJSON-encoded ingest results, one chunk per batch"""
+    for results in ingest_batches(records, batch_size):
+        yield ''.join(json.dumps(result) + '\n' for result in results).encode('utf-8')
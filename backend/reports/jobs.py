@@ -0,0 +1,157 @@
+"""
+Database-backed queue for asynchronous report processing
+"""
+import uuid
+from datetime import timedelta
+from typing import List, Tuple
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ProcessingJob
+from .executor import extraction_executor
+from .services import build_report, create_reports
+
+
+def enqueue(report_text: str) -> ProcessingJob:
+    """Store a raw report as a pending job"""
+    return ProcessingJob.objects.create(report_text=report_text)
+
+
+async def aenqueue(report_text: str) -> ProcessingJob:
+    """enqueue() for async views"""
+    return await ProcessingJob.objects.acreate(report_text=report_text)
+
+
+def requeue_stale(stale_after: int, max_attempts: int) -> int:
+    """Return jobs abandoned by crashed workers to the queue, or fail them"""
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    stale = ProcessingJob.objects.filter(status=ProcessingJob.STATUS_PROCESSING, started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=ProcessingJob.STATUS_FAILED,
+        error='Worker did not finish the job',
+        claim_token='',
+        finished_at=timezone.now()
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(
+        status=ProcessingJob.STATUS_PENDING,
+        claim_token=''
+    )
+    return failed + requeued
+
+
+def claim_jobs(batch_size: int) -> List[ProcessingJob]:
+    """Atomically claim up to ``batch_size`` pending jobs for this worker.
+
+    The claim is a conditional UPDATE tagged with a fresh token, so several
+    worker processes can poll the same table without a broker or row locks;
+    each job is claimed by exactly one of them.
+    """
+    candidate_ids = list(
+        ProcessingJob.objects.filter(status=ProcessingJob.STATUS_PENDING)
+        .order_by('created_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not candidate_ids:
+        return []
+
+    token = uuid.uuid4().hex
+    ProcessingJob.objects.filter(id__in=candidate_ids, status=ProcessingJob.STATUS_PENDING).update(
+        status=ProcessingJob.STATUS_PROCESSING,
+        claim_token=token,
+        attempts=F('attempts') + 1,
+        started_at=timezone.now()
+    )
+    return list(ProcessingJob.objects.filter(claim_token=token).order_by('created_at', 'id'))
+
+
+def _still_claimed(jobs: List[ProcessingJob]) -> List[ProcessingJob]:
+    """Keep the jobs this worker still holds; call inside the transaction that stores their results.
+
+    A job requeued by requeue_stale may already be claimed by another worker,
+    which then owns it. Swapping our token for a new one is a conditional
+    UPDATE, so the rows it touches stay ours until the transaction ends.
+    """
+    finishing = uuid.uuid4().hex
+    ProcessingJob.objects.filter(
+        id__in=[job.id for job in jobs],
+        claim_token__in={job.claim_token for job in jobs},
+        status=ProcessingJob.STATUS_PROCESSING
+    ).update(claim_token=finishing)
+    held = set(ProcessingJob.objects.filter(claim_token=finishing).values_list('id', flat=True))
+    return [job for job in jobs if job.id in held]
+
+
+def _finish(job: ProcessingJob, report, processed_data) -> None:
+    job.status = ProcessingJob.STATUS_DONE
+    job.report = report
+    job.result = processed_data
+    job.error = ''
+    job.claim_token = ''
+    job.finished_at = timezone.now()
+
+
+JOB_FIELDS = ['status', 'report', 'result', 'error', 'claim_token', 'finished_at']
+
+
+def _process_batch(jobs: List[ProcessingJob]) -> Tuple[int, int]:
+    """Extract a whole batch and store it with one bulk insert"""
+    processed = dict(zip(
+        [job.id for job in jobs],
+        extraction_executor.process_reports([job.report_text for job in jobs])
+    ))
+    with transaction.atomic():
+        jobs = _still_claimed(jobs)
+        if not jobs:
+            return 0, 0
+        processed_reports = [processed[job.id] for job in jobs]
+        reports = create_reports([job.report_text for job in jobs], processed_reports)
+        for job, report, processed_data in zip(jobs, reports, processed_reports):
+            _finish(job, report, processed_data)
+        ProcessingJob.objects.bulk_update(jobs, JOB_FIELDS)
+    return len(jobs), 0
+
+
+def _process_individually(jobs: List[ProcessingJob]) -> Tuple[int, int]:
+    """Process jobs one at a time, recording failures per job"""
+    done = failed = 0
+    for job in jobs:
+        try:
+            processed_data = extraction_executor.process_report(job.report_text)
+            with transaction.atomic():
+                if not _still_claimed([job]):
+                    continue
+                report = build_report(job.report_text, processed_data)
+                report.save()
+                _finish(job, report, processed_data)
+                job.save(update_fields=JOB_FIELDS)
+            done += 1
+        except Exception as e:
+            with transaction.atomic():
+                if not _still_claimed([job]):
+                    continue
+                job.status = ProcessingJob.STATUS_FAILED
+                job.report = None
+                job.result = None
+                job.error = str(e)
+                job.claim_token = ''
+                job.finished_at = timezone.now()
+                job.save(update_fields=JOB_FIELDS)
+            failed += 1
+    return done, failed
+
+
+def process_jobs(jobs: List[ProcessingJob]) -> Tuple[int, int]:
+    """Extract and store a claimed batch; returns (done, failed) counts.
+
+    Jobs re-claimed by another worker after being requeued as stale are
+    skipped and counted in neither.
+    """
+    if not jobs:
+        return 0, 0
+    try:
+        return _process_batch(jobs)
+    except Exception:
+        # A single bad report must not fail the whole batch
+        return _process_individually(jobs)
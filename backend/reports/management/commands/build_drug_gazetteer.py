@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.fuzzy import compile_fuzzy_index
+from reports.gazetteer import compile_gazetteer, load_gazetteer
+
+
+class Command(BaseCommand):
+    """Compile the drug gazetteer source file into its memory-mapped index"""
+
+    help = 'Compile the drug gazetteer into a compact trie index shared by all workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=settings.DRUG_GAZETTEER_PATH,
+                            help='Gazetteer source file (canonical<TAB>synonym...)')
+        parser.add_argument('--index', default=settings.DRUG_GAZETTEER_INDEX,
+                            help='Where to write the compiled index')
+        parser.add_argument('--fuzzy-index', default=settings.DRUG_FUZZY_INDEX,
+                            help='Where to write the fuzzy (misspelling) index')
+
+    def handle(self, *args, **options):
+        try:
+            stats = compile_gazetteer(options['source'], options['index'])
+            fuzzy_stats = compile_fuzzy_index(options['source'], options['fuzzy_index'])
+        except OSError as e:
+            raise CommandError(f'Could not compile gazetteer: {e}')
+
+        gazetteer = load_gazetteer(options['source'], options['index'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Compiled {stats['names']} names for {stats['canonical_names']} drugs "
+            f"into {gazetteer.index_path} ({stats['nodes']} nodes, {stats['bytes']} bytes) "
+            f"in {stats['seconds']:.2f}s"
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Compiled fuzzy index with {fuzzy_stats['entries']} delete variants "
+            f"into {options['fuzzy_index']} ({fuzzy_stats['bytes']} bytes) in {fuzzy_stats['seconds']:.2f}s"
+        ))
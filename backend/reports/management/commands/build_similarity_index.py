@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.similarity import build_index, similarity_index
+
+
+class Command(BaseCommand):
+    """Compile every report into the memory-mapped similar-report index"""
+
+    help = 'Rebuild the TF-IDF similarity index and fold in its delta log (run once after migrating, then periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Number of reports read per batch')
+
+    def handle(self, *args, **options):
+        def progress(total):
+            self.stdout.write(f'{total} reports read')
+
+        try:
+            stats = build_index(similarity_index, options['chunk_size'], progress)
+        except OSError as e:
+            raise CommandError(f'Could not build similarity index: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {stats['reports']} reports into {similarity_index.path} "
+            f"({stats['postings']} postings, {stats['bytes']} bytes) in {stats['seconds']:.2f}s"
+        ))
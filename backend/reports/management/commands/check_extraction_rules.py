@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.rules import load_rules
+
+
+class Command(BaseCommand):
+    """Validate and compile an extraction rules file"""
+
+    help = 'Compile an extraction rules file and report its compile time and memory (check it before swapping it in)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', default=settings.EXTRACTION_RULES_PATH,
+                            help='Rules file to check')
+
+    def handle(self, *args, **options):
+        try:
+            rules = load_rules(options['rules'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Invalid rules file {options['rules']}: {e}")
+
+        stats = rules.compile_stats
+        for part in ('drug_patterns', 'keywords'):
+            self.stdout.write(
+                f"{part}: {stats[part]['seconds'] * 1000:.2f} ms, {stats[part]['bytes'] / 1024:.1f} KiB"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Rules {rules.version}: {len(rules.known_drugs)} drugs, {len(rules.adverse_events)} adverse events, "
+            f"{len(rules.translations)} languages; compiled in {stats['seconds'] * 1000:.2f} ms, "
+            f"{stats['bytes'] / 1024:.1f} KiB"
+        ))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reports.near_duplicates import rebuild_index
+
+
+class Command(BaseCommand):
+    """Cluster existing reports into near-duplicate groups"""
+
+    help = 'Rebuild the MinHash LSH index and re-link every near-duplicate report (run once after migrating)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of reports indexed per batch')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(total, flagged):
+            self.stdout.write(f'{total} reports indexed, {flagged} near-duplicates')
+
+        total, flagged = rebuild_index(options['chunk_size'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Clustered {total} reports ({flagged} near-duplicates) in {time.perf_counter() - started:.2f}s'
+        ))
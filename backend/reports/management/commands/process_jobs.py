@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reports.jobs import claim_jobs, process_jobs, requeue_stale
+
+
+class Command(BaseCommand):
+    """Drain the asynchronous report processing queue"""
+
+    help = 'Process queued reports in batches; run one or more of these next to the web workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.JOB_BATCH_SIZE,
+                            help='Number of jobs to claim and process at once')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=settings.JOB_STALE_AFTER,
+                            help='Requeue jobs claimed longer than this many seconds ago')
+        parser.add_argument('--max-attempts', type=int, default=settings.JOB_MAX_ATTEMPTS,
+                            help='Fail jobs after this many abandoned attempts')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty instead of polling')
+
+    def handle(self, *args, **options):
+        from reports.executor import extraction_executor
+        extraction_executor.warm_up()
+
+        total_done = total_failed = 0
+        while True:
+            requeued = requeue_stale(options['stale_after'], options['max_attempts'])
+            if requeued:
+                self.stdout.write(self.style.WARNING(f'Recovered {requeued} stale jobs'))
+
+            jobs = claim_jobs(options['batch_size'])
+            if jobs:
+                started = time.perf_counter()
+                done, failed = process_jobs(jobs)
+                total_done += done
+                total_failed += failed
+                self.stdout.write(
+                    f'Processed {done} jobs ({failed} failed) in {time.perf_counter() - started:.2f}s'
+                )
+                continue
+
+            if options['once']:
+                break
+            try:
+                time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                break
+
+        extraction_executor.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Done: {total_done} processed, {total_failed} failed'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from reports.idempotency import purge_keys
+
+
+class Command(BaseCommand):
+    """Delete expired idempotency keys"""
+
+    help = 'Delete idempotency keys older than IDEMPOTENCY_KEY_TTL (run periodically, e.g. from cron)'
+
+    def handle(self, *args, **options):
+        removed = purge_keys()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired idempotency keys'))
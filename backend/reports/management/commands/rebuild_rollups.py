@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.rollups import rebuild_rollups, verify_rollups
+
+
+class Command(BaseCommand):
+    """Rebuild or check the analytics rollup tables"""
+
+    help = 'Recompute the analytics rollups from the reports table and check them against the raw data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify-only', action='store_true',
+                            help='Only compare the rollups with the raw data; do not rebuild')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of reports read per database round trip')
+
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            started = time.perf_counter()
+            report_rows, event_rows, trend_rows = rebuild_rollups(options['chunk_size'])
+            self.stdout.write(
+                f'Rebuilt {report_rows} report, {event_rows} adverse event and {trend_rows} trend rollups '
+                f'in {time.perf_counter() - started:.2f}s'
+            )
+
+        problems = verify_rollups(options['chunk_size'])
+        if problems:
+            for problem in problems[:20]:
+                self.stderr.write(problem)
+            raise CommandError(f'{len(problems)} rollup rows do not match the reports table')
+        self.stdout.write(self.style.SUCCESS('Rollups match the reports table'))
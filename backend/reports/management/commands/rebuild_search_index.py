@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.search import fts_available, install_search_index
+
+
+class Command(BaseCommand):
+    """Rebuild the full-text search index"""
+
+    help = 'Re-create the FTS5 search index triggers and re-index every report'
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError('Full-text search needs an SQLite database with FTS5')
+        started = time.perf_counter()
+        install_search_index(rebuild=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt search index in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reports.sketches import sketch_store
+
+
+class Command(BaseCommand):
+    """Rebuild the approximate analytics sketch"""
+
+    help = 'Recompute the approximate analytics sketch from the reports table (e.g. after deletes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of reports read per database round trip')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        sketch = sketch_store.rebuild_from_reports(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt sketch over {sketch.reports} reports in {time.perf_counter() - started:.2f}s'
+        ))
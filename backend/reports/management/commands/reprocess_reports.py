@@ -0,0 +1,63 @@
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from reports.executor import ExtractionExecutor
+from reports.nlp_processor import nlp_processor
+from reports.reprocess import reprocess_reports, stale_reports
+
+
+class Command(BaseCommand):
+    """Re-extract reports processed by an older version of the extractor"""
+
+    help = 'Re-extract stale reports in parallel after a lexicon or extractor change; resumes interrupted runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of reports read, extracted and written per chunk')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Extraction processes (1 extracts in this process)')
+        parser.add_argument('--checkpoint', default=settings.REPROCESS_CHECKPOINT_PATH,
+                            help='File recording progress, used to resume an interrupted run')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore a saved checkpoint and scan from the first report')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the stale reports')
+
+    def handle(self, *args, **options):
+        version = nlp_processor.version
+        stale = stale_reports(version).count()
+        self.stdout.write(f'{stale} reports are stale for extractor version {version}')
+        if options['dry_run'] or not stale:
+            return
+
+        if options['restart'] and os.path.exists(options['checkpoint']):
+            os.unlink(options['checkpoint'])
+
+        workers = options['workers']
+        executor = ExtractionExecutor(mode='process' if workers > 1 else 'inline', workers=workers)
+        executor.warm_up()
+
+        def progress(state):
+            self.stdout.write(
+                f"{state['processed']} reports re-extracted, {state['changed']} changed (last id {state['last_id']})"
+            )
+
+        try:
+            stats = reprocess_reports(
+                executor=executor, chunk_size=options['chunk_size'],
+                checkpoint=options['checkpoint'], progress=progress
+            )
+        finally:
+            executor.shutdown()
+
+        if stats['resumed_from']:
+            self.stdout.write(f"Resumed after report {stats['resumed_from']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-extracted {stats['processed']} reports ({stats['changed']} changed) in {stats['seconds']:.2f}s"
+        ))
+        if stats['changed']:
+            # Sketches only count additions, so changed reports need a full recount
+            call_command('rebuild_sketches', stdout=self.stdout)
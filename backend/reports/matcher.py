@@ -0,0 +1,107 @@
+"""
+Multi-lexicon keyword matcher built on an Aho-Corasick automaton
+"""
+from collections import deque
+from typing import Dict, List, NamedTuple
+
+
+class KeywordMatch(NamedTuple):
+    """A single keyword hit inside a text"""
+    start: int
+    end: int
+    lexicon: str
+    label: str
+    keyword: str
+
+
+class KeywordMatcher:
+    """Find every keyword from several lexicons in one pass over the text.
+
+    Lexicons are given as ``{lexicon_name: {label: [keyword, ...]}}``. The
+    automaton is compiled once, so matching cost depends on the length of the
+    text and the number of hits, not on the number of keywords.
+    """
+
+    def __init__(self, lexicons: Dict[str, Dict[str, List[str]]]):
+        """Compile the automaton from the given lexicons"""
+        self.lexicons = lexicons
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[tuple]] = [[]]
+
+        for lexicon, labels in lexicons.items():
+            for label, keywords in labels.items():
+                for keyword in keywords:
+                    self._add(keyword.lower(), lexicon, label)
+
+        self._build_failure_links()
+
+    def _add(self, keyword: str, lexicon: str, label: str) -> None:
+        """Insert a keyword into the trie"""
+        if not keyword:
+            return
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][char] = next_node
+            node = next_node
+        self._output[node].append((len(keyword), lexicon, label, keyword))
+
+    def _build_failure_links(self) -> None:
+        """Compute failure links breadth-first and merge suffix outputs"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_all(self, text: str) -> List[KeywordMatch]:
+        """Return every keyword occurrence in ``text``, ordered by end offset.
+
+        Spans index into ``text`` itself, even where lower-casing changes the
+        length of a character (e.g. 'İ' becomes 'i̇').
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        matches = []
+        node = 0
+
+        lowered = text.lower()
+        origin = None
+        if len(lowered) != len(text):
+            # Original index of every lower-cased character
+            lowered = ''.join(char.lower() for char in text)
+            origin = [index for index, char in enumerate(text) for _ in range(len(char.lower()))]
+
+        for index, char in enumerate(lowered):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                end = index + 1
+                for length, lexicon, label, keyword in output[node]:
+                    if origin is None:
+                        matches.append(KeywordMatch(end - length, end, lexicon, label, keyword))
+                    else:
+                        matches.append(KeywordMatch(origin[end - length], origin[index] + 1, lexicon, label, keyword))
+
+        return matches
+
+    def labels(self, text: str) -> Dict[str, set]:
+        """Return the set of matched labels for each lexicon"""
+        found = {lexicon: set() for lexicon in self.lexicons}
+        for match in self.find_all(text):
+            found[match.lexicon].add(match.label)
+        return found
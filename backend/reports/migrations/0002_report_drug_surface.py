@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='drug_surface',
+            field=models.CharField(blank=True, default='', help_text='Drug name as written in the report, before normalisation', max_length=255),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0002_report_drug_surface'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_text', models.TextField(help_text='Raw medical report text to process')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', help_text='Processing status of the job', max_length=20)),
+                ('result', models.JSONField(blank=True, help_text='Extracted data once processed', null=True)),
+                ('error', models.TextField(blank=True, default='', help_text='Error message if processing failed')),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Number of processing attempts')),
+                ('claim_token', models.CharField(blank=True, default='', help_text='Worker claim for this job', max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the job was queued')),
+                ('started_at', models.DateTimeField(blank=True, help_text='When a worker claimed the job', null=True)),
+                ('finished_at', models.DateTimeField(blank=True, help_text='When processing finished', null=True)),
+                ('report', models.ForeignKey(blank=True, help_text='Report created from this job', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='reports.report')),
+            ],
+            options={
+                'verbose_name': 'Processing Job',
+                'verbose_name_plural': 'Processing Jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='job_status_created_idx'), models.Index(fields=['claim_token'], name='job_claim_token_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:55
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    """Count the existing reports into the new rollup tables"""
+    Report = apps.get_model('reports', 'Report')
+    ReportRollup = apps.get_model('reports', 'ReportRollup')
+    AdverseEventRollup = apps.get_model('reports', 'AdverseEventRollup')
+
+    report_counts = Counter()
+    event_counts = Counter()
+    rows = Report.objects.order_by().values_list('created_at', 'drug', 'severity', 'outcome', 'adverse_events')
+    for created_at, drug, severity, outcome, adverse_events in rows.iterator(chunk_size=2000):
+        day = timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+        key = (day, drug, severity, outcome)
+        report_counts[key] += 1
+        for event in set(adverse_events or []):
+            event_counts[key + (event,)] += 1
+
+    ReportRollup.objects.bulk_create([
+        ReportRollup(day=day, drug=drug, severity=severity, outcome=outcome, report_count=count)
+        for (day, drug, severity, outcome), count in report_counts.items()
+    ], batch_size=2000)
+    AdverseEventRollup.objects.bulk_create([
+        AdverseEventRollup(day=day, drug=drug, severity=severity, outcome=outcome,
+                           adverse_event=event, report_count=count)
+        for (day, drug, severity, outcome, event), count in event_counts.items()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0004_report_analytics_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdverseEventRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Day the reports were processed (UTC)')),
+                ('drug', models.CharField(max_length=255)),
+                ('severity', models.CharField(choices=[('mild', 'Mild'), ('moderate', 'Moderate'), ('severe', 'Severe')], max_length=20)),
+                ('outcome', models.CharField(choices=[('recovered', 'Recovered'), ('ongoing', 'Ongoing'), ('fatal', 'Fatal')], max_length=20)),
+                ('adverse_event', models.CharField(max_length=255)),
+                ('report_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Adverse Event Rollup',
+                'verbose_name_plural': 'Adverse Event Rollups',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReportRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Day the reports were processed (UTC)')),
+                ('drug', models.CharField(max_length=255)),
+                ('severity', models.CharField(choices=[('mild', 'Mild'), ('moderate', 'Moderate'), ('severe', 'Severe')], max_length=20)),
+                ('outcome', models.CharField(choices=[('recovered', 'Recovered'), ('ongoing', 'Ongoing'), ('fatal', 'Fatal')], max_length=20)),
+                ('report_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Report Rollup',
+                'verbose_name_plural': 'Report Rollups',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reportrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'drug', 'severity', 'outcome'), name='unique_report_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='adverseeventrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'drug', 'severity', 'outcome', 'adverse_event'), name='unique_adverse_event_rollup'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:00
+
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_trend_rollups(apps, schema_editor):
+    """Count the existing reports into the new trend rollup table"""
+    Report = apps.get_model('reports', 'Report')
+    TrendRollup = apps.get_model('reports', 'TrendRollup')
+
+    counts = Counter()
+    rows = Report.objects.order_by().values_list('created_at', 'drug', 'adverse_events')
+    for created_at, drug, adverse_events in rows.iterator(chunk_size=2000):
+        created_at = timezone.localtime(created_at) if timezone.is_aware(created_at) else timezone.make_aware(created_at)
+        hour = created_at.replace(minute=0, second=0, microsecond=0)
+        day = timezone.make_aware(datetime.combine(created_at.date(), time.min))
+        week = timezone.make_aware(datetime.combine(created_at.date() - timedelta(days=created_at.weekday()), time.min))
+        events = set(adverse_events or [])
+        for interval, bucket, drugs in (('hour', hour, ('',)), ('day', day, ('', drug)), ('week', week, ('', drug))):
+            for trend_drug in drugs:
+                counts[(interval, bucket, trend_drug, '')] += 1
+                for event in events:
+                    counts[(interval, bucket, trend_drug, event)] += 1
+
+    TrendRollup.objects.bulk_create([
+        TrendRollup(interval=interval, bucket=bucket, drug=drug, adverse_event=event, report_count=count)
+        for (interval, bucket, drug, event), count in counts.items()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0005_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('week', 'Week')], max_length=10)),
+                ('bucket', models.DateTimeField(help_text='Start of the hour, day or week')),
+                ('drug', models.CharField(blank=True, help_text='Drug, or empty for all drugs', max_length=255)),
+                ('adverse_event', models.CharField(blank=True, help_text='Adverse event, or empty for all reports', max_length=255)),
+                ('report_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Trend Rollup',
+                'verbose_name_plural': 'Trend Rollups',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['created_at'], name='report_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='trendrollup',
+            constraint=models.UniqueConstraint(fields=('interval', 'drug', 'bucket', 'adverse_event'), name='unique_trend_rollup'),
+        ),
+        migrations.RunPython(backfill_trend_rollups, migrations.RunPython.noop),
+    ]
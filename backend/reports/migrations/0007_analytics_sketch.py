@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0006_trend_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('data', models.BinaryField(default=b'', help_text='Count-min, heavy hitter and HyperLogLog state')),
+                ('report_count', models.BigIntegerField(default=0, help_text='Reports counted into the sketch')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Analytics Sketch',
+                'verbose_name_plural': 'Analytics Sketches',
+            },
+        ),
+    ]
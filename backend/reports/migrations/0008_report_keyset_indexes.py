@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0007_analytics_sketch'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='report',
+            name='report_severity_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='report',
+            name='report_outcome_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='report',
+            name='report_drug_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='report',
+            name='report_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['created_at', 'id'], name='report_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['drug', 'created_at', 'id'], name='report_drug_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['severity', 'created_at', 'id'], name='report_severity_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['outcome', 'created_at', 'id'], name='report_outcome_created_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_adverse_events(apps, schema_editor):
+    """Copy every report's adverse_events JSON list into the new table"""
+    Report = apps.get_model('reports', 'Report')
+    ReportAdverseEvent = apps.get_model('reports', 'ReportAdverseEvent')
+
+    batch = []
+    for report_id, adverse_events in Report.objects.order_by().values_list('id', 'adverse_events').iterator(chunk_size=2000):
+        batch.extend(ReportAdverseEvent(report_id=report_id, event=event) for event in set(adverse_events or []))
+        if len(batch) >= 2000:
+            ReportAdverseEvent.objects.bulk_create(batch)
+            batch = []
+    ReportAdverseEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0008_report_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportAdverseEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(help_text='Adverse event', max_length=255)),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='adverse_event_rows', to='reports.report')),
+            ],
+            options={
+                'verbose_name': 'Report Adverse Event',
+                'verbose_name_plural': 'Report Adverse Events',
+                'indexes': [models.Index(fields=['event', 'report'], name='adverse_event_report_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reportadverseevent',
+            constraint=models.UniqueConstraint(fields=('report', 'event'), name='unique_report_adverse_event'),
+        ),
+        migrations.RunPython(backfill_adverse_events, migrations.RunPython.noop),
+    ]
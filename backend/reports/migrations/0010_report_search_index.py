@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# Frozen copy of the FTS5 schema as of this migration; reports.search keeps the
+# triggers installed after later migrations and handles rebuilds.
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS reports_report_fts USING fts5(original_report, drug, drug_surface, "
+    "content='reports_report', content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS reports_report_fts_insert AFTER INSERT ON reports_report BEGIN "
+    "INSERT INTO reports_report_fts(rowid, original_report, drug, drug_surface) "
+    "VALUES (new.id, new.original_report, new.drug, new.drug_surface); END",
+    "CREATE TRIGGER IF NOT EXISTS reports_report_fts_delete AFTER DELETE ON reports_report BEGIN "
+    "INSERT INTO reports_report_fts(reports_report_fts, rowid, original_report, drug, drug_surface) "
+    "VALUES ('delete', old.id, old.original_report, old.drug, old.drug_surface); END",
+    "CREATE TRIGGER IF NOT EXISTS reports_report_fts_update "
+    "AFTER UPDATE OF original_report, drug, drug_surface ON reports_report BEGIN "
+    "INSERT INTO reports_report_fts(reports_report_fts, rowid, original_report, drug, drug_surface) "
+    "VALUES ('delete', old.id, old.original_report, old.drug, old.drug_surface); "
+    "INSERT INTO reports_report_fts(rowid, original_report, drug, drug_surface) "
+    "VALUES (new.id, new.original_report, new.drug, new.drug_surface); END",
+    "INSERT INTO reports_report_fts(reports_report_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS reports_report_fts_insert",
+    "DROP TRIGGER IF EXISTS reports_report_fts_delete",
+    "DROP TRIGGER IF EXISTS reports_report_fts_update",
+    "DROP TABLE IF EXISTS reports_report_fts",
+]
+
+
+def run_sqlite(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite only; other databases search without an index
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement, params=None)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0009_report_adverse_event'),
+    ]
+
+    operations = [
+        # SQLite only: an FTS5 table over the report text kept in sync by triggers
+        migrations.RunPython(run_sqlite(CREATE_SQL), run_sqlite(DROP_SQL)),
+    ]
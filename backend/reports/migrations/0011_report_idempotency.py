@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:24
+
+import hashlib
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def backfill_content_hash(apps, schema_editor):
+    """Hash the whitespace-normalised text of existing reports"""
+    Report = apps.get_model('reports', 'Report')
+
+    batch = []
+    for report in Report.objects.order_by().only('id', 'original_report').iterator(chunk_size=2000):
+        report.content_hash = hashlib.sha256(' '.join(report.original_report.split()).encode('utf-8')).hexdigest()
+        batch.append(report)
+        if len(batch) >= 2000:
+            Report.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    Report.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0010_report_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Idempotency-Key header value', max_length=255, unique=True)),
+                ('fingerprint', models.CharField(help_text='Hash of the request the key was first used with', max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, help_text='Status of the stored response; empty while the first request is in progress', null=True)),
+                ('response', models.JSONField(blank=True, help_text='Stored response body', null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the key was first used')),
+            ],
+            options={
+                'verbose_name': 'Idempotency Key',
+                'verbose_name_plural': 'Idempotency Keys',
+            },
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='SHA-256 of the whitespace-normalised report text, for duplicate detection', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['content_hash', 'created_at'], name='report_content_hash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='idempotencykey',
+            index=models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
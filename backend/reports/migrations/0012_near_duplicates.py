@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0011_report_idempotency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Earlier report this one is a near-duplicate of', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='near_duplicates', to='reports.report'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='duplicate_similarity',
+            field=models.FloatField(blank=True, help_text='Jaccard similarity of the text shingles to duplicate_of', null=True),
+        ),
+        migrations.CreateModel(
+            name='NearDuplicateBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(help_text='Hash of one band of the MinHash signature')),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='near_duplicate_buckets', to='reports.report')),
+            ],
+            options={
+                'verbose_name': 'Near-Duplicate Bucket',
+                'verbose_name_plural': 'Near-Duplicate Buckets',
+                'indexes': [models.Index(fields=['bucket', 'report'], name='near_duplicate_bucket_idx')],
+            },
+        ),
+    ]
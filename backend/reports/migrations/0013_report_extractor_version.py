@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0012_near_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='extractor_version',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Fingerprint of the extractor that produced the extracted fields; empty if unknown', max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['extractor_version', 'id'], name='report_extractor_version_idx'),
+        ),
+    ]
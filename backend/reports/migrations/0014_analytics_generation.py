@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0013_report_extractor_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('generation', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Analytics Generation',
+            },
+        ),
+    ]
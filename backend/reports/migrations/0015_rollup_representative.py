@@ -0,0 +1,91 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:22
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def _move_counts(model, counts, representative):
+    """Move each key's count onto its row with ``is_representative=representative``"""
+    for key, count in counts.items():
+        fields = dict(key)
+        model.objects.filter(is_representative=not representative, **fields).update(
+            report_count=F('report_count') - count
+        )
+        row, _ = model.objects.get_or_create(is_representative=representative, **fields)
+        model.objects.filter(id=row.id).update(report_count=F('report_count') + count)
+    model.objects.filter(report_count__lte=0).delete()
+
+
+def split_near_duplicates(apps, schema_editor):
+    """Move the counts of existing near-duplicate reports onto is_representative=False rows"""
+    Report = apps.get_model('reports', 'Report')
+    ReportRollup = apps.get_model('reports', 'ReportRollup')
+    AdverseEventRollup = apps.get_model('reports', 'AdverseEventRollup')
+
+    report_counts = Counter()
+    event_counts = Counter()
+    rows = Report.objects.filter(duplicate_of__isnull=False).order_by().values_list(
+        'created_at', 'drug', 'severity', 'outcome', 'adverse_events'
+    )
+    for created_at, drug, severity, outcome, adverse_events in rows.iterator(chunk_size=2000):
+        day = timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+        key = (('day', day), ('drug', drug), ('severity', severity), ('outcome', outcome))
+        report_counts[key] += 1
+        for event in set(adverse_events or []):
+            event_counts[key + (('adverse_event', event),)] += 1
+
+    _move_counts(ReportRollup, report_counts, False)
+    _move_counts(AdverseEventRollup, event_counts, False)
+
+
+def merge_near_duplicates(apps, schema_editor):
+    """Fold the is_representative=False rows back into the combined counts"""
+    for name, fields in (('ReportRollup', ('day', 'drug', 'severity', 'outcome')),
+                         ('AdverseEventRollup', ('day', 'drug', 'severity', 'outcome', 'adverse_event'))):
+        model = apps.get_model('reports', name)
+        counts = Counter({
+            tuple(zip(fields, row[:-1])): row[-1]
+            for row in model.objects.filter(is_representative=False).values_list(*fields, 'report_count')
+        })
+        _move_counts(model, counts, True)
+        model.objects.filter(is_representative=False).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0014_analytics_generation'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='adverseeventrollup',
+            name='unique_adverse_event_rollup',
+        ),
+        migrations.RemoveConstraint(
+            model_name='reportrollup',
+            name='unique_report_rollup',
+        ),
+        migrations.AddField(
+            model_name='adverseeventrollup',
+            name='is_representative',
+            field=models.BooleanField(default=True, help_text='Whether the counted reports are not near-duplicates of another report'),
+        ),
+        migrations.AddField(
+            model_name='reportrollup',
+            name='is_representative',
+            field=models.BooleanField(default=True, help_text='Whether the counted reports are not near-duplicates of another report'),
+        ),
+        migrations.AddConstraint(
+            model_name='adverseeventrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'drug', 'severity', 'outcome', 'adverse_event', 'is_representative'), name='unique_adverse_event_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='reportrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'drug', 'severity', 'outcome', 'is_representative'), name='unique_report_rollup'),
+        ),
+        migrations.RunPython(split_near_duplicates, merge_near_duplicates),
+    ]
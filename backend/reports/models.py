@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
+from .cache import text_digest
+
 
 class Report(models.Model):
     """Model to store processed adverse event reports"""
@@ -19,6 +21,12 @@ class Report(models.Model):
     
     original_report = models.TextField(help_text="Original medical report text")
     drug = models.CharField(max_length=255, help_text="Extracted drug name")
+    drug_surface = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        help_text="Drug name as written in the report, before normalisation"
+    )
     adverse_events = models.JSONField(default=list, help_text="List of adverse events")
     severity = models.CharField(
         max_length=20, 
@@ -31,16 +39,294 @@ class Report(models.Model):
         help_text="Patient outcome"
     )
     created_at = models.DateTimeField(default=timezone.now, help_text="When the report was processed")
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        help_text="SHA-256 of the whitespace-normalised report text, for duplicate detection"
+    )
+    duplicate_of = models.ForeignKey(
+        'self',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='near_duplicates',
+        help_text="Earlier report this one is a near-duplicate of"
+    )
+    duplicate_similarity = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Jaccard similarity of the text shingles to duplicate_of"
+    )
+    extractor_version = models.CharField(
+        max_length=16,
+        blank=True,
+        default='',
+        editable=False,
+        help_text="Fingerprint of the extractor that produced the extracted fields; empty if unknown"
+    )
     
     class Meta:
         ordering = ['-created_at']
+        # Keyset pagination walks (created_at, id), optionally within one drug,
+        # severity or outcome; the same indexes serve the analytics queries
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='report_created_id_idx'),
+            models.Index(fields=['drug', 'created_at', 'id'], name='report_drug_created_idx'),
+            models.Index(fields=['severity', 'created_at', 'id'], name='report_severity_created_idx'),
+            models.Index(fields=['outcome', 'created_at', 'id'], name='report_outcome_created_idx'),
+            models.Index(fields=['content_hash', 'created_at'], name='report_content_hash_idx'),
+            models.Index(fields=['extractor_version', 'id'], name='report_extractor_version_idx'),
+        ]
         verbose_name = "Adverse Event Report"
         verbose_name_plural = "Adverse Event Reports"
     
     def __str__(self):
         return f"Report #{self.id} - {self.drug} ({self.severity})"
     
+    def save(self, *args, **kwargs):
+        self.content_hash = text_digest(self.original_report)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'original_report' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'content_hash'}
+        # The rollup signal handlers must commit or roll back with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
     @property
     def adverse_events_list(self):
         """Return adverse events as a formatted string"""
         return ', '.join(self.adverse_events) if self.adverse_events else 'None'
+
+
+class ReportAdverseEvent(models.Model):
+    """One adverse event of a report, normalised out of Report.adverse_events for indexed queries"""
+    
+    report = models.ForeignKey(Report, on_delete=models.CASCADE, related_name='adverse_event_rows')
+    event = models.CharField(max_length=255, help_text="Adverse event")
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['report', 'event'], name='unique_report_adverse_event'),
+        ]
+        indexes = [
+            models.Index(fields=['event', 'report'], name='adverse_event_report_idx'),
+        ]
+        verbose_name = "Report Adverse Event"
+        verbose_name_plural = "Report Adverse Events"
+    
+    def __str__(self):
+        return f"Report #{self.report_id} - {self.event}"
+
+
+class NearDuplicateBucket(models.Model):
+    """One LSH band bucket of a report's MinHash signature, stored for cluster representatives only"""
+    
+    report = models.ForeignKey(Report, on_delete=models.CASCADE, related_name='near_duplicate_buckets')
+    bucket = models.BigIntegerField(help_text="Hash of one band of the MinHash signature")
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['bucket', 'report'], name='near_duplicate_bucket_idx'),
+        ]
+        verbose_name = "Near-Duplicate Bucket"
+        verbose_name_plural = "Near-Duplicate Buckets"
+
+
+class IdempotencyKey(models.Model):
+    """A client-supplied Idempotency-Key and the response stored for it"""
+    
+    key = models.CharField(max_length=255, unique=True, help_text="Idempotency-Key header value")
+    fingerprint = models.CharField(max_length=64, help_text="Hash of the request the key was first used with")
+    status_code = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        help_text="Status of the stored response; empty while the first request is in progress"
+    )
+    response = models.JSONField(null=True, blank=True, help_text="Stored response body")
+    created_at = models.DateTimeField(default=timezone.now, help_text="When the key was first used")
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+        verbose_name = "Idempotency Key"
+        verbose_name_plural = "Idempotency Keys"
+    
+    def __str__(self):
+        return self.key
+
+
+class ProcessingJob(models.Model):
+    """A raw report waiting to be processed by the background worker"""
+    
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    report_text = models.TextField(help_text="Raw medical report text to process")
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        help_text="Processing status of the job"
+    )
+    result = models.JSONField(null=True, blank=True, help_text="Extracted data once processed")
+    error = models.TextField(blank=True, default='', help_text="Error message if processing failed")
+    report = models.ForeignKey(
+        Report,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='jobs',
+        help_text="Report created from this job"
+    )
+    attempts = models.PositiveIntegerField(default=0, help_text="Number of processing attempts")
+    claim_token = models.CharField(max_length=64, blank=True, default='', help_text="Worker claim for this job")
+    created_at = models.DateTimeField(default=timezone.now, help_text="When the job was queued")
+    started_at = models.DateTimeField(null=True, blank=True, help_text="When a worker claimed the job")
+    finished_at = models.DateTimeField(null=True, blank=True, help_text="When processing finished")
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_status_created_idx'),
+            models.Index(fields=['claim_token'], name='job_claim_token_idx'),
+        ]
+        verbose_name = "Processing Job"
+        verbose_name_plural = "Processing Jobs"
+    
+    def __str__(self):
+        return f"Job #{self.id} ({self.status})"
+
+
+class ReportRollup(models.Model):
+    """Report counts per day, drug, severity, outcome and representativeness, maintained on every write"""
+    
+    day = models.DateField(help_text="Day the reports were processed (UTC)")
+    drug = models.CharField(max_length=255)
+    severity = models.CharField(max_length=20, choices=Report.SEVERITY_CHOICES)
+    outcome = models.CharField(max_length=20, choices=Report.OUTCOME_CHOICES)
+    is_representative = models.BooleanField(
+        default=True,
+        help_text="Whether the counted reports are not near-duplicates of another report"
+    )
+    report_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'drug', 'severity', 'outcome', 'is_representative'],
+                name='unique_report_rollup'
+            ),
+        ]
+        verbose_name = "Report Rollup"
+        verbose_name_plural = "Report Rollups"
+    
+    def __str__(self):
+        return f"{self.day} {self.drug} {self.severity}/{self.outcome}: {self.report_count}"
+
+
+class AdverseEventRollup(models.Model):
+    """Adverse event counts per day, drug, severity, outcome and representativeness, maintained on every write"""
+    
+    day = models.DateField(help_text="Day the reports were processed (UTC)")
+    drug = models.CharField(max_length=255)
+    severity = models.CharField(max_length=20, choices=Report.SEVERITY_CHOICES)
+    outcome = models.CharField(max_length=20, choices=Report.OUTCOME_CHOICES)
+    adverse_event = models.CharField(max_length=255)
+    is_representative = models.BooleanField(
+        default=True,
+        help_text="Whether the counted reports are not near-duplicates of another report"
+    )
+    report_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'drug', 'severity', 'outcome', 'adverse_event', 'is_representative'],
+                name='unique_adverse_event_rollup'
+            ),
+        ]
+        verbose_name = "Adverse Event Rollup"
+        verbose_name_plural = "Adverse Event Rollups"
+    
+    def __str__(self):
+        return f"{self.day} {self.drug} {self.adverse_event}: {self.report_count}"
+
+
+class TrendRollup(models.Model):
+    """Report and adverse event counts per hour, day or week, maintained on every write
+    
+    Hourly buckets are kept for all drugs only; day and week buckets are kept
+    both for all drugs (``drug`` empty) and per drug. Rows with an empty
+    ``adverse_event`` count reports.
+    """
+    
+    INTERVAL_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+        ('week', 'Week'),
+    ]
+    
+    interval = models.CharField(max_length=10, choices=INTERVAL_CHOICES)
+    bucket = models.DateTimeField(help_text="Start of the hour, day or week")
+    drug = models.CharField(max_length=255, blank=True, help_text="Drug, or empty for all drugs")
+    adverse_event = models.CharField(max_length=255, blank=True, help_text="Adverse event, or empty for all reports")
+    report_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['interval', 'drug', 'bucket', 'adverse_event'],
+                name='unique_trend_rollup'
+            ),
+        ]
+        verbose_name = "Trend Rollup"
+        verbose_name_plural = "Trend Rollups"
+    
+    def __str__(self):
+        return f"{self.interval} {self.bucket} {self.drug or 'all'} {self.adverse_event or 'reports'}: {self.report_count}"
+
+
+class AnalyticsSketch(models.Model):
+    """Serialised approximate-analytics sketch shared by all worker processes"""
+    
+    name = models.CharField(max_length=50, unique=True)
+    data = models.BinaryField(default=b'', help_text="Count-min, heavy hitter and HyperLogLog state")
+    report_count = models.BigIntegerField(default=0, help_text="Reports counted into the sketch")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Analytics Sketch"
+        verbose_name_plural = "Analytics Sketches"
+    
+    def __str__(self):
+        return f"{self.name} ({self.report_count} reports)"
+
+
+class AnalyticsGeneration(models.Model):
+    """Counter bumped when reports change in ways cached analytics cannot follow incrementally
+    
+    Every worker process compares it with the generation its in-memory
+    counts were built from, so a delete or edit in one process (or a
+    management command) is noticed by all of them.
+    """
+    
+    name = models.CharField(max_length=50, unique=True)
+    generation = models.BigIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Analytics Generation"
+    
+    def __str__(self):
+        return f"{self.name} generation {self.generation}"
@@ -0,0 +1,236 @@
+"""
+Near-duplicate report detection with MinHash and locality-sensitive hashing
+
+Each report text is cut into 5-byte shingles and summarised by a
+MinHash signature. The signature is split into bands, and each band is
+hashed to one bucket key. Reports that share any bucket are candidates,
+and a candidate is confirmed when the exact Jaccard similarity of the two
+shingle sets reaches NEAR_DUPLICATE_THRESHOLD. A new report therefore costs
+one indexed lookup of its bucket keys, not a comparison with every stored
+report.
+
+Only cluster representatives (reports that are not themselves duplicates)
+are stored in the bucket table. A duplicate links to its representative
+through Report.duplicate_of. When a representative is deleted, its
+duplicates are clustered again, so one of them takes its place. Both
+move the relinked reports between the representative and near-duplicate
+analytics rollups.
+"""
+import hashlib
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db import connection, transaction
+
+from .models import NearDuplicateBucket, Report
+from .nlp_processor import get_setting
+from .rollups import ROLLUP_FIELDS, rebuild_rollups, replace_reports, report_row
+
+SHINGLE_SIZE = 5
+
+# 16 bands of 8 rows: pairs at Jaccard 0.8 become candidates ~95% of the time, at 0.5 ~6%
+NUM_BANDS = 16
+ROWS_PER_BAND = 8
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+
+# Candidates verified per report, most shared buckets first
+MAX_CANDIDATES = 10
+
+_SHINGLE_BASE = np.uint64(257)
+_SHINGLE_MIX = np.uint64(0x9E3779B97F4A7C15)
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Fixed seed: signatures must be comparable across processes and restarts
+_permutations = np.random.RandomState(1).randint(1, (1 << 61) - 1, size=(2, NUM_PERM), dtype=np.uint64)
+_PERM_A, _PERM_B = _permutations[0], _permutations[1]
+
+
+def shingles(text: str) -> np.ndarray:
+    """Sorted unique 32-bit hashes of the byte shingles of the lower-cased, whitespace-normalised text"""
+    data = np.frombuffer(' '.join(text.lower().split()).encode('utf-8'), dtype=np.uint8).astype(np.uint64)
+    if data.size < SHINGLE_SIZE:
+        data = np.concatenate([data, np.zeros(SHINGLE_SIZE - data.size, dtype=np.uint64)])
+    windows = np.lib.stride_tricks.sliding_window_view(data, SHINGLE_SIZE)
+    hashed = np.zeros(windows.shape[0], dtype=np.uint64)
+    for column in range(SHINGLE_SIZE):
+        hashed = hashed * _SHINGLE_BASE + windows[:, column]
+    # Multiplicative hashing spreads the packed bytes over the top 32 bits
+    return np.unique((hashed * _SHINGLE_MIX) >> np.uint64(32))
+
+
+def signature(shingle_hashes: np.ndarray) -> np.ndarray:
+    """MinHash signature of a shingle set"""
+    # uint64 products wrap around; that is fine for hashing
+    hashed = (np.outer(shingle_hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH
+    return hashed.min(axis=0)
+
+
+def band_keys(sig: np.ndarray) -> List[int]:
+    """One signed 64-bit bucket key per band"""
+    keys = []
+    for band in range(NUM_BANDS):
+        rows = sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].astype('<u4').tobytes()
+        digest = hashlib.blake2b(bytes([band]) + rows, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity of two sorted unique shingle hash arrays"""
+    shared = np.intersect1d(a, b, assume_unique=True).size
+    return shared / (a.size + b.size - shared)
+
+
+def _chunked(items: Sequence, size: int = 900) -> Iterable[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _stored_buckets(keys: Iterable[int]) -> Dict[int, List[int]]:
+    """Representative report ids per bucket key"""
+    buckets = defaultdict(list)
+    for chunk in _chunked(sorted(set(keys))):
+        for bucket, report_id in NearDuplicateBucket.objects.filter(bucket__in=chunk).values_list('bucket', 'report_id'):
+            buckets[bucket].append(report_id)
+    return buckets
+
+
+def _candidates(report_id: Optional[int], keys: List[int], *bucket_maps: Dict[int, List[int]]) -> List[int]:
+    hits = Counter()
+    for key in keys:
+        for buckets in bucket_maps:
+            hits.update(buckets.get(key, ()))
+    hits.pop(report_id, None)
+    return [candidate for candidate, _ in hits.most_common(MAX_CANDIDATES)]
+
+
+def _insert_buckets(rows: List[Tuple[int, int]]) -> None:
+    """Insert (report_id, bucket) rows with one executemany; 16 rows per report make model instances costly"""
+    if not rows:
+        return
+    opts = NearDuplicateBucket._meta
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {table} ({report}, {bucket}) VALUES (%s, %s)'.format(
+        table=quote(opts.db_table),
+        report=quote(opts.get_field('report').column),
+        bucket=quote(opts.get_field('bucket').column),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def index_reports(reports: Sequence[Report]) -> int:
+    """Link each saved report to a near-duplicate representative, or index it as a new one.
+
+    Earlier reports of the same batch count as candidates for later ones.
+    Returns the number of reports flagged as near-duplicates.
+    """
+    if not reports:
+        return 0
+    threshold = get_setting('NEAR_DUPLICATE_THRESHOLD', 0.8)
+    shingle_sets = [shingles(report.original_report) for report in reports]
+    keys = [band_keys(signature(shingle_set)) for shingle_set in shingle_sets]
+
+    stored = _stored_buckets(key for report_keys in keys for key in report_keys)
+    stored_candidates = {
+        candidate
+        for report, report_keys in zip(reports, keys)
+        for candidate in _candidates(report.id, report_keys, stored)
+    }
+    candidate_shingles = {}
+    for chunk in _chunked(sorted(stored_candidates)):
+        for candidate, text in Report.objects.filter(id__in=chunk).values_list('id', 'original_report'):
+            candidate_shingles[candidate] = shingles(text)
+
+    batch_buckets = defaultdict(list)
+    new_buckets = []
+    flagged = []
+    for report, shingle_set, report_keys in zip(reports, shingle_sets, keys):
+        best, best_similarity = None, 0.0
+        for candidate in _candidates(report.id, report_keys, stored, batch_buckets):
+            if candidate not in candidate_shingles:
+                continue
+            similarity = jaccard(shingle_set, candidate_shingles[candidate])
+            if similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+
+        if best is not None and best_similarity >= threshold:
+            report.duplicate_of_id = best
+            report.duplicate_similarity = round(best_similarity, 4)
+            flagged.append(report)
+            continue
+
+        candidate_shingles[report.id] = shingle_set
+        for key in report_keys:
+            batch_buckets[key].append(report.id)
+            new_buckets.append((report.id, key))
+
+    with transaction.atomic():
+        _insert_buckets(new_buckets)
+        Report.objects.bulk_update(flagged, ['duplicate_of', 'duplicate_similarity'], batch_size=500)
+    return len(flagged)
+
+
+def reindex_report(report: Report) -> None:
+    """Re-check a report whose text was edited"""
+    NearDuplicateBucket.objects.filter(report_id=report.id).delete()
+    report.duplicate_of_id = None
+    report.duplicate_similarity = None
+    if not index_reports([report]):
+        Report.objects.filter(id=report.id).update(duplicate_of=None, duplicate_similarity=None)
+
+
+def reindex_orphans(report_ids: Sequence[int], representative_id: int, chunk_size: int = 2000) -> int:
+    """Re-cluster the near-duplicates of a deleted representative.
+
+    The foreign key's SET_NULL has cleared their duplicate_of and they have
+    no buckets, so without this they would never match again. The earliest
+    becomes the new representative unless it matches another one, and the
+    rest link to whichever they match. Their rollup counts move from
+    ``representative_id``'s cluster to wherever they end up. Returns the
+    number re-linked.
+    """
+    flagged = 0
+    duplicate_of = ROLLUP_FIELDS.index('duplicate_of_id')
+    for chunk in _chunked(sorted(report_ids), chunk_size):
+        orphans = list(
+            Report.objects.filter(id__in=chunk).order_by('id').only('id', 'original_report', *ROLLUP_FIELDS)
+        )
+        old_rows = []
+        for orphan in orphans:
+            row = list(report_row(orphan))
+            row[duplicate_of] = representative_id
+            old_rows.append(tuple(row))
+        with transaction.atomic():
+            flagged += index_reports(orphans)
+            replace_reports(old_rows, orphans)
+    return flagged
+
+
+def rebuild_index(chunk_size: int = 2000, progress=None) -> Tuple[int, int]:
+    """Drop the index and cluster every report in id order, then recount the rollups.
+
+    Returns (reports, near-duplicates).
+    """
+    with transaction.atomic():
+        NearDuplicateBucket.objects.all().delete()
+        Report.objects.exclude(duplicate_of=None).update(duplicate_of=None, duplicate_similarity=None)
+
+    total = flagged = 0
+    last_id = 0
+    while True:
+        reports = list(
+            Report.objects.filter(id__gt=last_id).order_by('id').only('id', 'original_report')[:chunk_size]
+        )
+        if not reports:
+            break
+        flagged += index_reports(reports)
+        total += len(reports)
+        last_id = reports[-1].id
+        if progress:
+            progress(total, flagged)
+    # The relinking above goes through QuerySet.update() and bulk_update()
+    rebuild_rollups(chunk_size)
+    return total, flagged
@@ -1,168 +1,340 @@
 """
 NLP processing module for extracting structured data from medical reports
 """
+import copy
+import hashlib
+import json
 import re
-import spacy
-from typing import List, Dict, Any
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+from django.conf import settings
+
+from .cache import ExtractionCache
+from .fuzzy import FuzzyIndex, load_fuzzy_index
+from .gazetteer import DrugGazetteer, load_gazetteer
+from .matcher import KeywordMatch
+from .rules import DEFAULT_RULES_PATH, RuleSet, RuleStore
+
+
+# Bump when extraction logic changes in a way the lexicons do not capture
+EXTRACTOR_VERSION = '1'
+
+DEFAULT_GAZETTEER_PATH = Path(__file__).resolve().parent.parent / 'data' / 'drug_gazetteer.tsv'
+
+
+def get_setting(name: str, default: Any) -> Any:
+    """Read an NLP setting, falling back to a default outside Django"""
+    return getattr(settings, name, default) if settings.configured else default
+
+
+def file_digest(path) -> str:
+    """SHA-256 of a file's contents; unlike its size and mtime, stable across copies and hosts"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Words checked against the fuzzy index when nothing else looks like a drug
+FUZZY_TOKEN_PATTERN = re.compile(r'[A-Za-z]{6,}')
 
 
 class NLPProcessor:
     """Class to handle NLP processing of medical reports"""
     
-    def __init__(self):
-        """Initialize the NLP processor"""
-        try:
-            self.nlp = spacy.load("en_core_web_sm")
-        except OSError:
-            print("spaCy English model not found. Using fallback regex patterns.")
-            self.nlp = None
-        
-        # Drug extraction patterns
-        self.drug_patterns = [
-            r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\s+(?:tablet|capsule|injection|dose|mg|ml|g)\b',
-            r'\bDrug\s+[A-Z]\b',
-            r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\s+(?:X|Y|Z)\b',
-            r'\b(?:aspirin|ibuprofen|acetaminophen|morphine|penicillin|insulin|warfarin|metformin)\b'
-        ]
-        
-        # Adverse event keywords
-        self.adverse_events = {
-            'nausea': ['nausea', 'nauseous', 'nauseated', 'queasy'],
-            'headache': ['headache', 'head pain', 'migraine', 'cephalgia'],
-            'dizziness': ['dizziness', 'dizzy', 'vertigo', 'lightheaded'],
-            'rash': ['rash', 'skin irritation', 'dermatitis', 'hives', 'skin reaction'],
-            'fatigue': ['fatigue', 'tiredness', 'exhaustion', 'weakness'],
-            'diarrhea': ['diarrhea', 'diarrhoea', 'loose stools'],
-            'vomiting': ['vomiting', 'vomit', 'throwing up', 'emesis'],
-            'fever': ['fever', 'pyrexia', 'elevated temperature'],
-            'pain': ['pain', 'ache', 'soreness', 'discomfort', 'chest pain'],
-            'swelling': ['swelling', 'edema', 'inflammation'],
-            'shortness of breath': ['shortness of breath', 'breathing difficulty', 'dyspnea'],
-            'allergic reaction': ['allergic reaction', 'allergy', 'hypersensitivity']
-        }
+    def __init__(self, gazetteer_path: Optional[str] = None, gazetteer_index: Optional[str] = None,
+                 fuzzy_index: Optional[str] = None, rules_path: Optional[str] = None):
+        """Initialize the NLP processor.
         
-        # Severity indicators
-        self.severity_indicators = {
-            'severe': ['severe', 'serious', 'critical', 'life-threatening', 'intense', 'extreme'],
-            'moderate': ['moderate', 'modest', 'noticeable', 'significant'],
-            'mild': ['mild', 'slight', 'minor', 'light', 'gentle']
-        }
+        The spaCy model, drug indexes and extraction rules are loaded on
+        first use or by an explicit warm_up(), so importing this module stays
+        cheap for migrations, admin-only processes and tests.
+        """
+        self._nlp = None
+        self._nlp_state = 'not_loaded'
+        self._drug_index_paths = (gazetteer_path, gazetteer_index, fuzzy_index)
+        self._drug_indexes = None
+        self._load_lock = threading.RLock()
+        self._version = None
+        self.cache = ExtractionCache(
+            max_entries=get_setting('EXTRACTION_CACHE_SIZE', 10000),
+            shared_alias=get_setting('EXTRACTION_CACHE_BACKEND', None),
+            shared_timeout=get_setting('EXTRACTION_CACHE_TIMEOUT', None)
+        )
         
-        # Outcome indicators
-        self.outcome_indicators = {
-            'recovered': ['recovered', 'recovery', 'resolved', 'better', 'improved', 'healed'],
-            'ongoing': ['ongoing', 'continuing', 'persistent', 'still', 'remains'],
-            'fatal': ['fatal', 'death', 'died', 'deceased', 'expired', 'passed away']
+        # Lexicons, keyword automaton and translation tables from the rules file
+        self.rule_store = RuleStore(
+            lambda: rules_path or get_setting('EXTRACTION_RULES_PATH', DEFAULT_RULES_PATH),
+            lambda: get_setting('EXTRACTION_RULES_CHECK_INTERVAL', 2.0)
+        )
+    
+    @property
+    def rules(self) -> RuleSet:
+        """The current extraction rules; hold on to them for the duration of one extraction"""
+        return self.rule_store.current()
+    
+    @property
+    def nlp(self):
+        """The spaCy pipeline, loaded on first access (None if unavailable)"""
+        if self._nlp_state not in ('ready', 'unavailable'):
+            self._load_model()
+        return self._nlp
+    
+    @property
+    def gazetteer(self) -> Optional[DrugGazetteer]:
+        """The drug gazetteer, loaded on first access"""
+        if self._drug_indexes is None:
+            self._load_drug_indexes()
+        return self._drug_indexes[0]
+    
+    @property
+    def fuzzy_index(self) -> Optional[FuzzyIndex]:
+        """The fuzzy drug name index, loaded on first access"""
+        if self._drug_indexes is None:
+            self._load_drug_indexes()
+        return self._drug_indexes[1]
+    
+    def _load_model(self) -> None:
+        """Load only the spaCy components that entity extraction needs"""
+        with self._load_lock:
+            if self._nlp_state in ('ready', 'unavailable'):
+                return
+            self._nlp_state = 'loading'
+            try:
+                import spacy
+                self._nlp = spacy.load(
+                    get_setting('NLP_SPACY_MODEL', 'en_core_web_sm'),
+                    exclude=get_setting('NLP_SPACY_EXCLUDE', ['tagger', 'parser', 'attribute_ruler', 'lemmatizer'])
+                )
+                self._nlp_state = 'ready'
+            except (ImportError, OSError):
+                print("spaCy English model not found. Using fallback regex patterns.")
+                self._nlp = None
+                self._nlp_state = 'unavailable'
+    
+    def _load_drug_indexes(self) -> None:
+        """Load the shared drug gazetteer and fuzzy indexes if a source file is available"""
+        with self._load_lock:
+            if self._drug_indexes is None:
+                self._drug_indexes = self._open_drug_indexes(*self._drug_index_paths)
+    
+    def _gazetteer_source(self) -> str:
+        """Path of the gazetteer source file in use"""
+        return self._drug_index_paths[0] or get_setting('DRUG_GAZETTEER_PATH', DEFAULT_GAZETTEER_PATH)
+    
+    def _open_drug_indexes(self, source: Optional[str], index: Optional[str],
+                           fuzzy_index: Optional[str]) -> Tuple[Optional[DrugGazetteer], Optional[FuzzyIndex]]:
+        """Open the gazetteer and fuzzy indexes, compiling them if needed"""
+        if source is None:
+            source = self._gazetteer_source()
+            index = index or get_setting('DRUG_GAZETTEER_INDEX', None)
+            fuzzy_index = fuzzy_index or get_setting('DRUG_FUZZY_INDEX', None)
+        try:
+            return load_gazetteer(source, index), load_fuzzy_index(source, fuzzy_index)
+        except (OSError, ValueError) as e:
+            print(f"Drug gazetteer not available ({e}). Using built-in drug names.")
+            return None, None
+    
+    @property
+    def version(self) -> str:
+        """Fingerprint of everything that determines extraction results.
+        
+        Used as part of every cache key, so editing a lexicon or the
+        gazetteer file invalidates cached results automatically.
+        """
+        return self._version_for(self.rules)
+    
+    def _version_for(self, rules: RuleSet) -> str:
+        version = self._version
+        if version is None or version[0] is not rules:
+            try:
+                gazetteer = file_digest(self._gazetteer_source())
+            except OSError:
+                gazetteer = None
+            fingerprint = json.dumps({
+                'extractor': EXTRACTOR_VERSION,
+                'model': get_setting('NLP_SPACY_MODEL', 'en_core_web_sm'),
+                'gazetteer': gazetteer,
+                **rules.fingerprint_fields()
+            }, sort_keys=True)
+            version = self._version = (rules, hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16])
+        return version[1]
+    
+    def warm_up(self, background: bool = False) -> None:
+        """Load the spaCy model, drug indexes and rules now instead of on first use"""
+        if background:
+            threading.Thread(target=self.warm_up, name='nlp-warm-up', daemon=True).start()
+            return
+        self._load_model()
+        self._load_drug_indexes()
+        self.rule_store.current()
+    
+    def status(self) -> Dict[str, Any]:
+        """Report whether the model and drug indexes have been loaded"""
+        model_loaded = self._nlp_state in ('ready', 'unavailable')
+        indexes_loaded = self._drug_indexes is not None
+        return {
+            'ready': model_loaded and indexes_loaded,
+            'model': self._nlp_state,
+            'pipeline': list(self._nlp.pipe_names) if self._nlp is not None else [],
+            'drug_indexes': 'loaded' if indexes_loaded else 'not_loaded',
+            'rules': self.rule_store.status(),
+            'cache': self.cache.stats()
         }
     
-    def extract_drug(self, text: str) -> str:
-        """Extract drug name from text using NLP and pattern matching"""
-        text_lower = text.lower()
+    def match_keywords(self, text: str) -> List[KeywordMatch]:
+        """Find all adverse event, severity and outcome keywords with their spans"""
+        return self.rules.match_keywords(text)
+    
+    def _matched_labels(self, text: str, matches: Optional[List[KeywordMatch]], lexicon: str,
+                        rules: RuleSet) -> set:
+        """Collect matched labels of one lexicon, scanning the text if needed"""
+        if matches is None:
+            matches = rules.match_keywords(text)
+        return {match.label for match in matches if match.lexicon == lexicon}
+    
+    def normalise_drug(self, name: str) -> str:
+        """Map a drug name, possibly misspelled, to its canonical gazetteer name"""
+        if not self.gazetteer:
+            return name
         
-        # Try spaCy NER if available
+        for candidate in [name] + name.split()[::-1]:
+            canonical = self.gazetteer.lookup(candidate)
+            if canonical:
+                return canonical
+            if self.fuzzy_index and len(candidate) >= 5:
+                match = self.fuzzy_index.lookup(candidate, 1 if len(candidate) < 9 else 2)
+                if match:
+                    return self.gazetteer.canonical(match.canonical_id)
+        
+        return name
+    
+    def match_drug(self, text: str, doc: Optional[Any] = None, rules: Optional[RuleSet] = None) -> Tuple[str, str]:
+        """Extract the canonical drug name and its surface form from text"""
+        rules = rules or self.rules
+        # Try spaCy NER if available, reusing an already parsed doc
         if self.nlp:
-            doc = self.nlp(text)
+            if doc is None:
+                doc = self.nlp(text)
             for ent in doc.ents:
                 if ent.label_ in ["DRUG", "CHEMICAL"]:
-                    return ent.text
+                    return self.normalise_drug(ent.text), ent.text
         
-        # Fallback to regex patterns
-        for pattern in self.drug_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+        # Gazetteer lookup, mapping synonyms and brand names to canonical names
+        if self.gazetteer:
+            matches = self.gazetteer.find_all(text)
             if matches:
-                return matches[0]
+                return matches[0].canonical, matches[0].surface
+        
+        # Fallback to a single linear scan for dosage forms, placeholders and known names
+        drug = rules.drug_extractor.extract(text)
+        if drug:
+            return self.normalise_drug(drug), drug
         
-        # Simple fallback - look for "Drug X" pattern
-        drug_match = re.search(r'\bDrug\s+[A-Z]\b', text, re.IGNORECASE)
-        if drug_match:
-            return drug_match.group()
+        # Last resort - single-edit misspellings of known names anywhere in the text
+        if self.fuzzy_index:
+            for word in FUZZY_TOKEN_PATTERN.findall(text):
+                if word.lower() in rules.keyword_words:
+                    continue
+                match = self.fuzzy_index.lookup(word, 1)
+                if match:
+                    return self.gazetteer.canonical(match.canonical_id), word
         
-        return "Unknown Drug"
+        return "Unknown Drug", ""
     
-    def extract_adverse_events(self, text: str) -> List[str]:
+    def extract_drug(self, text: str) -> str:
+        """Extract drug name from text using NLP and pattern matching"""
+        return self.match_drug(text)[0]
+    
+    def extract_adverse_events(self, text: str, matches: Optional[List[KeywordMatch]] = None,
+                               rules: Optional[RuleSet] = None) -> List[str]:
         """Extract adverse events from text"""
-        text_lower = text.lower()
-        found_events = []
-        
-        for event, keywords in self.adverse_events.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    found_events.append(event)
-                    break
-        
-        return list(set(found_events))  # Remove duplicates
+        rules = rules or self.rules
+        found = self._matched_labels(text, matches, 'adverse_events', rules)
+        return [event for event in rules.adverse_events if event in found]
     
-    def extract_severity(self, text: str) -> str:
+    def extract_severity(self, text: str, matches: Optional[List[KeywordMatch]] = None,
+                         rules: Optional[RuleSet] = None) -> str:
         """Extract severity level from text"""
-        text_lower = text.lower()
+        rules = rules or self.rules
+        found = self._matched_labels(text, matches, 'severity', rules)
         
-        for severity, indicators in self.severity_indicators.items():
-            for indicator in indicators:
-                if indicator in text_lower:
-                    return severity
+        for severity in rules.severity_indicators:
+            if severity in found:
+                return severity
         
         return "mild"  # Default to mild if not specified
     
-    def extract_outcome(self, text: str) -> str:
+    def extract_outcome(self, text: str, matches: Optional[List[KeywordMatch]] = None,
+                        rules: Optional[RuleSet] = None) -> str:
         """Extract outcome from text"""
-        text_lower = text.lower()
+        rules = rules or self.rules
+        found = self._matched_labels(text, matches, 'outcome', rules)
         
-        for outcome, indicators in self.outcome_indicators.items():
-            for indicator in indicators:
-                if indicator in text_lower:
-                    return outcome
+        for outcome in rules.outcome_indicators:
+            if outcome in found:
+                return outcome
         
         return "ongoing"  # Default to ongoing if not specified
     
-    def process_report(self, report_text: str) -> Dict[str, Any]:
-        """Process a medical report and extract structured data"""
+    def process_report(self, report_text: str, doc: Optional[Any] = None) -> Dict[str, Any]:
+        """Process a medical report and extract structured data, using cached results when possible"""
+        rules = self.rules
+        version = self._version_for(rules)
+        result = self.cache.get(report_text, version)
+        if result is None:
+            result = self._extract(report_text, doc, rules)
+            self.cache.set(report_text, version, result)
+        return result
+    
+    def _extract(self, report_text: str, doc: Optional[Any], rules: RuleSet) -> Dict[str, Any]:
+        """Run every extractor over a report, all with the same rules"""
+        matches = rules.match_keywords(report_text)
+        drug, drug_surface = self.match_drug(report_text, doc, rules)
         return {
-            'drug': self.extract_drug(report_text),
-            'adverse_events': self.extract_adverse_events(report_text),
-            'severity': self.extract_severity(report_text),
-            'outcome': self.extract_outcome(report_text)
+            'drug': drug,
+            'drug_surface': drug_surface,
+            'adverse_events': self.extract_adverse_events(report_text, matches, rules),
+            'severity': self.extract_severity(report_text, matches, rules),
+            'outcome': self.extract_outcome(report_text, matches, rules)
         }
     
+    def process_reports(self, report_texts: Iterable[str], batch_size: Optional[int] = None,
+                        n_process: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Process many reports, parsing only uncached texts with spaCy in batches"""
+        report_texts = list(report_texts)
+        rules = self.rules
+        version = self._version_for(rules)
+        results: Dict[str, Dict[str, Any]] = {}
+        pending = []
+        for text in report_texts:
+            if text in results or text in pending:
+                continue
+            cached = self.cache.get(text, version)
+            if cached is None:
+                pending.append(text)
+            else:
+                results[text] = cached
+        
+        if pending and self.nlp:
+            batch_size = batch_size or get_setting('NLP_BATCH_SIZE', 64)
+            n_process = n_process or get_setting('NLP_N_PROCESS', 1)
+            docs = self.nlp.pipe(pending, batch_size=batch_size, n_process=n_process)
+        else:
+            docs = [None] * len(pending)
+        
+        for text, doc in zip(pending, docs):
+            results[text] = self._extract(text, doc, rules)
+            self.cache.set(text, version, results[text])
+        
+        return [copy.deepcopy(results[text]) for text in report_texts]
+    
     def translate_text(self, text: str, target_language: str) -> str:
         """Simple translation function (mock implementation)"""
-        translations = {
-            'french': {
-                'recovered': 'rétabli',
-                'ongoing': 'en cours',
-                'fatal': 'fatal',
-                'mild': 'léger',
-                'moderate': 'modéré',
-                'severe': 'sévère',
-                'nausea': 'nausée',
-                'headache': 'mal de tête',
-                'dizziness': 'étourdissement',
-                'rash': 'éruption cutanée',
-                'fatigue': 'fatigue',
-                'diarrhea': 'diarrhée',
-                'vomiting': 'vomissements',
-                'fever': 'fièvre',
-                'pain': 'douleur',
-                'swelling': 'gonflement'
-            },
-            'swahili': {
-                'recovered': 'amepona',
-                'ongoing': 'inaendelea',
-                'fatal': 'la kufa',
-                'mild': 'nyepesi',
-                'moderate': 'wastani',
-                'severe': 'kali',
-                'nausea': 'kichefuchefu',
-                'headache': 'kichwa cha maumivu',
-                'dizziness': 'kizunguzungu',
-                'rash': 'mashavu',
-                'fatigue': 'uchovu',
-                'diarrhea': 'kuhara',
-                'vomiting': 'kutapika',
-                'fever': 'homa',
-                'pain': 'maumivu',
-                'swelling': 'uvimbe'
-            }
-        }
+        translations = self.rules.translations
         
         if target_language.lower() in translations:
             return translations[target_language.lower()].get(text.lower(), text)
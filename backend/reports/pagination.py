@@ -0,0 +1,112 @@
+"""
+Filtering and keyset (cursor) pagination for the reports listing
+"""
+import base64
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+
+from .analytics import day_start, parse_date_range
+from .models import Report
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(report: Report) -> str:
+    """Opaque cursor pointing just past ``report`` in (created_at, id) order"""
+    raw = f'{report.created_at.isoformat()}|{report.id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    """Return the (created_at, id) position encoded in ``cursor``"""
+    try:
+        created_at, report_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        position = (parse_datetime(created_at), int(report_id))
+    except (ValueError, UnicodeError):
+        position = (None, None)
+    if position[0] is None:
+        raise ValueError('Invalid cursor')
+    return position
+
+
+def page_size(params) -> int:
+    """Requested page size, defaulting to REST_FRAMEWORK['PAGE_SIZE'] and capped at MAX_PAGE_SIZE"""
+    default = settings.REST_FRAMEWORK.get('PAGE_SIZE', 20)
+    try:
+        size = int(params.get('page_size', default))
+    except ValueError:
+        raise ValueError('page_size must be an integer')
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def filter_reports(params) -> QuerySet:
+    """Apply the drug, severity, outcome, adverse_event and start/end filters"""
+    queryset = Report.objects.all()
+    for field in ('drug', 'severity', 'outcome'):
+        value = params.get(field)
+        if value:
+            queryset = queryset.filter(**{field: value})
+
+    adverse_event = params.get('adverse_event')
+    if adverse_event:
+        # Index lookup on the normalised table instead of scanning the JSON column
+        queryset = queryset.filter(adverse_event_rows__event=adverse_event)
+
+    start, end = parse_date_range(params)
+    if start:
+        queryset = queryset.filter(created_at__gte=day_start(start))
+    if end:
+        queryset = queryset.filter(created_at__lt=day_start(end + timedelta(days=1)))
+    return queryset
+
+
+def keyset_query(queryset: QuerySet, cursor: Optional[str], size: int) -> QuerySet:
+    """The rows of one page, newest first, plus one to tell whether another page follows.
+
+    Seeking past the cursor on the (created_at, id) index costs the same on
+    every page, unlike OFFSET which rescans all the skipped rows.
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, report_id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=report_id))
+    return queryset[:size + 1]
+
+
+def split_page(reports: List[Report], size: int) -> Tuple[List[Report], Optional[str]]:
+    """Cut the rows read by keyset_query() into the page and the cursor of the next one"""
+    next_cursor = encode_cursor(reports[size - 1]) if len(reports) > size else None
+    return reports[:size], next_cursor
+
+
+def keyset_page(queryset: QuerySet, cursor: Optional[str], size: int) -> Tuple[List[Report], Optional[str]]:
+    """Return one page, newest first, and the cursor of the next page (None on the last page)"""
+    return split_page(list(keyset_query(queryset, cursor, size)), size)
+
+
+def list_reports(params) -> Tuple[List[Report], Optional[str], int]:
+    """Filter and paginate reports from query parameters; raises ValueError on bad input"""
+    size = page_size(params)
+    reports, next_cursor = keyset_page(filter_reports(params), params.get('cursor') or None, size)
+    return reports, next_cursor, size
+
+
+async def alist_reports(params) -> Tuple[List[Report], Optional[str], int]:
+    """list_reports() for async views, reading the page with the async ORM"""
+    size = page_size(params)
+    rows = keyset_query(filter_reports(params), params.get('cursor') or None, size)
+    reports, next_cursor = split_page([report async for report in rows], size)
+    return reports, next_cursor, size
+
+
+def next_page_url(request, next_cursor: Optional[str]) -> Optional[str]:
+    """Absolute URL of the next page, keeping the current filters"""
+    if next_cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = next_cursor
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
@@ -0,0 +1,64 @@
+"""
+Processing of one submitted report, shared by the WSGI and ASGI process-report views
+
+A resubmission of a recently processed text is answered from the stored
+report; otherwise the text is queued when REPORT_PROCESSING_ASYNC is set,
+or extracted on a thread pool and saved. The async view awaits
+process_report_text() directly and the sync view runs it with
+async_to_sync(), so both deployments answer a request the same way.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import status
+
+from .executor import ExtractionTimeout, extraction_executor
+from .idempotency import afind_duplicate
+from .jobs import aenqueue
+from .serializers import ReportResponseSerializer
+from .services import create_reports
+
+# Threads that block on extraction so the event loop never does
+nlp_threads = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_NLP_THREADS', 8),
+    thread_name_prefix='async-nlp'
+)
+
+
+async def process_report_text(report_text: str) -> Tuple[Dict[str, Any], int, Optional[Dict[str, str]]]:
+    """Return the (body, status, headers) of a process-report response"""
+    try:
+        # Answer resubmissions of a recently processed text from the stored report
+        duplicate = await afind_duplicate(report_text)
+        if duplicate is not None:
+            return (
+                ReportResponseSerializer(duplicate).data,
+                status.HTTP_200_OK,
+                {'Content-Location': f'/api/reports/{duplicate.id}/'}
+            )
+
+        # In async mode, queue the report for 'manage.py process_jobs'
+        if settings.REPORT_PROCESSING_ASYNC:
+            job = await aenqueue(report_text)
+            return (
+                {'job_id': job.id, 'status': job.status, 'status_url': f'/api/jobs/{job.id}/'},
+                status.HTTP_202_ACCEPTED,
+                None
+            )
+
+        loop = asyncio.get_running_loop()
+        processed_data = await loop.run_in_executor(nlp_threads, extraction_executor.process_report, report_text)
+
+        # The insert and its derived tables commit in one transaction, which the async ORM cannot open
+        await sync_to_async(create_reports)([report_text], [processed_data])
+
+        response_serializer = ReportResponseSerializer(processed_data)
+        return response_serializer.data, status.HTTP_201_CREATED, None
+
+    except ExtractionTimeout as e:
+        return {'error': f'Error processing report: {str(e)}'}, status.HTTP_504_GATEWAY_TIMEOUT, None
+    except Exception as e:
+        return {'error': f'Error processing report: {str(e)}'}, status.HTTP_500_INTERNAL_SERVER_ERROR, None
@@ -0,0 +1,170 @@
+"""
+Re-extract stored reports whose extraction results are out of date
+
+Every report records the extractor version (NLPProcessor.version) that
+produced its extracted fields. After a lexicon, gazetteer or extractor
+change, the reports with any other version are stale; they are read in id
+order, extracted in parallel and written back one chunk at a time with a
+single batched UPDATE. The next chunk is extracted while the previous one
+is written. A checkpoint after every chunk lets an interrupted run resume
+where it stopped.
+"""
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from django.db import connection, transaction
+from django.db.models import QuerySet
+
+from .disproportionality import signal_engine
+from .executor import ExtractionExecutor, extraction_executor
+from .models import Report, ReportAdverseEvent
+from .nlp_processor import nlp_processor
+from .rollups import ROLLUP_FIELDS, replace_reports, report_row
+from .services import add_adverse_event_rows
+from .sketches import sketch_store
+
+EXTRACTED_FIELDS = ['drug', 'drug_surface', 'adverse_events', 'severity', 'outcome']
+
+
+def stale_reports(version: Optional[str] = None) -> QuerySet:
+    """Reports extracted by any other extractor version (or an unknown one)"""
+    return Report.objects.exclude(extractor_version=version or nlp_processor.version)
+
+
+def _update_rows(reports: Sequence[Report]) -> None:
+    """Write the extracted fields of many reports with one executemany UPDATE.
+
+    Same effect as bulk_update(), whose per-row CASE expressions make up
+    most of the time of a large re-extraction.
+    """
+    opts = Report._meta
+    quote = connection.ops.quote_name
+    fields = [opts.get_field(name) for name in EXTRACTED_FIELDS + ['extractor_version']]
+    sql = 'UPDATE {table} SET {assignments} WHERE {pk} = %s'.format(
+        table=quote(opts.db_table),
+        assignments=', '.join(f'{quote(field.column)} = %s' for field in fields),
+        pk=quote(opts.pk.column),
+    )
+    rows = [
+        [field.get_db_prep_save(getattr(report, field.attname), connection) for field in fields] + [report.pk]
+        for report in reports
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def apply_results(reports: Sequence[Report], results: Sequence[Dict[str, Any]], version: str) -> int:
+    """Write new extraction results back and move changed reports in the derived tables.
+
+    Returns the number of reports whose extracted fields changed.
+    """
+    changed, old_rows, events_changed = [], [], []
+    for report, processed_data in zip(reports, results):
+        old_row = report_row(report)
+        old_events = set(report.adverse_events or [])
+        updated = False
+        for field in EXTRACTED_FIELDS:
+            value = processed_data.get(field, '')
+            if getattr(report, field) != value:
+                setattr(report, field, value)
+                updated = True
+        report.extractor_version = version
+        if updated:
+            changed.append(report)
+            old_rows.append(old_row)
+            if set(report.adverse_events or []) != old_events:
+                events_changed.append(report)
+
+    with transaction.atomic():
+        _update_rows(reports)
+        if events_changed:
+            ReportAdverseEvent.objects.filter(report_id__in=[report.id for report in events_changed]).delete()
+            add_adverse_event_rows(events_changed)
+        replace_reports(old_rows, changed)
+        sketch_store.replace_reports(old_rows, changed)
+    if changed:
+        # Changed counts cannot be applied incrementally to the signal engine
+        signal_engine.invalidate()
+    return len(changed)
+
+
+def read_checkpoint(path, version: str) -> Optional[Dict[str, Any]]:
+    """The saved progress of an interrupted run for the same extractor version"""
+    try:
+        with open(path, encoding='utf-8') as checkpoint:
+            state = json.load(checkpoint)
+    except (OSError, ValueError):
+        return None
+    return state if state.get('version') == version else None
+
+
+def write_checkpoint(path, state: Dict[str, Any]) -> None:
+    """Atomically replace the checkpoint file"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as checkpoint:
+            json.dump(state, checkpoint)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _chunks(queryset: QuerySet, chunk_size: int, last_id: int):
+    fields = ['id', 'original_report', 'drug_surface', 'extractor_version', *ROLLUP_FIELDS]
+    while True:
+        reports = list(queryset.filter(id__gt=last_id).order_by('id').only(*fields)[:chunk_size])
+        if not reports:
+            return
+        yield reports
+        last_id = reports[-1].id
+
+
+def reprocess_reports(queryset: Optional[QuerySet] = None, executor: Optional[ExtractionExecutor] = None,
+                      chunk_size: int = 2000, checkpoint=None, progress=None) -> Dict[str, Any]:
+    """Re-extract the reports of ``queryset`` (default: the stale ones) chunk by chunk.
+
+    With a ``checkpoint`` path, progress is saved after every chunk and a
+    run for the same extractor version continues after the last saved id;
+    the file is removed when the run completes.
+    """
+    started = time.perf_counter()
+    executor = executor or extraction_executor
+    version = nlp_processor.version
+    queryset = stale_reports(version) if queryset is None else queryset
+
+    state = {'version': version, 'last_id': 0, 'processed': 0, 'changed': 0}
+    if checkpoint:
+        state = read_checkpoint(checkpoint, version) or state
+    resumed_from = state['last_id']
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='reprocess-extract') as extractor:
+        pending = None
+        for reports in _chunks(queryset, chunk_size, state['last_id']):
+            future = extractor.submit(executor.process_reports, [report.original_report for report in reports])
+            if pending is not None:
+                _write_chunk(*pending, state, version, checkpoint, progress)
+            pending = (reports, future)
+        if pending is not None:
+            _write_chunk(*pending, state, version, checkpoint, progress)
+
+    if checkpoint and os.path.exists(checkpoint):
+        os.unlink(checkpoint)
+    return dict(state, resumed_from=resumed_from, seconds=time.perf_counter() - started)
+
+
+def _write_chunk(reports: List[Report], future, state: Dict[str, Any], version: str, checkpoint, progress) -> None:
+    state['changed'] += apply_results(reports, future.result(), version)
+    state['processed'] += len(reports)
+    state['last_id'] = reports[-1].id
+    if checkpoint:
+        write_checkpoint(checkpoint, state)
+    if progress:
+        progress(state)
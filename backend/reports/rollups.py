@@ -0,0 +1,195 @@
+"""
+Analytics rollup tables kept in step with the reports table
+
+Every insert, update and delete of a Report adjusts the matching
+ReportRollup, AdverseEventRollup and TrendRollup rows in the same
+transaction, so the analytics endpoints read a few small tables instead of
+scanning reports. Writes that bypass the ORM hooks (QuerySet.update(), raw
+SQL) must be followed by 'manage.py rebuild_rollups'.
+
+Report and adverse event counts are split by is_representative, so the
+analytics can count each cluster of near-duplicate reports once without
+going back to the reports table. Relinking a report moves it between the
+two (see near_duplicates).
+"""
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Report, ReportRollup, AdverseEventRollup, TrendRollup
+
+ROLLUP_FIELDS = ('created_at', 'drug', 'severity', 'outcome', 'adverse_events', 'duplicate_of_id')
+
+# Each rollup table with the fields that make up its key, in count_rows order
+ROLLUP_TABLES = (
+    (ReportRollup, ('day', 'drug', 'severity', 'outcome', 'is_representative')),
+    (AdverseEventRollup, ('day', 'drug', 'severity', 'outcome', 'is_representative', 'adverse_event')),
+    (TrendRollup, ('interval', 'bucket', 'drug', 'adverse_event')),
+)
+
+
+def rollup_day(created_at) -> date:
+    """Day bucket for a report timestamp, in the project time zone"""
+    if timezone.is_aware(created_at):
+        return timezone.localdate(created_at)
+    return created_at.date()
+
+
+def trend_buckets_for(created_at) -> Tuple[datetime, datetime, datetime]:
+    """Start of the hour, day and week (Monday) containing ``created_at``, in the project time zone"""
+    if timezone.is_aware(created_at):
+        created_at = timezone.localtime(created_at)
+    else:
+        created_at = timezone.make_aware(created_at)
+    hour = created_at.replace(minute=0, second=0, microsecond=0)
+    day = timezone.make_aware(datetime.combine(created_at.date(), time.min))
+    week = timezone.make_aware(datetime.combine(created_at.date() - timedelta(days=created_at.weekday()), time.min))
+    return hour, day, week
+
+
+def count_rows(rows: Iterable[Tuple]) -> List[Counter]:
+    """Count ROLLUP_FIELDS rows into the keys of each rollup table"""
+    report_counts: Counter = Counter()
+    event_counts: Counter = Counter()
+    trend_counts: Counter = Counter()
+    for created_at, drug, severity, outcome, adverse_events, duplicate_of_id in rows:
+        events = set(adverse_events or [])
+        key = (rollup_day(created_at), drug, severity, outcome, duplicate_of_id is None)
+        report_counts[key] += 1
+        for event in events:
+            event_counts[key + (event,)] += 1
+
+        # Trends keep hourly buckets for all drugs, and day/week buckets both
+        # for all drugs (drug '') and per drug; adverse_event '' counts reports
+        hour, day, week = trend_buckets_for(created_at)
+        for interval, bucket, drugs in (('hour', hour, ('',)), ('day', day, ('', drug)), ('week', week, ('', drug))):
+            for trend_drug in drugs:
+                trend_counts[(interval, bucket, trend_drug, '')] += 1
+                for event in events:
+                    trend_counts[(interval, bucket, trend_drug, event)] += 1
+    return [report_counts, event_counts, trend_counts]
+
+
+def report_row(report: Report) -> Tuple:
+    return tuple(getattr(report, field) for field in ROLLUP_FIELDS)
+
+
+def _apply_counts(model, fields: Tuple[str, ...], counts: Dict[tuple, int]) -> None:
+    """Add signed ``counts`` to the rollup rows of ``model``, creating and pruning rows as needed"""
+    counts = {key: delta for key, delta in counts.items() if delta}
+    if not counts:
+        return
+    # Insert-or-ignore then increment, so concurrent writers never collide on the unique key
+    model.objects.bulk_create(
+        [model(**dict(zip(fields, key))) for key, delta in counts.items() if delta > 0],
+        ignore_conflicts=True
+    )
+
+    # One executemany instead of an ORM update() per key; this runs on every report write
+    opts = model._meta
+    columns = [opts.get_field(field) for field in fields]
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    count = quote(opts.get_field('report_count').column)
+    where = ' AND '.join(f'{quote(column.column)} = %s' for column in columns)
+    keys = {
+        key: [column.get_db_prep_value(value, connection) for column, value in zip(columns, key)]
+        for key in counts
+    }
+    # Clamped at zero: a rollup that drifted from the reports (see verify_rollups)
+    # must not make a user's delete fail on the unsigned count
+    update = f'UPDATE {table} SET {count} = CASE WHEN {count} + %s > 0 THEN {count} + %s ELSE 0 END WHERE {where}'
+    # Prune only the keys just decremented, through the unique key index
+    prune = f'DELETE FROM {table} WHERE {count} <= 0 AND {where}'
+    with connection.cursor() as cursor:
+        cursor.executemany(update, [[delta, delta] + keys[key] for key, delta in counts.items()])
+        decremented = [keys[key] for key, delta in counts.items() if delta < 0]
+        if decremented:
+            cursor.executemany(prune, decremented)
+
+
+def _apply_deltas(deltas: List[Dict[tuple, int]]) -> None:
+    with transaction.atomic():
+        for (model, fields), counts in zip(ROLLUP_TABLES, deltas):
+            _apply_counts(model, fields, counts)
+
+
+def apply_rows(rows: Iterable[Tuple], sign: int = 1) -> None:
+    """Add (sign=1) or remove (sign=-1) report rows from the rollups"""
+    _apply_deltas([
+        {key: sign * count for key, count in counts.items()}
+        for counts in count_rows(rows)
+    ])
+
+
+def add_reports(reports: Iterable[Report]) -> None:
+    """Count newly saved reports into the rollups"""
+    apply_rows([report_row(report) for report in reports], 1)
+
+
+def remove_reports(reports: Iterable[Report]) -> None:
+    """Remove deleted reports from the rollups"""
+    apply_rows([report_row(report) for report in reports], -1)
+
+
+def replace_report(old_row: Tuple, report: Report) -> None:
+    """Move an edited report from its old rollup keys to its new ones"""
+    replace_reports([old_row], [report])
+
+
+def replace_reports(old_rows: Sequence[Tuple], reports: Sequence[Report]) -> None:
+    """Move edited reports from their old rollup keys to their new ones"""
+    pairs = [(old_row, report_row(report)) for old_row, report in zip(old_rows, reports)]
+    pairs = [(old_row, new_row) for old_row, new_row in pairs if old_row != new_row]
+    if not pairs:
+        return
+    deltas = []
+    for old_counts, new_counts in zip(count_rows(old for old, _ in pairs), count_rows(new for _, new in pairs)):
+        new_counts.subtract(old_counts)
+        deltas.append(dict(new_counts))
+    _apply_deltas(deltas)
+
+
+def expected_counts(chunk_size: int = 2000) -> List[Counter]:
+    """Recount the rollups from the raw reports table"""
+    rows = Report.objects.order_by().values_list(*ROLLUP_FIELDS).iterator(chunk_size=chunk_size)
+    return count_rows(rows)
+
+
+def stored_counts() -> List[Counter]:
+    """Read the rollups as currently stored"""
+    return [
+        Counter({
+            tuple(row[:-1]): row[-1]
+            for row in model.objects.values_list(*fields, 'report_count').iterator(chunk_size=2000)
+        })
+        for model, fields in ROLLUP_TABLES
+    ]
+
+
+def rebuild_rollups(chunk_size: int = 2000) -> List[int]:
+    """Recompute every rollup table from scratch; returns the number of rows written to each"""
+    all_counts = expected_counts(chunk_size)
+    with transaction.atomic():
+        for (model, fields), counts in zip(ROLLUP_TABLES, all_counts):
+            model.objects.all().delete()
+            model.objects.bulk_create([
+                model(report_count=count, **dict(zip(fields, key)))
+                for key, count in counts.items()
+            ], batch_size=chunk_size)
+    return [len(counts) for counts in all_counts]
+
+
+def verify_rollups(chunk_size: int = 2000) -> List[str]:
+    """Compare the rollups with the raw data; returns a description of each mismatch"""
+    problems = []
+    for (model, fields), expected, stored in zip(ROLLUP_TABLES, expected_counts(chunk_size), stored_counts()):
+        for key in sorted(set(expected) | set(stored), key=str):
+            if expected[key] != stored[key]:
+                problems.append(
+                    f'{model._meta.verbose_name} {key}: expected {expected[key]}, stored {stored[key]}'
+                )
+    return problems
@@ -0,0 +1,249 @@
+"""
+Extraction rule sets loaded from a versioned JSON rules file
+
+The rules file holds the drug lexicons, adverse event synonyms, severity
+and outcome indicators and translation tables. It is compiled once per
+load into the drug extractor and keyword automaton, and the compiled
+RuleSet is never modified afterwards. Each process notices a replaced file
+by its modification time (or a reload signal). The first request to notice
+compiles the new rules while other threads carry on with the old ones, then
+swaps them in with a single reference assignment: extractions already
+running finish with the rules they started with.
+
+Replace the file atomically (write a temporary file, then rename it over
+the old one) so a reader never sees half of it.
+"""
+import json
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .drug_extractor import DrugExtractor
+from .matcher import KeywordMatch, KeywordMatcher
+
+DEFAULT_RULES_PATH = Path(__file__).resolve().parent.parent / 'data' / 'extraction_rules.json'
+
+LEXICONS = ('adverse_events', 'severity_indicators', 'outcome_indicators')
+# Keyword automaton lexicon name of each rules file lexicon
+MATCHER_LEXICONS = {'adverse_events': 'adverse_events', 'severity_indicators': 'severity', 'outcome_indicators': 'outcome'}
+
+
+def _deep_size(root: Any, seen: Set[int]) -> int:
+    """Bytes held by the containers and plain objects reachable from ``root``, skipping ids in ``seen``"""
+    total = 0
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+    return total
+
+
+def _measure(build: Callable[[], Any], shared: Any) -> Tuple[Any, Dict[str, float]]:
+    """Run ``build`` and return its result with the time taken and the size of what it built.
+
+    The size is measured on the result itself, not on the process heap, so
+    a hot reload does not slow down or count the requests running beside it.
+    Objects reachable from ``shared`` (the parsed rules) are not counted.
+    """
+    started = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - started
+    seen: Set[int] = set()
+    _deep_size(shared, seen)
+    return result, {'seconds': seconds, 'bytes': _deep_size(result, seen)}
+
+
+def _string_list(rules: Dict[str, Any], key: str) -> List[str]:
+    value = rules.get(key)
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"'{key}' must be a list of strings")
+    return value
+
+
+def _string_map(rules: Dict[str, Any], key: str, values: str) -> Dict[str, Any]:
+    value = rules.get(key)
+    if not isinstance(value, dict):
+        raise ValueError(f"'{key}' must be an object")
+    for label, entry in value.items():
+        if values == 'lists':
+            valid = isinstance(entry, list) and all(isinstance(item, str) for item in entry)
+        else:
+            valid = isinstance(entry, dict) and all(isinstance(item, str) for item in entry.values())
+        if not valid:
+            kind = 'a list of strings' if values == 'lists' else 'an object of strings'
+            raise ValueError(f"'{key}.{label}' must be {kind}")
+    return value
+
+
+class RuleSet:
+    """Compiled extraction rules; read-only once built"""
+
+    def __init__(self, rules: Dict[str, Any], source: str = ''):
+        """Validate and compile a parsed rules file"""
+        if not isinstance(rules, dict):
+            raise ValueError('The rules file must contain a JSON object')
+        self.version = str(rules.get('version', ''))
+        if not self.version:
+            raise ValueError("The rules file needs a 'version'")
+        self.source = source
+        self.known_drugs = _string_list(rules, 'known_drugs')
+        self.dosage_forms = _string_list(rules, 'dosage_forms')
+        self.adverse_events = _string_map(rules, 'adverse_events', 'lists')
+        self.severity_indicators = _string_map(rules, 'severity_indicators', 'lists')
+        self.outcome_indicators = _string_map(rules, 'outcome_indicators', 'lists')
+        self.translations = {
+            language.lower(): {word.lower(): translation for word, translation in table.items()}
+            for language, table in _string_map(rules, 'translations', 'maps').items()
+        }
+
+        self.drug_extractor, drug_stats = _measure(
+            lambda: DrugExtractor(self.known_drugs, self.dosage_forms), rules
+        )
+        (self.keyword_matcher, self.keyword_words), keyword_stats = _measure(self._compile_keywords, rules)
+        self.compile_stats = {
+            'drug_patterns': drug_stats,
+            'keywords': keyword_stats,
+            'seconds': drug_stats['seconds'] + keyword_stats['seconds'],
+            'bytes': drug_stats['bytes'] + keyword_stats['bytes'],
+        }
+
+    def _compile_keywords(self) -> Tuple[KeywordMatcher, set]:
+        matcher = KeywordMatcher({
+            MATCHER_LEXICONS[lexicon]: getattr(self, lexicon) for lexicon in LEXICONS
+        })
+        # Lexicon words that the fuzzy drug scan must never rewrite into drug names
+        words = {
+            word
+            for lexicon in LEXICONS
+            for keywords in getattr(self, lexicon).values()
+            for keyword in keywords
+            for word in keyword.split()
+        }
+        return matcher, words
+
+    def fingerprint_fields(self) -> Dict[str, Any]:
+        """The rules that determine extraction results, for the extractor version"""
+        return {
+            'adverse_events': self.adverse_events,
+            'severity': self.severity_indicators,
+            'outcome': self.outcome_indicators,
+            'known_drugs': self.known_drugs,
+            'dosage_forms': self.dosage_forms,
+        }
+
+    def match_keywords(self, text: str) -> List[KeywordMatch]:
+        return self.keyword_matcher.find_all(text)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'version': self.version,
+            'compile_ms': round(self.compile_stats['seconds'] * 1000, 2),
+            'memory_bytes': self.compile_stats['bytes'],
+        }
+
+
+def load_rules(path) -> RuleSet:
+    """Read, validate and compile a rules file"""
+    with open(path, encoding='utf-8') as rules_file:
+        rules = json.load(rules_file)
+    return RuleSet(rules, source=str(path))
+
+
+class RuleStore:
+    """The current RuleSet of this process, reloaded when the rules file changes"""
+
+    def __init__(self, path_getter: Callable[[], str], check_interval: Callable[[], float]):
+        self._path_getter = path_getter
+        self._check_interval = check_interval
+        self._rules: Optional[RuleSet] = None
+        self._key = None
+        self._checked_at = 0.0
+        self._reload_requested = False
+        self._load_lock = threading.Lock()
+        self.last_error: Optional[str] = None
+
+    @property
+    def path(self) -> Path:
+        return Path(self._path_getter())
+
+    def _file_key(self) -> Optional[tuple]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def current(self) -> RuleSet:
+        """The rules to use for one extraction; cheap except when a reload is due"""
+        rules = self._rules
+        if rules is None:
+            with self._load_lock:
+                if self._rules is None:
+                    # Nothing to fall back on, so a broken rules file fails loudly here
+                    self._load(self._file_key(), raise_errors=True)
+                return self._rules
+
+        now = time.monotonic()
+        if self._reload_requested or now - self._checked_at >= self._check_interval():
+            self._checked_at = now
+            key = self._file_key()
+            if (self._reload_requested or key != self._key) and self._load_lock.acquire(blocking=False):
+                # Other threads keep extracting with the old rules meanwhile
+                try:
+                    self._reload_requested = False
+                    self._load(key, raise_errors=False)
+                finally:
+                    self._load_lock.release()
+        return self._rules
+
+    def _load(self, key: Optional[tuple], raise_errors: bool) -> None:
+        path = self.path
+        try:
+            rules = load_rules(path)
+        except (OSError, ValueError) as e:
+            self.last_error = f'{path}: {e}'
+            if raise_errors:
+                raise
+            # Keep the working rules; try again when the file changes
+            self._key = key
+            print(f"Warning: could not reload extraction rules, keeping version {self._rules.version}: {e}")
+            return
+
+        self._rules = rules
+        self._key = key
+        self.last_error = None
+        stats = rules.compile_stats
+        print(
+            f"Loaded extraction rules {rules.version} from {path}: compiled in "
+            f"{stats['seconds'] * 1000:.1f} ms, {stats['bytes'] / 1024:.1f} KiB"
+        )
+
+    def request_reload(self, *args) -> None:
+        """Reload the rules file on next use, even if it looks unchanged; usable as a signal handler"""
+        self._reload_requested = True
+
+    def install_reload_signal(self, name: str) -> None:
+        """Reload on the named signal (e.g. 'SIGUSR2'); call from the main thread"""
+        signal.signal(getattr(signal, name), self.request_reload)
+
+    def status(self) -> Dict[str, Any]:
+        rules = self._rules
+        return {
+            'loaded': rules is not None,
+            'path': str(self.path),
+            'error': self.last_error,
+            **(rules.status() if rules else {}),
+        }
@@ -0,0 +1,174 @@
+"""
+Full-text search over report narratives with an SQLite FTS5 index
+
+reports_report_fts is an external-content FTS5 table over the report text
+and drug columns. Triggers on reports_report keep it in step with every
+write, including bulk_create() and QuerySet.update(). Django rebuilds a
+SQLite table (dropping its triggers) when some migrations alter it, so the
+triggers are re-created after every migrate; 'manage.py rebuild_search_index'
+re-indexes from scratch.
+"""
+import html
+import re
+from typing import Any, Dict, List, Optional
+
+from django.db import connection
+from django.db.models import QuerySet
+from django.db.models.expressions import RawSQL
+
+from .models import Report
+
+FTS_TABLE = 'reports_report_fts'
+
+# Columns of the index, in order; snippets are cut from the first one
+FTS_COLUMNS = ('original_report', 'drug', 'drug_surface')
+
+SNIPPET_TOKENS = 16
+
+FTS_TRIGGERS = {
+    'reports_report_fts_insert': (
+        "AFTER INSERT ON reports_report BEGIN "
+        "INSERT INTO {table}(rowid, {columns}) VALUES (new.id, {new}); END"
+    ),
+    'reports_report_fts_delete': (
+        "AFTER DELETE ON reports_report BEGIN "
+        "INSERT INTO {table}({table}, rowid, {columns}) VALUES ('delete', old.id, {old}); END"
+    ),
+    'reports_report_fts_update': (
+        "AFTER UPDATE OF {columns} ON reports_report BEGIN "
+        "INSERT INTO {table}({table}, rowid, {columns}) VALUES ('delete', old.id, {old}); "
+        "INSERT INTO {table}(rowid, {columns}) VALUES (new.id, {new}); END"
+    ),
+}
+
+# Private-use characters mark matches so the snippet can be HTML-escaped afterwards
+_MATCH_START, _MATCH_END = '\ue000', '\ue001'
+
+_QUERY_TERM = re.compile(r'"([^"]*)"|([^\W_]+)(\*?)')
+
+
+def fts_available(using=None) -> bool:
+    return (using or connection).vendor == 'sqlite'
+
+
+def _trigger_sql(name: str) -> str:
+    return f'CREATE TRIGGER IF NOT EXISTS {name} ' + FTS_TRIGGERS[name].format(
+        table=FTS_TABLE,
+        columns=', '.join(FTS_COLUMNS),
+        new=', '.join(f'new.{column}' for column in FTS_COLUMNS),
+        old=', '.join(f'old.{column}' for column in FTS_COLUMNS),
+    )
+
+
+def install_search_index(using=None, rebuild: bool = False, create: bool = True) -> bool:
+    """Create the FTS table and its triggers if missing; returns True if the index was (re)built.
+
+    A missing trigger means writes may have gone unindexed, so the index is
+    rebuilt from the reports table in that case too. With ``create=False``
+    nothing happens unless the FTS table already exists.
+    """
+    using = using or connection
+    if not fts_available(using):
+        return False
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name IN (%s)"
+            % ', '.join(['%s'] * (len(FTS_TRIGGERS) + 1)),
+            [FTS_TABLE, *FTS_TRIGGERS]
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE not in existing and not create:
+            return False
+        if FTS_TABLE not in existing:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({', '.join(FTS_COLUMNS)}, "
+                "content='reports_report', content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')"
+            )
+        for name in FTS_TRIGGERS:
+            cursor.execute(_trigger_sql(name))
+        rebuild = rebuild or existing != {FTS_TABLE, *FTS_TRIGGERS}
+        if rebuild:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return rebuild
+
+
+def drop_search_index(using=None) -> None:
+    using = using or connection
+    if not fts_available(using):
+        return
+    with using.cursor() as cursor:
+        for name in FTS_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def fts_query(query: str) -> str:
+    """Turn free text into a safe FTS5 query.
+
+    Every word must match; "quoted phrases" match as a phrase and a trailing
+    * makes a word a prefix. Any other FTS5 syntax is treated as plain text.
+    Raises ValueError if nothing searchable is left.
+    """
+    terms = []
+    for phrase, word, prefix in _QUERY_TERM.findall(query):
+        words = [word] if word else re.findall(r'[^\W_]+', phrase)
+        if words:
+            terms.append('"{}"{}'.format(' '.join(words), prefix))
+    if not terms:
+        raise ValueError('Search query must contain at least one word')
+    return ' '.join(terms)
+
+
+def matching_ids(query: str) -> RawSQL:
+    """Subquery of the ids of reports matching ``query``, for use in ``id__in`` filters"""
+    return RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [fts_query(query)])
+
+
+def _snippet(text: str) -> str:
+    escaped = html.escape(text, quote=False)
+    return escaped.replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>')
+
+
+def search_reports(query: str, queryset: Optional[QuerySet] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """Best matches for ``query`` within ``queryset``, as report, score and snippet.
+
+    Scores are negated BM25, so higher is better. Snippets are HTML-escaped
+    with matches wrapped in <mark> tags.
+    """
+    match = fts_query(query)
+    if not fts_available():
+        return _search_without_index(match, queryset, limit)
+
+    sql = (
+        f'SELECT {FTS_TABLE}.rowid, bm25({FTS_TABLE}), '
+        f"snippet({FTS_TABLE}, 0, %s, %s, '…', %s) "
+        f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+    )
+    params = [_MATCH_START, _MATCH_END, SNIPPET_TOKENS, match]
+    if queryset is not None and queryset.query.where:
+        subquery, subquery_params = queryset.order_by().values('id').query.sql_with_params()
+        sql += f' AND {FTS_TABLE}.rowid IN ({subquery})'
+        params.extend(subquery_params)
+    sql += f' ORDER BY bm25({FTS_TABLE}) LIMIT %s'
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    reports = Report.objects.in_bulk([row[0] for row in rows])
+    return [
+        {'report': reports[report_id], 'score': round(-rank, 4), 'snippet': _snippet(snippet)}
+        for report_id, rank, snippet in rows
+        if report_id in reports
+    ]
+
+
+def _search_without_index(match: str, queryset: Optional[QuerySet], limit: int) -> List[Dict[str, Any]]:
+    """Unranked substring search for databases without FTS5"""
+    queryset = Report.objects.all() if queryset is None else queryset
+    for term in re.findall(r'"([^"]*)"', match):
+        queryset = queryset.filter(original_report__icontains=term)
+    return [
+        {'report': report, 'score': None, 'snippet': html.escape(report.original_report[:200], quote=False)}
+        for report in queryset.order_by('-created_at', '-id')[:limit]
+    ]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Report
+from .models import Report, ProcessingJob
 
 
 class ReportSerializer(serializers.ModelSerializer):
@@ -8,10 +8,10 @@ class ReportSerializer(serializers.ModelSerializer):
     class Meta:
         model = Report
         fields = [
-            'id', 'original_report', 'drug', 'adverse_events', 
-            'severity', 'outcome', 'created_at'
+            'id', 'original_report', 'drug', 'drug_surface', 'adverse_events', 
+            'severity', 'outcome', 'created_at', 'duplicate_of', 'duplicate_similarity', 'extractor_version'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'created_at', 'duplicate_of', 'duplicate_similarity', 'extractor_version']
 
 
 class ProcessReportSerializer(serializers.Serializer):
@@ -22,9 +22,20 @@ class ProcessReportSerializer(serializers.Serializer):
     )
 
 
+class ProcessReportBatchSerializer(serializers.Serializer):
+    """Serializer for batch processing requests"""
+    reports = serializers.ListField(
+        child=serializers.CharField(max_length=10000),
+        allow_empty=False,
+        max_length=1000,
+        help_text="Medical report texts to process"
+    )
+
+
 class ReportResponseSerializer(serializers.Serializer):
     """Serializer for processed report responses"""
     drug = serializers.CharField(max_length=255)
+    drug_surface = serializers.CharField(max_length=255, allow_blank=True, required=False)
     adverse_events = serializers.ListField(
         child=serializers.CharField(max_length=100)
     )
@@ -45,3 +56,15 @@ class TranslationResponseSerializer(serializers.Serializer):
     translated_text = serializers.CharField(max_length=500)
     original_text = serializers.CharField(max_length=500)
     target_language = serializers.CharField(max_length=20)
+
+
+class ProcessingJobSerializer(serializers.ModelSerializer):
+    """Serializer for asynchronous processing job status"""
+    
+    class Meta:
+        model = ProcessingJob
+        fields = [
+            'id', 'status', 'result', 'error', 'report',
+            'attempts', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
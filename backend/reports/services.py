@@ -0,0 +1,59 @@
+"""
+Persistence helpers shared by the API views and background workers
+"""
+from typing import Any, Dict, Iterable, List, Sequence
+
+from django.db import transaction
+
+from .cache import text_digest
+from .models import Report, ReportAdverseEvent
+from .near_duplicates import index_reports
+from .nlp_processor import nlp_processor
+from .rollups import add_reports
+from .similarity import similarity_index
+from .sketches import sketch_store
+
+
+def build_report(report_text: str, processed_data: Dict[str, Any]) -> Report:
+    """Build an unsaved Report from a text and its extracted data"""
+    return Report(
+        original_report=report_text,
+        content_hash=text_digest(report_text),
+        drug=processed_data['drug'],
+        drug_surface=processed_data.get('drug_surface', ''),
+        adverse_events=processed_data['adverse_events'],
+        severity=processed_data['severity'],
+        outcome=processed_data['outcome'],
+        extractor_version=nlp_processor.version
+    )
+
+
+def add_adverse_event_rows(reports: Iterable[Report]) -> None:
+    """Insert the normalised adverse event rows of saved reports"""
+    ReportAdverseEvent.objects.bulk_create([
+        ReportAdverseEvent(report_id=report.id, event=event)
+        for report in reports
+        for event in set(report.adverse_events or [])
+    ], batch_size=2000)
+
+
+def sync_adverse_event_rows(report: Report) -> None:
+    """Replace the normalised adverse event rows of an edited report"""
+    ReportAdverseEvent.objects.filter(report_id=report.id).delete()
+    add_adverse_event_rows([report])
+
+
+def create_reports(report_texts: Sequence[str], processed_reports: Sequence[Dict[str, Any]]) -> List[Report]:
+    """Save reports with a single bulk insert and update the derived tables in the same transaction"""
+    with transaction.atomic():
+        reports = Report.objects.bulk_create([
+            build_report(text, processed_data)
+            for text, processed_data in zip(report_texts, processed_reports)
+        ])
+        # bulk_create sends no post_save signals, so update the derived tables here
+        add_adverse_event_rows(reports)
+        index_reports(reports)
+        add_reports(reports)
+        sketch_store.add_reports(reports)
+        similarity_index.add_reports(reports)
+        return reports
@@ -0,0 +1,74 @@
+"""
+Keep the analytics rollups, adverse event rows, near-duplicate and similarity indexes in
+step with single-row saves and deletes
+
+Bulk inserts go through services.create_reports, which updates them itself
+because bulk_create does not send these signals. Adverse event rows of
+deleted reports go with them through the foreign key cascade.
+"""
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .disproportionality import signal_engine
+from .models import Report
+from .near_duplicates import index_reports, reindex_orphans, reindex_report
+from .rollups import ROLLUP_FIELDS, add_reports, remove_reports, replace_report, report_row
+from .similarity import similarity_index
+from .services import add_adverse_event_rows, sync_adverse_event_rows
+from .sketches import sketch_store
+
+
+@receiver(pre_save, sender=Report)
+def remember_rollup_row(sender, instance, **kwargs):
+    """Record the stored values of an existing report before it is overwritten"""
+    instance._rollup_row = None
+    instance._old_content_hash = None
+    if instance.pk is not None:
+        row = Report.objects.filter(pk=instance.pk).values_list(*ROLLUP_FIELDS, 'content_hash').first()
+        if row is not None:
+            instance._rollup_row, instance._old_content_hash = row[:-1], row[-1]
+
+
+@receiver(post_save, sender=Report)
+def update_rollups_on_save(sender, instance, **kwargs):
+    """Count a new report, or move an edited one between rollup keys"""
+    old_row = getattr(instance, '_rollup_row', None)
+    if old_row is None:
+        add_adverse_event_rows([instance])
+        index_reports([instance])
+        add_reports([instance])
+        sketch_store.add_reports([instance])
+        similarity_index.add_reports([instance])
+    else:
+        events_changed = set(old_row[ROLLUP_FIELDS.index('adverse_events')] or []) != set(instance.adverse_events or [])
+        if events_changed:
+            sync_adverse_event_rows(instance)
+        if instance._old_content_hash != instance.content_hash:
+            reindex_report(instance)
+            similarity_index.add_reports([instance])
+        replace_report(old_row, instance)
+        if old_row != report_row(instance):
+            sketch_store.replace_reports([old_row], [instance])
+        # Edits cannot be applied incrementally to the signal counts, which only use drug and events
+        if events_changed or old_row[ROLLUP_FIELDS.index('drug')] != instance.drug:
+            signal_engine.invalidate()
+    instance._rollup_row = None
+
+
+@receiver(pre_delete, sender=Report)
+def remember_near_duplicates(sender, instance, **kwargs):
+    """Record the near-duplicates of a representative before SET_NULL unlinks them"""
+    instance._near_duplicate_ids = []
+    if instance.duplicate_of_id is None:
+        instance._near_duplicate_ids = list(instance.near_duplicates.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Report)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    """Remove a deleted report from the rollups and re-cluster its near-duplicates"""
+    remove_reports([instance])
+    sketch_store.remove_reports([instance])
+    similarity_index.remove_reports([instance])
+    signal_engine.invalidate()
+    if getattr(instance, '_near_duplicate_ids', None):
+        reindex_orphans(instance._near_duplicate_ids, instance.id)
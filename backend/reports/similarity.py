@@ -0,0 +1,561 @@
+"""
+"More like this" search over report narratives with a hashed TF-IDF index
+
+Words and word pairs of each narrative are hashed into 2**18 features and
+weighted by sublinear term frequency times inverse document frequency. Each
+report vector is L2-normalised and cut to its MAX_DOC_FEATURES strongest
+features, so the cosine similarity of two reports is the dot product of
+their vectors.
+
+The vectors are stored as an inverted index: for every feature, the reports
+containing it and their weights. The compiled index is one file of flat
+arrays which is memory-mapped read-only, so a query only touches the
+postings of its own (at most MAX_QUERY_TERMS) features and never reads the
+narratives of other reports.
+
+Reports saved after the last build are appended to a small delta log next
+to the index, which every process reads incrementally; deleted reports are
+appended as empty tombstone records. ``manage.py build_similarity_index``
+folds the log back into a freshly compiled index.
+"""
+import glob
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db import transaction
+
+from .nlp_processor import get_setting
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock around a rebuild's swap
+    fcntl = None
+
+MAGIC = b'SIM1'
+# magic, generation, feature bits, document count, posting count, highest indexed report id
+HEADER = struct.Struct('=4sIIIQQ')
+# report id, feature count; followed by the uint32 features and float16 weights
+RECORD = struct.Struct('=II')
+
+FEATURE_BITS = 18
+NUM_FEATURES = 1 << FEATURE_BITS
+TOKEN_PATTERN = re.compile(r'\w\w+')
+
+# Strongest features kept per report vector
+MAX_DOC_FEATURES = 256
+# Strongest features of the query report whose postings are scanned
+MAX_QUERY_TERMS = 32
+# Features found in more than this share of reports are too common to be worth scanning...
+MAX_POSTINGS_SHARE = 0.2
+# ...unless their postings list is this short anyway
+MIN_POSTINGS_SCAN = 10000
+
+MAX_K = 100
+
+
+def _records(data: bytes, position: int = 0) -> Iterable[Tuple[int, int, np.ndarray, np.ndarray]]:
+    """(end offset, report id, features, weights) of each complete delta log record in ``data``"""
+    while position + RECORD.size <= len(data):
+        report_id, length = RECORD.unpack_from(data, position)
+        end = position + RECORD.size + length * 6
+        if end > len(data):
+            # A record still being written; read it next time
+            return
+        features = np.frombuffer(data, dtype=np.uint32, count=length, offset=position + RECORD.size)
+        weights = np.frombuffer(data, dtype=np.float16, count=length, offset=position + RECORD.size + length * 4)
+        yield end, report_id, features, weights
+        position = end
+
+
+def term_frequencies(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted unique hashed word and word-pair features of ``text`` and their sublinear term frequencies"""
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    terms = tokens + [f'{first} {second}' for first, second in zip(tokens, tokens[1:])]
+    hashed = np.fromiter((zlib.crc32(term.encode('utf-8')) for term in terms), dtype=np.uint32, count=len(terms))
+    features, counts = np.unique(hashed & np.uint32(NUM_FEATURES - 1), return_counts=True)
+    return features, (1 + np.log(counts)).astype(np.float32)
+
+
+def inverse_document_frequency(df: np.ndarray, documents: int) -> np.ndarray:
+    """Smoothed idf, so features seen in every report still get a small positive weight"""
+    return (np.log((1 + documents) / (1 + df.astype(np.float64))) + 1).astype(np.float32)
+
+
+def weigh(features: np.ndarray, tfs: np.ndarray, lengths: np.ndarray,
+          idf: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Normalised TF-IDF weights of a batch of concatenated term vectors.
+
+    Returns (document, feature, weight) arrays ordered by document and then
+    by descending weight, keeping at most MAX_DOC_FEATURES per document.
+    """
+    documents = np.repeat(np.arange(lengths.size), lengths)
+    weights = tfs * idf[features]
+    norms = np.sqrt(np.bincount(documents, weights=weights * weights, minlength=lengths.size))
+    weights = weights / np.maximum(norms, 1e-12)[documents]
+
+    order = np.lexsort((-weights, documents))
+    documents, features, weights = documents[order], features[order], weights[order]
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    keep = np.arange(documents.size) - starts[documents] < MAX_DOC_FEATURES
+    return documents[keep], features[keep], weights[keep].astype(np.float32)
+
+
+class _Postings:
+    """Postings of delta-log reports, grown in place as the log is read"""
+
+    def __init__(self):
+        self.report_ids = array('I')
+        self.df = np.zeros(NUM_FEATURES, dtype=np.uint32)
+        self.features: Dict[int, Tuple[array, array]] = {}
+        # Older copies of reports that were appended again after an edit
+        self.superseded = set()
+        self.latest: Dict[int, int] = {}
+        # Reports whose latest record is a deletion tombstone
+        self.tombstones = set()
+
+    def add(self, report_id: int, features: np.ndarray, weights: np.ndarray) -> None:
+        document = len(self.report_ids)
+        self.report_ids.append(report_id)
+        if report_id in self.latest:
+            self.superseded.add(self.latest[report_id])
+        self.latest[report_id] = document
+        if features.size:
+            self.tombstones.discard(report_id)
+        else:
+            self.tombstones.add(report_id)
+        self.df[features] += 1
+        for feature, weight in zip(features.tolist(), weights.tolist()):
+            postings = self.features.get(feature)
+            if postings is None:
+                postings = self.features[feature] = (array('I'), array('f'))
+            postings[0].append(document)
+            postings[1].append(weight)
+
+    def postings(self, feature: int) -> Tuple[np.ndarray, np.ndarray]:
+        documents, weights = self.features.get(feature, ((), ()))
+        return np.array(documents, dtype=np.int64), np.array(weights, dtype=np.float32)
+
+
+class SimilarityIndex:
+    """Compiled similarity index plus its delta log, reloaded when either changes on disk"""
+
+    def __init__(self, path=None):
+        self._path = path
+        self._lock = threading.RLock()
+        self._key = None
+        self._reset_empty()
+
+    @property
+    def path(self) -> Path:
+        default = Path(__file__).resolve().parent.parent / 'data' / 'similarity.idx'
+        return Path(self._path or get_setting('SIMILARITY_INDEX_PATH', str(default)))
+
+    def delta_path(self, generation: int) -> Path:
+        return self.path.with_name(f'{self.path.name}.{generation}.delta')
+
+    @contextmanager
+    def _log_lock(self, exclusive: bool = False):
+        """Lock shared by delta log writers, and taken exclusively by a rebuild to swap in the new index.
+
+        A writer reads the generation and appends to its log under the lock,
+        so it never appends to a log the rebuild has already read.
+        """
+        if fcntl is None:
+            yield
+            return
+        path = self.path.with_name(f'{self.path.name}.lock')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
+    def _reset_empty(self) -> None:
+        self.generation = 0
+        self.max_report_id = 0
+        self._mmap = None
+        self._offsets = np.zeros(NUM_FEATURES + 1, dtype=np.uint64)
+        self._df = np.zeros(NUM_FEATURES, dtype=np.uint32)
+        self._report_ids = np.zeros(0, dtype=np.uint32)
+        self._documents = np.zeros(0, dtype=np.uint32)
+        self._weights = np.zeros(0, dtype=np.float16)
+        self._reset_delta()
+
+    def _reset_delta(self) -> None:
+        self._delta = _Postings()
+        self._delta_offset = 0
+        # Indexed reports that have a newer copy in the delta log
+        self._overridden = np.zeros(self._report_ids.size, dtype=bool)
+
+    def _open(self) -> None:
+        """Memory-map the compiled index; no per-posting work happens here"""
+        path = self.path
+        with open(path, 'rb') as index:
+            self._mmap = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, generation, feature_bits, doc_count, posting_count, max_report_id = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a report similarity index')
+        if feature_bits != FEATURE_BITS:
+            raise ValueError(f'{path} was built with {feature_bits} feature bits; rebuild it')
+
+        offset = HEADER.size
+
+        def section(dtype, length):
+            nonlocal offset
+            data = np.frombuffer(self._mmap, dtype=dtype, count=length, offset=offset)
+            offset += data.nbytes
+            return data
+
+        self._offsets = section(np.uint64, NUM_FEATURES + 1)
+        self._df = section(np.uint32, NUM_FEATURES)
+        self._report_ids = section(np.uint32, doc_count)
+        self._documents = section(np.uint32, posting_count)
+        self._weights = section(np.float16, posting_count)
+        self.generation = generation
+        self.max_report_id = max_report_id
+        self._reset_delta()
+
+    def _refresh(self) -> None:
+        """Reopen the index if it was rebuilt, then read records appended to the delta log since the last call"""
+        try:
+            stat = self.path.stat()
+            key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            key = None
+        if key != self._key:
+            self._key = key
+            if key is None:
+                self._reset_empty()
+            else:
+                self._open()
+
+        try:
+            with open(self.delta_path(self.generation), 'rb') as log:
+                log.seek(self._delta_offset)
+                data = log.read()
+        except FileNotFoundError:
+            return
+
+        position = 0
+        for position, report_id, features, weights in _records(data):
+            self._delta.add(report_id, features, weights)
+            self._override(report_id)
+        self._delta_offset += position
+
+    def _override(self, report_id: int) -> None:
+        if report_id > self.max_report_id:
+            return
+        i = np.searchsorted(self._report_ids, report_id)
+        if i < self._report_ids.size and self._report_ids[i] == report_id:
+            self._overridden[i] = True
+
+    @property
+    def report_count(self) -> int:
+        live_delta = len(self._delta.latest) - len(self._delta.tombstones)
+        return int(self._report_ids.size - self._overridden.sum()) + live_delta
+
+    def idf(self) -> np.ndarray:
+        return inverse_document_frequency(self._df + self._delta.df, self.report_count)
+
+    def add_rows(self, rows: Sequence[Tuple[int, str]]) -> None:
+        """Append (report id, text) rows to the delta log of the current index"""
+        if not rows:
+            return
+        with self._lock, self._log_lock():
+            self._refresh()
+            terms = [term_frequencies(text) for _, text in rows]
+            lengths = np.array([features.size for features, _ in terms], dtype=np.int64)
+            documents, features, weights = weigh(
+                np.concatenate([features for features, _ in terms]),
+                np.concatenate([tfs for _, tfs in terms]),
+                lengths,
+                self.idf()
+            )
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(documents, minlength=len(rows)))])
+
+            chunks = []
+            for i, (report_id, _) in enumerate(rows):
+                start, end = bounds[i], bounds[i + 1]
+                chunks.append(RECORD.pack(report_id, end - start))
+                chunks.append(features[start:end].astype('<u4').tobytes())
+                chunks.append(weights[start:end].astype('<f2').tobytes())
+
+            self._append(b''.join(chunks))
+
+    def remove_rows(self, report_ids: Iterable[int]) -> None:
+        """Append tombstones for deleted reports to the delta log of the current index"""
+        records = b''.join(RECORD.pack(report_id, 0) for report_id in report_ids)
+        if not records:
+            return
+        with self._lock, self._log_lock():
+            self._refresh()
+            self._append(records)
+
+    def _append(self, records: bytes) -> None:
+        path = self.delta_path(self.generation)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # One O_APPEND write per batch, so concurrent writers never interleave records
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, records)
+        finally:
+            os.close(fd)
+
+    def _on_commit(self, update, argument) -> None:
+        def apply():
+            try:
+                update(argument)
+            except OSError as e:
+                print(f"Warning: could not update the similarity index: {e}")
+
+        transaction.on_commit(apply)
+
+    def add_reports(self, reports) -> None:
+        """Index saved reports once their transaction commits"""
+        self._on_commit(self.add_rows, [(report.id, report.original_report) for report in reports])
+
+    def remove_reports(self, reports) -> None:
+        """Drop deleted reports from search results once their transaction commits"""
+        self._on_commit(self.remove_rows, [report.id for report in reports])
+
+    def _scores(self, offsets, documents, weights, query_features, query_weights) -> np.ndarray:
+        """Dot products of the query with every document that shares a scanned feature"""
+        matched, contributions = [], []
+        for feature, query_weight in zip(query_features.tolist(), query_weights.tolist()):
+            if offsets is None:
+                posting_documents, posting_weights = self._delta.postings(feature)
+            else:
+                start, end = int(offsets[feature]), int(offsets[feature + 1])
+                posting_documents, posting_weights = documents[start:end], weights[start:end]
+            matched.append(posting_documents)
+            contributions.append(posting_weights.astype(np.float32) * query_weight)
+        if not matched:
+            return np.zeros(0, dtype=np.float64)
+        return np.bincount(np.concatenate(matched), weights=np.concatenate(contributions))
+
+    def similar(self, text: str, k: int = 10, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(report id, cosine similarity) of the ``k`` indexed reports most similar to ``text``"""
+        features, tfs = term_frequencies(text)
+        if not features.size:
+            return []
+
+        with self._lock:
+            self._refresh()
+            documents = self.report_count
+            df = self._df[features].astype(np.int64) + self._delta.df[features]
+            weights = tfs * inverse_document_frequency(df, documents)
+            weights /= np.linalg.norm(weights)
+
+            # Strongest features first; very common ones add little score for a long scan
+            scannable = (df <= max(MAX_POSTINGS_SHARE * documents, MIN_POSTINGS_SCAN)) & (df > 0)
+            order = [i for i in np.argsort(-weights, kind='stable') if scannable[i]][:MAX_QUERY_TERMS]
+            query_features, query_weights = features[order], weights[order]
+
+            base = self._scores(self._offsets, self._documents, self._weights, query_features, query_weights)
+            base_ids = self._report_ids[:base.size].astype(np.int64)
+            base_live = (base > 0) & ~self._overridden[:base.size]
+
+            delta = self._scores(None, None, None, query_features, query_weights)
+            delta_ids = np.array(self._delta.report_ids, dtype=np.int64)[:delta.size]
+            delta_live = delta > 0
+            if self._delta.superseded:
+                delta_live[[i for i in self._delta.superseded if i < delta.size]] = False
+
+        report_ids = np.concatenate([base_ids[base_live], delta_ids[delta_live]])
+        scores = np.concatenate([base[base_live], delta[delta_live]])
+        if exclude is not None:
+            keep = report_ids != exclude
+            report_ids, scores = report_ids[keep], scores[keep]
+        if scores.size > k:
+            top = np.argpartition(-scores, k)[:k]
+            report_ids, scores = report_ids[top], scores[top]
+        order = np.lexsort((report_ids, -scores))
+        return [(int(report_ids[i]), min(float(scores[i]), 1.0)) for i in order]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._refresh()
+            return {
+                'generation': self.generation,
+                'indexed_reports': int(self._report_ids.size),
+                'postings': int(self._documents.size),
+                'delta_reports': len(self._delta.report_ids),
+                'bytes': self.path.stat().st_size if self._key else 0,
+            }
+
+
+def _logged_report_ids(path: Path, offset: int) -> set:
+    """Report ids of the records appended to a delta log after ``offset``"""
+    try:
+        with open(path, 'rb') as log:
+            log.seek(offset)
+            data = log.read()
+    except FileNotFoundError:
+        return set()
+    return {report_id for _, report_id, _, _ in _records(data)}
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _chunks_from_db(chunk_size: int, last_id: int = 0) -> Iterable[List[Tuple[int, str]]]:
+    from .models import Report
+
+    while True:
+        rows = list(
+            Report.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'original_report')[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def build_index(index: SimilarityIndex, chunk_size: int = 5000, progress=None) -> Dict[str, float]:
+    """Compile every stored report into a new index and swap it in atomically.
+
+    The reports are read once. Their term vectors are spooled to a temporary
+    file while document frequencies are counted; the spool is then read
+    twice, to count the postings of each feature and to place every posting
+    directly at its final offset in the output file.
+
+    Reports saved, edited or deleted while the build ran were logged to the
+    old delta log, possibly after they were read. The part of that log
+    written during the build is read under the exclusive log lock as the new
+    index is swapped in, and those reports are indexed again (or tombstoned)
+    in the new log from their current rows.
+    """
+    started = time.perf_counter()
+    path = index.path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with index._lock:
+        index._refresh()
+        generation = index.generation + 1
+        old_log = index.delta_path(index.generation)
+        # Everything logged before this point is already in the rows the build reads
+        old_log_start = _file_size(old_log)
+
+    df = np.zeros(NUM_FEATURES, dtype=np.int64)
+    report_ids = array('I')
+    with tempfile.TemporaryFile(dir=path.parent) as spool:
+        for rows in _chunks_from_db(chunk_size):
+            terms = [term_frequencies(text) for _, text in rows]
+            features = np.concatenate([features for features, _ in terms])
+            np.array([len(rows), features.size], dtype=np.uint64).tofile(spool)
+            np.array([features.size for features, _ in terms], dtype=np.uint32).tofile(spool)
+            features.tofile(spool)
+            np.concatenate([tfs for _, tfs in terms]).tofile(spool)
+            df += np.bincount(features, minlength=NUM_FEATURES)
+            report_ids.extend(report_id for report_id, _ in rows)
+            if progress:
+                progress(len(report_ids))
+
+        idf = inverse_document_frequency(df, len(report_ids))
+
+        def weighed_chunks():
+            spool.seek(0)
+            first = 0
+            while True:
+                sizes = np.fromfile(spool, dtype=np.uint64, count=2)
+                if not sizes.size:
+                    return
+                documents, terms = int(sizes[0]), int(sizes[1])
+                lengths = np.fromfile(spool, dtype=np.uint32, count=documents).astype(np.int64)
+                features = np.fromfile(spool, dtype=np.uint32, count=terms)
+                tfs = np.fromfile(spool, dtype=np.float32, count=terms)
+                chunk_documents, chunk_features, weights = weigh(features, tfs, lengths, idf)
+                yield chunk_documents + first, chunk_features, weights
+                first += documents
+
+        counts = np.zeros(NUM_FEATURES, dtype=np.int64)
+        for _, features, _ in weighed_chunks():
+            counts += np.bincount(features, minlength=NUM_FEATURES)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.uint64)
+        postings = int(offsets[-1])
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                output.write(HEADER.pack(
+                    MAGIC, generation, FEATURE_BITS, len(report_ids), postings, report_ids[-1] if report_ids else 0
+                ))
+                offsets.tofile(output)
+                df.astype(np.uint32).tofile(output)
+                report_ids.tofile(output)
+                postings_at = output.tell()
+                output.truncate(postings_at + postings * 6)
+
+            if postings:
+                documents_out = np.memmap(tmp_path, dtype=np.uint32, mode='r+', offset=postings_at, shape=(postings,))
+                weights_out = np.memmap(
+                    tmp_path, dtype=np.float16, mode='r+', offset=postings_at + postings * 4, shape=(postings,)
+                )
+                # Counting sort: documents arrive in id order, so every postings list stays sorted
+                cursor = offsets[:-1].astype(np.int64)
+                for documents, features, weights in weighed_chunks():
+                    order = np.argsort(features, kind='stable')
+                    features = features[order]
+                    unique, starts, sizes = np.unique(features, return_index=True, return_counts=True)
+                    positions = cursor[features] + np.arange(features.size) - np.repeat(starts, sizes)
+                    documents_out[positions] = documents[order]
+                    weights_out[positions] = weights[order]
+                    cursor[unique] += sizes
+                documents_out.flush()
+                weights_out.flush()
+                del documents_out, weights_out
+            os.chmod(tmp_path, 0o644)
+            with index._log_lock(exclusive=True):
+                os.replace(tmp_path, path)
+                touched = _logged_report_ids(old_log, old_log_start)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    from .models import Report
+
+    # Reports changed during the build went to the old log; index their current rows in the new one
+    max_report_id = report_ids[-1] if report_ids else 0
+    touched = sorted(report_id for report_id in touched if report_id <= max_report_id)
+    for i in range(0, len(touched), chunk_size):
+        chunk = touched[i:i + chunk_size]
+        rows = list(Report.objects.filter(id__in=chunk).values_list('id', 'original_report'))
+        index.add_rows(rows)
+        index.remove_rows(sorted(set(chunk).difference(report_id for report_id, _ in rows)))
+    late = 0
+    for rows in _chunks_from_db(chunk_size, max_report_id):
+        index.add_rows(rows)
+        late += len(rows)
+    for old_log in glob.glob(glob.escape(str(path)) + '.*.delta'):
+        if old_log != str(index.delta_path(generation)):
+            os.unlink(old_log)
+
+    return {
+        'reports': len(report_ids) + late,
+        'postings': postings,
+        'bytes': path.stat().st_size,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+# Global instance
+similarity_index = SimilarityIndex()
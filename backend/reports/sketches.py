@@ -0,0 +1,473 @@
+"""
+Constant-memory approximate analytics: count-min sketch, heavy hitters and HyperLogLog
+
+Each process accumulates the reports it saves in a local delta sketch and
+periodically merges it into the shared copy stored in the database. All
+three structures are mergeable, so any number of web and job workers can
+contribute without coordination beyond a row lock during the merge.
+
+The report total and the severity and outcome counts are exact: deletes
+and edits adjust them. The drug and adverse event sketches can only count
+additions, so deleted and edited reports stay counted there with their old
+values; the sketch records how many there were so the response can say so,
+until ``manage.py rebuild_sketches`` recounts it. A rebuild advances the
+sketch generation, and deltas begun before it are discarded instead of
+merged, since the rebuild already counted their reports.
+"""
+import atexit
+import hashlib
+import json
+import math
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db import transaction
+
+from .disproportionality import bump_generation, current_generation
+from .nlp_processor import get_setting
+from .rollups import ROLLUP_FIELDS
+
+SKETCH_NAME = 'reports'
+SKETCH_FORMAT = 1
+SKETCH_FIELDS = ('drug', 'adverse_events', 'severity', 'outcome')
+
+
+def _add_count(counts: Dict[str, int], key: str, count: int) -> None:
+    counts[key] = counts.get(key, 0) + count
+
+
+def hash64(item: str) -> int:
+    """Stable 64-bit hash of a string"""
+    return int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class CountMinSketch:
+    """Count-min sketch: estimates never undercount, and overcount by at most
+    ``epsilon * total`` with probability ``1 - delta``"""
+
+    def __init__(self, width: int = 2048, depth: int = 5, table: Optional[np.ndarray] = None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.int64)
+        self.total = int(self.table[0].sum())
+
+    @property
+    def epsilon(self) -> float:
+        return math.e / self.width
+
+    @property
+    def delta(self) -> float:
+        return math.exp(-self.depth)
+
+    def _columns(self, item: str) -> np.ndarray:
+        # Kirsch-Mitzenmacher: derive every row's hash from two halves of one 64-bit hash
+        value = hash64(item)
+        h1, h2 = value & 0xFFFFFFFF, (value >> 32) | 1
+        return (h1 + np.arange(self.depth, dtype=np.uint64) * h2) % self.width
+
+    def add(self, item: str, count: int = 1) -> None:
+        self.table[np.arange(self.depth), self._columns(item)] += count
+        self.total += count
+
+    def estimate(self, item: str) -> int:
+        return int(self.table[np.arange(self.depth), self._columns(item)].min())
+
+    def merge(self, other: 'CountMinSketch') -> None:
+        self.table += other.table
+        self.total += other.total
+
+
+class HeavyHitters:
+    """Top-k candidates ranked by their count-min estimates, in bounded memory"""
+
+    def __init__(self, sketch: CountMinSketch, capacity: int = 100, candidates: Optional[Dict[str, int]] = None):
+        self.sketch = sketch
+        self.capacity = capacity
+        self.candidates: Dict[str, int] = candidates or {}
+
+    def add(self, item: str, count: int = 1) -> None:
+        self.sketch.add(item, count)
+        estimate = self.sketch.estimate(item)
+        if item in self.candidates or len(self.candidates) < self.capacity:
+            self.candidates[item] = estimate
+            return
+        weakest = min(self.candidates, key=self.candidates.get)
+        if estimate > self.candidates[weakest]:
+            del self.candidates[weakest]
+            self.candidates[item] = estimate
+
+    def merge(self, other: 'HeavyHitters') -> None:
+        """Merge another tracker whose sketch has already been merged into ours"""
+        items = set(self.candidates) | set(other.candidates)
+        estimates = {item: self.sketch.estimate(item) for item in items}
+        self.candidates = dict(sorted(estimates.items(), key=lambda x: (-x[1], x[0]))[:self.capacity])
+
+    def top(self, k: int) -> Dict[str, int]:
+        ranked = sorted(self.candidates, key=lambda item: (-self.candidates[item], item))[:k]
+        return {item: self.sketch.estimate(item) for item in ranked}
+
+
+class HyperLogLog:
+    """Distinct count estimate with relative standard error ``1.04 / sqrt(2 ** precision)``"""
+
+    def __init__(self, precision: int = 12, registers: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, item: str) -> None:
+        value = hash64(item)
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.power(2.0, -self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+
+class ReportSketch:
+    """Approximate counters over reports: exact severity/outcome counts (a handful of
+    values), count-min plus heavy hitters for drugs and adverse events, and
+    HyperLogLog for distinct drugs and events"""
+
+    def __init__(self, width: int = 2048, depth: int = 5, capacity: int = 100, precision: int = 12):
+        self.reports = 0
+        # Reports deleted, or edited to another drug or events, since the sketch was last rebuilt
+        self.changed = 0
+        # Rebuild the counts started from; see SketchStore
+        self.generation = 0
+        self.severity: Dict[str, int] = {}
+        self.outcome: Dict[str, int] = {}
+        self.drugs = HeavyHitters(CountMinSketch(width, depth), capacity)
+        self.events = HeavyHitters(CountMinSketch(width, depth), capacity)
+        self.distinct_drugs = HyperLogLog(precision)
+        self.distinct_events = HyperLogLog(precision)
+
+    def add(self, drug: str, adverse_events: Iterable[str], severity: str, outcome: str) -> None:
+        self.reports += 1
+        _add_count(self.severity, severity, 1)
+        _add_count(self.outcome, outcome, 1)
+        self.drugs.add(drug)
+        self.distinct_drugs.add(drug)
+        for event in set(adverse_events or []):
+            self.events.add(event)
+            self.distinct_events.add(event)
+
+    def remove(self, drug: str, adverse_events: Iterable[str], severity: str, outcome: str) -> None:
+        """Uncount a deleted report from the exact counts; its drug and events stay counted"""
+        self.reports -= 1
+        _add_count(self.severity, severity, -1)
+        _add_count(self.outcome, outcome, -1)
+        self.changed += 1
+
+    def replace(self, old: Tuple[str, List[str], str, str], new: Tuple[str, List[str], str, str]) -> None:
+        """Move an edited report between the exact counts; its old drug and events stay counted"""
+        (old_drug, old_events, old_severity, old_outcome), (drug, adverse_events, severity, outcome) = old, new
+        _add_count(self.severity, old_severity, -1)
+        _add_count(self.severity, severity, 1)
+        _add_count(self.outcome, old_outcome, -1)
+        _add_count(self.outcome, outcome, 1)
+        if old_drug != drug or set(old_events or []) != set(adverse_events or []):
+            self.changed += 1
+
+    def is_empty(self) -> bool:
+        return not (self.reports or self.changed or any(self.severity.values()) or any(self.outcome.values()))
+
+    def merge(self, other: 'ReportSketch') -> None:
+        self.reports += other.reports
+        self.changed += other.changed
+        for mine, theirs in ((self.severity, other.severity), (self.outcome, other.outcome)):
+            for key, count in theirs.items():
+                _add_count(mine, key, count)
+        for mine, theirs in ((self.drugs, other.drugs), (self.events, other.events)):
+            mine.sketch.merge(theirs.sketch)
+            mine.merge(theirs)
+        self.distinct_drugs.merge(other.distinct_drugs)
+        self.distinct_events.merge(other.distinct_events)
+
+    def to_bytes(self) -> bytes:
+        """Serialise to a JSON header followed by the raw arrays"""
+        header = json.dumps({
+            'format': SKETCH_FORMAT,
+            'reports': self.reports,
+            'changed': self.changed,
+            'generation': self.generation,
+            'severity': self.severity,
+            'outcome': self.outcome,
+            'width': self.drugs.sketch.width,
+            'depth': self.drugs.sketch.depth,
+            'capacity': self.drugs.capacity,
+            'precision': self.distinct_drugs.precision,
+            'drug_candidates': self.drugs.candidates,
+            'event_candidates': self.events.candidates,
+        }).encode('utf-8')
+        arrays = [self.drugs.sketch.table, self.events.sketch.table,
+                  self.distinct_drugs.registers, self.distinct_events.registers]
+        return struct.pack('=I', len(header)) + header + b''.join(array.tobytes() for array in arrays)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'ReportSketch':
+        (header_length,) = struct.unpack_from('=I', data)
+        header = json.loads(data[4:4 + header_length])
+        if header['format'] != SKETCH_FORMAT:
+            raise ValueError(f"Unsupported sketch format {header['format']}")
+
+        sketch = cls(header['width'], header['depth'], header['capacity'], header['precision'])
+        offset = 4 + header_length
+        cms_size = header['width'] * header['depth']
+        hll_size = 1 << header['precision']
+        tables = []
+        for _ in range(2):
+            tables.append(np.frombuffer(data, dtype=np.int64, count=cms_size, offset=offset)
+                          .reshape(header['depth'], header['width']).copy())
+            offset += cms_size * 8
+        registers = []
+        for _ in range(2):
+            registers.append(np.frombuffer(data, dtype=np.uint8, count=hll_size, offset=offset).copy())
+            offset += hll_size
+
+        sketch.reports = header['reports']
+        sketch.changed = header.get('changed', 0)
+        sketch.generation = header.get('generation', 0)
+        sketch.severity = header['severity']
+        sketch.outcome = header['outcome']
+        sketch.drugs = HeavyHitters(CountMinSketch(header['width'], header['depth'], tables[0]),
+                                    header['capacity'], header['drug_candidates'])
+        sketch.events = HeavyHitters(CountMinSketch(header['width'], header['depth'], tables[1]),
+                                     header['capacity'], header['event_candidates'])
+        sketch.distinct_drugs = HyperLogLog(header['precision'], registers[0])
+        sketch.distinct_events = HyperLogLog(header['precision'], registers[1])
+        return sketch
+
+    def analytics(self, top_n: int = 10) -> Dict[str, Any]:
+        """The /api/analytics/ payload with approximate top-k and distinct counts"""
+        drug_sketch = self.drugs.sketch
+
+        def distribution(counts):
+            # Counts can briefly dip below zero while another process still holds the matching addition
+            return dict(sorted(((key, count) for key, count in counts.items() if count > 0),
+                               key=lambda x: (-x[1], x[0])))
+
+        return {
+            'total_reports': max(self.reports, 0),
+            'severity_distribution': distribution(self.severity),
+            'outcome_distribution': distribution(self.outcome),
+            'common_adverse_events': self.events.top(top_n),
+            'common_drugs': self.drugs.top(top_n),
+            'distinct_drugs': self.distinct_drugs.count(),
+            'distinct_adverse_events': self.distinct_events.count(),
+            'approximate': True,
+            'error_bounds': {
+                'counts': (
+                    f'drug and adverse event counts overestimate by at most {drug_sketch.epsilon:.4%} '
+                    f'of the total with probability {1 - drug_sketch.delta:.1%}'
+                ),
+                'drug_count_max_overestimate': math.ceil(drug_sketch.epsilon * drug_sketch.total),
+                'adverse_event_count_max_overestimate': math.ceil(
+                    self.events.sketch.epsilon * self.events.sketch.total
+                ),
+                'confidence': round(1 - drug_sketch.delta, 4),
+                'distinct_relative_error': round(self.distinct_drugs.relative_error, 4),
+                'severity_and_outcome': 'exact',
+                # Sketches cannot subtract: these reports still count with their old drug and events
+                'reports_changed_since_rebuild': self.changed,
+                'changes': (
+                    'drug and adverse event counts include deleted and edited reports with their old values '
+                    'until manage.py rebuild_sketches runs'
+                    if self.changed else 'none since the last rebuild'
+                ),
+            },
+        }
+
+
+def sketch_row(report) -> Tuple[str, List[str], str, str]:
+    return tuple(getattr(report, field) for field in SKETCH_FIELDS)
+
+
+class SketchStore:
+    """Per-process delta sketch merged into the database copy at intervals"""
+
+    def __init__(self, name: str = SKETCH_NAME):
+        self.name = name
+        self.generation_name = f'sketch:{name}'
+        self._delta: Optional[ReportSketch] = None
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def _new_sketch(self) -> ReportSketch:
+        return ReportSketch(
+            width=get_setting('SKETCH_WIDTH', 2048),
+            depth=get_setting('SKETCH_DEPTH', 5),
+            capacity=get_setting('SKETCH_HEAVY_HITTERS', 100),
+            precision=get_setting('SKETCH_HLL_PRECISION', 12),
+        )
+
+    def _update(self, apply) -> None:
+        """Apply a change to the local delta and flush if the interval has passed.
+
+        Reading the generation on every update lets a rebuild in another
+        process retire this delta at once rather than at its next flush.
+        """
+        generation = current_generation(self.generation_name)
+        with self._lock:
+            if self._delta is None or self._delta.generation != generation:
+                # A delta begun before a rebuild only holds reports the rebuild already counted
+                self._delta = self._new_sketch()
+                self._delta.generation = generation
+            apply(self._delta)
+            due = time.monotonic() - self._last_flush >= get_setting('SKETCH_PERSIST_INTERVAL', 30.0)
+        if due:
+            self.flush()
+
+    def add_rows(self, rows: Iterable[Tuple[str, List[str], str, str]]) -> None:
+        """Count (drug, adverse_events, severity, outcome) rows"""
+        def add(delta):
+            for drug, adverse_events, severity, outcome in rows:
+                delta.add(drug, adverse_events, severity, outcome)
+
+        self._update(add)
+
+    def add_reports(self, reports) -> None:
+        """Count saved reports once their transaction commits"""
+        rows = [sketch_row(report) for report in reports]
+        transaction.on_commit(lambda: self.add_rows(rows))
+
+    def remove_reports(self, reports) -> None:
+        """Uncount deleted reports once their transaction commits"""
+        rows = [sketch_row(report) for report in reports]
+
+        def remove(delta):
+            for row in rows:
+                delta.remove(*row)
+
+        transaction.on_commit(lambda: self._update(remove))
+
+    def replace_reports(self, old_rows: Sequence[Tuple], reports) -> None:
+        """Move edited reports once their transaction commits; ``old_rows`` are rollups.report_row() tuples"""
+        positions = [ROLLUP_FIELDS.index(field) for field in SKETCH_FIELDS]
+        pairs = [
+            (tuple(old_row[position] for position in positions), sketch_row(report))
+            for old_row, report in zip(old_rows, reports)
+        ]
+        if not pairs:
+            return
+
+        def replace(delta):
+            for old, new in pairs:
+                delta.replace(old, new)
+
+        transaction.on_commit(lambda: self._update(replace))
+
+    def _keep(self, delta: ReportSketch) -> None:
+        """Put an unflushed delta back for the next attempt"""
+        with self._lock:
+            if self._delta is None:
+                self._delta = delta
+            elif self._delta.generation == delta.generation:
+                delta.merge(self._delta)
+                self._delta = delta
+
+    def flush(self) -> None:
+        """Merge the local delta into the stored sketch"""
+        from .models import AnalyticsSketch
+
+        with self._lock:
+            delta, self._delta = self._delta, None
+            self._last_flush = time.monotonic()
+        if delta is None or delta.is_empty():
+            return
+        try:
+            with transaction.atomic():
+                stored, _ = AnalyticsSketch.objects.select_for_update().get_or_create(name=self.name)
+                if stored.data:
+                    sketch = ReportSketch.from_bytes(bytes(stored.data))
+                else:
+                    sketch = self._new_sketch()
+                    sketch.generation = delta.generation
+                if sketch.generation > delta.generation:
+                    # Begun before the last rebuild, which already counted these reports
+                    return
+                if sketch.generation < delta.generation:
+                    # A rebuild is still counting; merge once it has stored its sketch
+                    self._keep(delta)
+                    return
+                sketch.merge(delta)
+                stored.data = sketch.to_bytes()
+                stored.report_count = sketch.reports
+                stored.save(update_fields=['data', 'report_count', 'updated_at'])
+        except Exception as e:
+            # Keep the counts for the next attempt
+            print(f"Warning: could not persist analytics sketch: {e}")
+            self._keep(delta)
+
+    def load(self) -> ReportSketch:
+        """The stored sketch merged with this process's unflushed delta"""
+        from .models import AnalyticsSketch
+
+        stored = AnalyticsSketch.objects.filter(name=self.name).values_list('data', flat=True).first()
+        sketch = ReportSketch.from_bytes(bytes(stored)) if stored else self._new_sketch()
+        with self._lock:
+            if self._delta is not None and (not stored or self._delta.generation == sketch.generation):
+                sketch.merge(self._delta)
+        return sketch
+
+    def rebuild(self, rows: Iterable[Tuple[str, List[str], str, str]]) -> ReportSketch:
+        """Replace the stored sketch with one built from ``rows``.
+
+        The generation is advanced before ``rows`` are read, so reports saved
+        from then on go into new deltas, which are merged after the rebuilt
+        sketch is stored; older deltas are discarded.
+        """
+        from .models import AnalyticsSketch
+
+        with transaction.atomic():
+            bump_generation(self.generation_name)
+        sketch = self._new_sketch()
+        sketch.generation = current_generation(self.generation_name)
+        for drug, adverse_events, severity, outcome in rows:
+            sketch.add(drug, adverse_events, severity, outcome)
+        with transaction.atomic():
+            stored, _ = AnalyticsSketch.objects.select_for_update().get_or_create(name=self.name)
+            if stored.data:
+                current = ReportSketch.from_bytes(bytes(stored.data))
+                if current.generation == sketch.generation:
+                    # Deltas flushed into an empty store while we were counting
+                    sketch.merge(current)
+            stored.data = sketch.to_bytes()
+            stored.report_count = sketch.reports
+            stored.save(update_fields=['data', 'report_count', 'updated_at'])
+        return sketch
+
+    def rebuild_from_reports(self, chunk_size: int = 2000) -> ReportSketch:
+        """Recount the stored sketch from the reports table"""
+        from .models import Report
+
+        rows = (
+            Report.objects.order_by()
+            .values_list('drug', 'adverse_events', 'severity', 'outcome')
+            .iterator(chunk_size=chunk_size)
+        )
+        return self.rebuild(rows)
+
+
+# Global instance
+sketch_store = SketchStore()
@@ -0,0 +1,1412 @@
+"""
+Tests for the reports app
+"""
+import csv
+import glob
+import gzip
+import io
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .analytics import (
+    adistinct_analytics, arollup_analytics, compute_analytics, count_adverse_events, distinct_analytics,
+    rollup_analytics, trend_series
+)
+from .cache import ExtractionCache, cache_key, text_digest
+from .disproportionality import SignalEngine, current_generation, disproportionality
+from .drug_extractor import DrugExtractor
+from .executor import ExtractionExecutor, ExtractionTimeout, extraction_executor
+from .export import EXPORT_FIELDS, export_stream
+from .fuzzy import edit_distance, load_fuzzy_index, within_one_edit
+from .gazetteer import load_gazetteer
+from .jobs import claim_jobs, enqueue, process_jobs
+from .models import IdempotencyKey, ProcessingJob, Report, ReportAdverseEvent
+from .nlp_processor import NLPProcessor, nlp_processor
+from .pagination import alist_reports, decode_cursor, encode_cursor, list_reports
+from .reprocess import EXTRACTED_FIELDS, read_checkpoint, reprocess_reports, stale_reports
+from .rollups import verify_rollups
+from .rules import RuleSet, RuleStore
+from .search import fts_query, install_search_index, search_reports
+from .serializers import ReportResponseSerializer
+from .similarity import (
+    MAX_K, NUM_FEATURES, SimilarityIndex, build_index, inverse_document_frequency, similarity_index,
+    term_frequencies
+)
+from .services import create_reports
+from .sketches import ReportSketch, SketchStore, sketch_store
+
+
+# Reference copy of the regex drug extraction that DrugExtractor replaced
+LEGACY_DRUG_PATTERNS = [
+    r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\s+(?:tablet|capsule|injection|dose|mg|ml|g)\b',
+    r'\bDrug\s+[A-Z]\b',
+    r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\s+(?:X|Y|Z)\b',
+    r'\b(?:aspirin|ibuprofen|acetaminophen|morphine|penicillin|insulin|warfarin|metformin)\b'
+]
+KNOWN_DRUGS = ['aspirin', 'ibuprofen', 'acetaminophen', 'morphine', 'penicillin', 'insulin', 'warfarin', 'metformin']
+DOSAGE_FORMS = ['tablet', 'capsule', 'injection', 'dose', 'mg', 'ml', 'g']
+
+# Inputs that made the legacy patterns backtrack
+PATHOLOGICAL_CHUNKS = {
+    'lowercase words': 'patient reported feeling unwell ',
+    'capitalised words': 'Patient Reported Feeling Unwell ',
+    'drug-like words': 'Drug Drug Drug Compound ',
+    'realistic report': 'Patient experienced severe nausea after taking Aspirin 500mg. ',
+}
+
+
+def legacy_extract(text):
+    """Drug extraction as previously done in NLPProcessor.extract_drug"""
+    for pattern in LEGACY_DRUG_PATTERNS:
+        matches = re.findall(pattern, text, re.IGNORECASE)
+        if matches:
+            return matches[0]
+    return None
+
+
+def repeat_to_length(chunk, length):
+    return (chunk * (length // len(chunk) + 1))[:length]
+
+
+def legacy_labels(text, lexicon):
+    """Labels found by the substring scan the automaton replaced"""
+    text_lower = text.lower()
+    return {
+        label for label, keywords in lexicon.items()
+        if any(keyword.lower() in text_lower for keyword in keywords)
+    }
+
+
+def make_report(text, drug='Aspirin', adverse_events=('nausea',), severity='mild', outcome='recovered'):
+    """Extract-free report saved through the bulk path"""
+    return create_reports([text], [{
+        'drug': drug, 'drug_surface': drug, 'adverse_events': list(adverse_events),
+        'severity': severity, 'outcome': outcome,
+    }])[0]
+
+
+def sleep_for(seconds):
+    """Pool task that holds its process for ``seconds``"""
+    time.sleep(seconds)
+    return seconds
+
+
+def crash_once(flag_path):
+    """Pool task that kills its process the first time it runs"""
+    if not os.path.exists(flag_path):
+        Path(flag_path).touch()
+        os._exit(1)
+    return 'recovered'
+
+
+class KeywordMatcherTests(TestCase):
+    """The Aho-Corasick pass finds the same labels as the old substring scan"""
+
+    TEXTS = [
+        'Patient experienced severe nausea and a skin rash after the second dose.',
+        'Mild headache, dizziness and fatigue; the patient has since recovered.',
+        'HOSPITALISED WITH ANAPHYLAXIS, PATIENT DIED',
+        'No symptoms were reported.',
+        'İİ nausea then vomiting, still ongoing',
+        '',
+    ]
+
+    def test_labels_match_substring_scan(self):
+        rules = nlp_processor.rules
+        for text in self.TEXTS:
+            found = {'adverse_events': set(), 'severity': set(), 'outcome': set()}
+            for match in rules.match_keywords(text):
+                found[match.lexicon].add(match.label)
+            self.assertEqual(found['adverse_events'], legacy_labels(text, rules.adverse_events), text)
+            self.assertEqual(found['severity'], legacy_labels(text, rules.severity_indicators), text)
+            self.assertEqual(found['outcome'], legacy_labels(text, rules.outcome_indicators), text)
+
+    def test_spans_index_original_text(self):
+        # 'İ' lower-cases to two characters; later spans must not shift
+        for text in self.TEXTS:
+            for match in nlp_processor.rules.match_keywords(text):
+                self.assertEqual(text[match.start:match.end].lower(), match.keyword, text)
+
+
+class DrugExtractorTests(TestCase):
+    """The linear scanner keeps the legacy results and scales linearly"""
+
+    def setUp(self):
+        self.extractor = DrugExtractor(KNOWN_DRUGS, DOSAGE_FORMS)
+
+    def test_parity_with_legacy_patterns(self):
+        for text in [
+            'The patient was given Drug X and developed a rash.',
+            'Took aspirin 500mg twice daily.',
+            'Started metformin last week.',
+            'Patient took Aspirin 500mg for pain.',
+            'Patient felt unwell after lunch.',
+        ]:
+            self.assertEqual(self.extractor.extract(text), legacy_extract(text), text)
+
+    def test_dosage_form_preferred(self):
+        self.assertEqual(self.extractor.extract('aspirin, then Penicillin injection'), 'Penicillin')
+
+    def test_linear_scaling(self):
+        for name, chunk in PATHOLOGICAL_CHUNKS.items():
+            small, large = repeat_to_length(chunk, 20000), repeat_to_length(chunk, 160000)
+            timings = []
+            for text in (small, large):
+                best = float('inf')
+                for _ in range(3):
+                    started = time.perf_counter()
+                    self.extractor.extract(text)
+                    best = min(best, time.perf_counter() - started)
+                timings.append(best)
+            # 8x more text: 8x when linear, 64x when quadratic
+            self.assertLess(timings[1] / max(timings[0], 1e-6), 24, name)
+
+
+class LazyLoadingTests(TestCase):
+    """The spaCy model and drug indexes load on warm-up or first use, not on import"""
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        source = self.tmp / 'gazetteer.tsv'
+        source.write_text('Aspirin\tacetylsalicylic acid\n', encoding='utf-8')
+        self.processor = NLPProcessor(gazetteer_path=str(source))
+
+    def test_import_loads_no_model(self):
+        script = ('import sys, django; django.setup(); import reports.views; '
+                  'print("spacy" in sys.modules, reports.views.nlp_processor.status()["model"])')
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'regulatory_assistant.settings'}, check=True
+        )
+        self.assertEqual(result.stdout.split()[-2:], ['False', 'not_loaded'])
+
+    def test_warm_up_makes_ready(self):
+        status = self.processor.status()
+        self.assertFalse(status['ready'])
+        self.assertEqual((status['model'], status['drug_indexes']), ('not_loaded', 'not_loaded'))
+
+        self.processor.warm_up()
+        status = self.processor.status()
+        self.assertTrue(status['ready'])
+        self.assertIn(status['model'], ('ready', 'unavailable'))
+        self.assertFalse({'tagger', 'parser', 'lemmatizer'} & set(status['pipeline']))
+        self.assertEqual(self.processor.extract_drug('Took acetylsalicylic acid.'), 'Aspirin')
+
+    def test_readiness_endpoint(self):
+        client = APIClient()
+        with mock.patch('reports.views.nlp_processor', self.processor), \
+                mock.patch('reports.executor.nlp_processor', self.processor):
+            self.assertEqual(client.get('/api/health/ready/').status_code, 503)
+            self.processor.warm_up()
+            response = client.get('/api/health/ready/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['executor']['ready'])
+
+
+class ExecutorTests(TestCase):
+    """Process-pool extraction matches inline extraction and recovers from stuck or dead processes"""
+
+    def make_executor(self, **kwargs):
+        executor = ExtractionExecutor(mode='process', start_method='spawn', **kwargs)
+        self.addCleanup(executor.shutdown)
+        return executor
+
+    def test_matches_inline_extraction(self):
+        texts = [
+            'Patient developed severe nausea after taking Aspirin 500mg. Patient recovered.',
+            'Mild headache and dizziness after Ibuprofen 200mg, symptoms are ongoing.',
+        ] * 3
+        executor = self.make_executor(workers=2)
+        with override_settings(NLP_BATCH_SIZE=2):
+            self.assertEqual(executor.process_reports(texts), nlp_processor.process_reports(texts))
+        self.assertEqual(executor.process_report(texts[1]), nlp_processor.process_report(texts[1]))
+        status = executor.status()
+        self.assertTrue(status['ready'])
+        self.assertEqual((status['mode'], status['workers'], status['restarts']), ('process', 2, 0))
+
+    def test_timeout_replaces_stuck_pool(self):
+        executor = self.make_executor(workers=1, retries=0)
+        executor.warm_up()
+        with override_settings(NLP_EXECUTOR_TIMEOUT=0.5), self.assertRaises(ExtractionTimeout):
+            executor._run(sleep_for, [3])
+        self.assertEqual(executor.restarts, 1)
+        self.assertFalse(executor.status()['ready'])
+        self.assertEqual(executor._run(sleep_for, [0]), [0])
+
+    def test_dead_process_retried(self):
+        executor = self.make_executor(workers=1, retries=1)
+        flag = Path(tempfile.mkdtemp()) / 'crashed'
+        self.addCleanup(shutil.rmtree, flag.parent)
+        self.assertEqual(executor._run(crash_once, [str(flag)]), ['recovered'])
+        self.assertEqual(executor.restarts, 1)
+
+
+class ExtractionCacheTests(TestCase):
+    """Extraction results are cached by normalised text and extractor version"""
+
+    RESULT = {'drug': 'Aspirin', 'drug_surface': 'Aspirin', 'adverse_events': ['nausea'],
+              'severity': 'mild', 'outcome': 'recovered'}
+
+    def test_keyed_by_normalised_text_and_version(self):
+        cache = ExtractionCache()
+        cache.set('Nausea after  Aspirin.', 'v1', self.RESULT)
+        self.assertEqual(cache.get(' Nausea after\nAspirin. ', 'v1'), self.RESULT)
+        self.assertIsNone(cache.get('Nausea after Aspirin.', 'v2'))
+        self.assertIsNone(cache.get('nausea after aspirin.', 'v1'))
+        self.assertEqual(cache_key('a  b', 'v1'), cache_key('a b', 'v1'))
+
+    def test_returns_copies(self):
+        cache = ExtractionCache()
+        cache.set('text', 'v1', self.RESULT)
+        cache.get('text', 'v1')['adverse_events'].append('rash')
+        self.assertEqual(cache.get('text', 'v1'), self.RESULT)
+
+    def test_least_recently_used_evicted(self):
+        cache = ExtractionCache(max_entries=2)
+        for text in ('a', 'b'):
+            cache.set(text, 'v1', self.RESULT)
+        cache.get('a', 'v1')
+        cache.set('c', 'v1', self.RESULT)
+        self.assertIsNone(cache.get('b', 'v1'))
+        self.assertIsNotNone(cache.get('a', 'v1'))
+        stats = cache.stats()
+        self.assertEqual((stats['size'], stats['evictions'], stats['hits'], stats['misses']), (2, 1, 2, 1))
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'extraction-tests'},
+    })
+    def test_shared_tier_reaches_other_processes(self):
+        ExtractionCache(shared_alias='shared').set('text', 'v1', self.RESULT)
+        other = ExtractionCache(shared_alias='shared')
+        self.assertEqual(other.get('text', 'v1'), self.RESULT)
+        self.assertEqual(other.get('text', 'v1'), self.RESULT)
+        self.assertEqual((other.stats()['shared_hits'], other.stats()['hits']), (1, 1))
+
+    def test_version_follows_gazetteer_content(self):
+        tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmp)
+        source = tmp / 'gazetteer.tsv'
+        source.write_text('Aspirin\n', encoding='utf-8')
+        processor = NLPProcessor(gazetteer_path=str(source))
+        version = processor.version
+        self.assertEqual(NLPProcessor(gazetteer_path=str(source)).version, version)
+        source.write_text('Aspirin\tBayer\n', encoding='utf-8')
+        self.assertNotEqual(NLPProcessor(gazetteer_path=str(source)).version, version)
+
+
+class GazetteerTests(TestCase):
+    """Exact and in-text lookups through the compiled trie"""
+
+    SOURCE = (
+        '# canonical<TAB>synonym...\n'
+        'Acetaminophen\tparacetamol\tTylenol\n'
+        'Aspirin\tacetylsalicylic acid\n'
+    )
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        source = self.tmp / 'gazetteer.tsv'
+        source.write_text(self.SOURCE, encoding='utf-8')
+        self.gazetteer = load_gazetteer(source)
+
+    def test_lookup(self):
+        self.assertEqual(self.gazetteer.lookup('TYLENOL'), 'Acetaminophen')
+        self.assertEqual(self.gazetteer.lookup('acetylsalicylic   acid'), 'Aspirin')
+        self.assertIsNone(self.gazetteer.lookup('tylen'))
+        self.assertEqual(self.gazetteer.canonical_names(), ['Acetaminophen', 'Aspirin'])
+
+    def test_find_all_longest_whole_words(self):
+        text = 'Took Acetylsalicylic  Acid and Tylenolx, then paracetamol.'
+        matches = self.gazetteer.find_all(text)
+        self.assertEqual([(m.surface, m.canonical) for m in matches],
+                         [('Acetylsalicylic  Acid', 'Aspirin'), ('paracetamol', 'Acetaminophen')])
+        for match in matches:
+            self.assertEqual(text[match.start:match.end], match.surface)
+
+    def test_spans_index_original_text(self):
+        # 'İ' lower-cases to two characters; later spans must not shift
+        text = 'İİ took TYLENOL, then Aspirin'
+        matches = self.gazetteer.find_all(text)
+        self.assertEqual([(m.start, m.end, m.surface) for m in matches],
+                         [(8, 15, 'TYLENOL'), (22, 29, 'Aspirin')])
+
+    def test_recompiled_when_source_changes(self):
+        source = self.tmp / 'gazetteer.tsv'
+        index = source.with_suffix('.idx')
+        stamp = index.stat().st_mtime_ns
+        # An edit within the same timestamp tick as the compile
+        with open(source, 'a', encoding='utf-8') as source_file:
+            source_file.write('Warfarin\tCoumadin\n')
+        os.utime(source, ns=(stamp, stamp))
+        self.assertEqual(load_gazetteer(source).lookup('coumadin'), 'Warfarin')
+
+
+class FuzzyIndexTests(TestCase):
+    """Misspelled drug names resolve through the deletes index like a scan of every name"""
+
+    SOURCE = (
+        'Ibuprofen\tAdvil\tMotrin\n'
+        'Acetaminophen\tparacetamol\tTylenol\n'
+        'Amoxicillin\n'
+        'Metformin\tGlucophage\n'
+        'Atorvastatin\tLipitor\n'
+    )
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.source = self.tmp / 'gazetteer.tsv'
+        self.source.write_text(self.SOURCE, encoding='utf-8')
+        self.index = load_fuzzy_index(self.source)
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup('Ibuprofin'), ('ibuprofen', 0, 1))
+        self.assertEqual(self.index.lookup('atrovastatin').canonical_id, 4)
+        self.assertEqual(self.index.lookup('paracetamoll').canonical_id, 1)
+        self.assertEqual(self.index.lookup('amoxcilin').distance, 2)
+        self.assertIsNone(self.index.lookup('amoxcilin', 1))
+        self.assertIsNone(self.index.lookup('aspirin'))
+
+    def test_matches_brute_force(self):
+        names = [name.lower() for line in self.SOURCE.splitlines() for name in line.split('\t')]
+        rng = random.Random(0)
+        for name in names:
+            for _ in range(20):
+                word = list(name)
+                for _ in range(rng.randint(1, 2)):
+                    i = rng.randrange(len(word))
+                    edit = rng.choice(('delete', 'substitute', 'insert'))
+                    if edit == 'delete' and len(word) > 1:
+                        del word[i]
+                    elif edit == 'substitute':
+                        word[i] = rng.choice('abcdefghijklmnopqrstuvwxyz')
+                    else:
+                        word.insert(i, rng.choice('abcdefghijklmnopqrstuvwxyz'))
+                word = ''.join(word)
+                expected = min(edit_distance(word, candidate, 2) for candidate in names)
+                match = self.index.lookup(word, 2)
+                self.assertEqual(match.distance if match else 3, expected, word)
+
+    def test_edit_distance_matches_full_table(self):
+        def reference(a, b):
+            table = [[i + j if i * j == 0 else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+            for i in range(1, len(a) + 1):
+                for j in range(1, len(b) + 1):
+                    table[i][j] = min(table[i - 1][j] + 1, table[i][j - 1] + 1,
+                                      table[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+                    if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                        table[i][j] = min(table[i][j], table[i - 2][j - 2] + 1)
+            return table[-1][-1]
+
+        rng = random.Random(1)
+        for _ in range(500):
+            a = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 7)))
+            b = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 7)))
+            distance = reference(a, b)
+            self.assertEqual(edit_distance(a, b, 2), min(distance, 3), (a, b))
+            self.assertEqual(within_one_edit(a, b), distance <= 1, (a, b))
+
+    def test_recompiled_when_source_changes(self):
+        self.assertIsNone(self.index.lookup('warfarn'))
+        with open(self.source, 'a', encoding='utf-8') as source:
+            source.write('Warfarin\tCoumadin\n')
+        self.assertEqual(load_fuzzy_index(self.source).lookup('warfarn'), ('warfarin', 5, 1))
+
+
+class RollupTests(TestCase):
+    """Rollups follow report writes and agree with a full recount"""
+
+    def test_create_edit_delete(self):
+        first = make_report('Aspirin caused nausea.')
+        second = make_report('Ibuprofen caused a rash.', drug='Ibuprofen', adverse_events=['rash'])
+        self.assertEqual(verify_rollups(), [])
+
+        first.adverse_events = ['nausea', 'headache']
+        first.severity = 'severe'
+        first.save()
+        self.assertEqual(verify_rollups(), [])
+
+        second.drug = 'Aspirin'
+        second.save()
+        self.assertEqual(verify_rollups(), [])
+
+        first.delete()
+        self.assertEqual(verify_rollups(), [])
+        second.delete()
+        self.assertEqual(verify_rollups(), [])
+
+
+class TrendTests(TestCase):
+    """/api/analytics/trends/ buckets follow the reports, including gaps, edits and deletes"""
+
+    # Wednesday 2026-03-04 and Friday 2026-03-06
+    DAY = date(2026, 3, 4)
+
+    def report_at(self, when, drug='Aspirin', adverse_events=('nausea',)):
+        return Report.objects.create(
+            original_report=f'{drug} report at {when.isoformat()}', drug=drug,
+            adverse_events=list(adverse_events), severity='mild', outcome='recovered', created_at=when
+        )
+
+    def at(self, days, hour, minute=0):
+        day = self.DAY + timedelta(days=days)
+        return timezone.make_aware(datetime(day.year, day.month, day.day, hour, minute))
+
+    def setUp(self):
+        self.reports = [
+            self.report_at(self.at(0, 9, 15), adverse_events=('nausea', 'headache')),
+            self.report_at(self.at(0, 9, 40)),
+            self.report_at(self.at(2, 18), drug='Ibuprofen', adverse_events=('rash',)),
+        ]
+
+    def buckets(self, interval, start, end, drug=None):
+        series = trend_series(interval, start, end, drug=drug)
+        return [(bucket['bucket'], bucket['reports'], bucket['adverse_events']) for bucket in series['buckets']]
+
+    def test_daily_buckets_include_gaps(self):
+        end = self.DAY + timedelta(days=2)
+        self.assertEqual(self.buckets('day', self.DAY, end), [
+            (self.DAY, 2, {'nausea': 2, 'headache': 1}),
+            (self.DAY + timedelta(days=1), 0, {}),
+            (end, 1, {'rash': 1}),
+        ])
+        self.assertEqual(trend_series('day', self.DAY, end)['adverse_events'], ['nausea', 'headache', 'rash'])
+        self.assertEqual([count for _, count, _ in self.buckets('day', self.DAY, end, drug='Ibuprofen')], [0, 0, 1])
+
+    def test_weekly_and_hourly_buckets(self):
+        monday = self.DAY - timedelta(days=2)
+        self.assertEqual(self.buckets('week', self.DAY, self.DAY + timedelta(days=2)),
+                         [(monday, 3, {'nausea': 2, 'headache': 1, 'rash': 1})])
+        hours = {bucket: (count, events) for bucket, count, events in self.buckets('hour', self.DAY, self.DAY) if count}
+        self.assertEqual(hours, {self.at(0, 9): (2, {'nausea': 2, 'headache': 1})})
+        # Per-drug hours are counted from the reports tables rather than the rollups
+        self.assertEqual(self.buckets('hour', self.DAY, self.DAY, drug='Aspirin'),
+                         self.buckets('hour', self.DAY, self.DAY))
+
+    def test_edits_and_deletes_move_counts(self):
+        self.reports[0].adverse_events = ['rash']
+        self.reports[0].save()
+        self.reports[1].delete()
+        self.assertEqual(self.buckets('day', self.DAY, self.DAY), [(self.DAY, 1, {'rash': 1})])
+        self.assertEqual(verify_rollups(), [])
+
+    def test_invalid_ranges_rejected(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/analytics/trends/', {'interval': 'month'}).status_code, 400)
+        response = client.get('/api/analytics/trends/', {'interval': 'hour', 'start': '2026-01-01', 'end': '2026-03-01'})
+        self.assertEqual(response.status_code, 400)
+        response = client.get('/api/analytics/trends/', {'start': '2026-03-04', 'end': '2026-03-06'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([bucket['reports'] for bucket in response.json()['buckets']], [2, 0, 1])
+
+
+class AdverseEventTableTests(TestCase):
+    """ReportAdverseEvent rows mirror each report's adverse_events through every write path"""
+
+    def assert_rows_match(self):
+        expected = {
+            (report_id, event)
+            for report_id, events in Report.objects.values_list('id', 'adverse_events')
+            for event in events
+        }
+        rows = list(ReportAdverseEvent.objects.values_list('report_id', 'event'))
+        self.assertEqual(len(rows), len(expected))
+        self.assertEqual(set(rows), expected)
+
+    def test_rows_follow_writes(self):
+        first = make_report('Nausea and a rash after Aspirin.', adverse_events=('nausea', 'rash', 'nausea'))
+        second = Report.objects.create(original_report='Headache after Ibuprofen.', drug='Ibuprofen',
+                                       adverse_events=['headache'], severity='mild', outcome='recovered')
+        self.assert_rows_match()
+        first.adverse_events = ['rash', 'dizziness']
+        first.save()
+        self.assert_rows_match()
+        second.delete()
+        self.assert_rows_match()
+        self.assertEqual(ReportAdverseEvent.objects.count(), 2)
+
+    def test_queries_use_rows(self):
+        make_report('Nausea and a rash after Aspirin.', adverse_events=('nausea', 'rash'))
+        make_report('A rash after Ibuprofen.', drug='Ibuprofen', adverse_events=('rash',))
+        make_report('Headache after Ibuprofen.', drug='Ibuprofen', adverse_events=('headache',))
+        response = APIClient().get('/api/reports/', {'adverse_event': 'rash'})
+        self.assertEqual(sorted(report['drug'] for report in response.json()['reports']), ['Aspirin', 'Ibuprofen'])
+        response = APIClient().get('/api/reports/', {'adverse_event': 'rash', 'drug': 'Ibuprofen'})
+        self.assertEqual(len(response.json()['reports']), 1)
+        self.assertEqual(count_adverse_events(Report.objects.filter(drug='Ibuprofen')), {'headache': 1, 'rash': 1})
+
+
+class SearchTests(TestCase):
+    """FTS5 search stays in step with every write and ranks the best match first"""
+
+    def search(self, query, queryset=None):
+        return [result['report'].id for result in search_reports(query, queryset)]
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(fts_query('nausea "skin  rash" asp*'), '"nausea" "skin rash" "asp"*')
+        self.assertEqual(fts_query('nausea OR (NEAR'), '"nausea" "OR" "NEAR"')
+        with self.assertRaises(ValueError):
+            fts_query('"" * -')
+
+    def test_ranked_stemmed_matches_with_snippets(self):
+        vomiting = make_report('Patient kept vomiting for two days after <Aspirin>; vomiting stopped after hydration.')
+        once = make_report('A single episode of vomiting was reported along with a very long unrelated history '
+                           'of hypertension, diabetes, asthma and several other chronic conditions.')
+        make_report('Headache after Ibuprofen.', drug='Ibuprofen')
+        results = search_reports('vomited')
+        self.assertEqual([result['report'].id for result in results], [vomiting.id, once.id])
+        self.assertIn('<mark>vomiting</mark>', results[0]['snippet'])
+        self.assertIn('&lt;Aspirin&gt;', results[0]['snippet'])
+        self.assertEqual(self.search('vomiting', Report.objects.filter(id=once.id)), [once.id])
+        self.assertEqual(self.search('ibuprofen'), [Report.objects.get(drug='Ibuprofen').id])
+
+    def test_index_follows_writes(self):
+        report = make_report('Rash after Aspirin.')
+        report.original_report = 'Dizziness after Aspirin.'
+        report.save()
+        self.assertEqual(self.search('rash'), [])
+        self.assertEqual(self.search('dizziness'), [report.id])
+        # Triggers also cover writes that bypass the ORM hooks
+        Report.objects.filter(id=report.id).update(original_report='Tremor after Aspirin.')
+        self.assertEqual(self.search('tremor'), [report.id])
+        report.delete()
+        self.assertEqual(self.search('tremor'), [])
+
+    def test_missing_trigger_rebuilds_index(self):
+        report = make_report('Rash after Aspirin.')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER reports_report_fts_update')
+        Report.objects.filter(id=report.id).update(original_report='Tremor after Aspirin.')
+        self.assertTrue(install_search_index())
+        self.assertEqual(self.search('tremor'), [report.id])
+        self.assertFalse(install_search_index())
+
+    def test_endpoint(self):
+        make_report('Rash after Aspirin.')
+        client = APIClient()
+        self.assertEqual(client.get('/api/reports/search/', {'q': '***'}).status_code, 400)
+        response = client.get('/api/reports/search/', {'q': 'rash', 'drug': 'Aspirin'})
+        self.assertEqual([result['drug'] for result in response.json()['results']], ['Aspirin'])
+        response = client.get('/api/reports/search/', {'q': 'rash', 'drug': 'Ibuprofen'})
+        self.assertEqual(response.json()['results'], [])
+
+
+class ExportTests(TestCase):
+    """Exports stream every matching report in id order, chunk by chunk"""
+
+    URL = '/api/reports/export/'
+
+    def setUp(self):
+        self.reports = [make_report(f'Report {i}, with "quotes"', adverse_events=('nausea', 'rash'))
+                        for i in range(5)]
+        make_report('Headache after Ibuprofen.', drug='Ibuprofen')
+
+    def aspirin(self):
+        return Report.objects.filter(drug='Aspirin')
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_ndjson_chunks(self):
+        chunks = list(export_stream(self.aspirin(), 'ndjson'))
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for line in b''.join(chunks).decode('utf-8').splitlines()]
+        self.assertEqual([row['id'] for row in rows], [report.id for report in self.reports])
+        self.assertEqual(list(rows[0]), list(EXPORT_FIELDS))
+        self.assertEqual(rows[0]['adverse_events'], ['nausea', 'rash'])
+        self.assertEqual(rows[0]['original_report'], self.reports[0].original_report)
+
+    def test_csv_and_gzip(self):
+        data = b''.join(export_stream(self.aspirin(), 'csv')).decode('utf-8')
+        rows = list(csv.reader(io.StringIO(data)))
+        self.assertEqual(rows[0], list(EXPORT_FIELDS))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][EXPORT_FIELDS.index('original_report')], self.reports[0].original_report)
+        self.assertEqual(rows[1][EXPORT_FIELDS.index('adverse_events')], 'nausea; rash')
+        compressed = b''.join(export_stream(self.aspirin(), 'csv', compress=True))
+        self.assertEqual(gzip.decompress(compressed).decode('utf-8'), data)
+
+    def test_endpoint(self):
+        client = APIClient()
+        self.assertEqual(client.get(self.URL, {'format': 'xml'}).status_code, 400)
+        response = client.get(self.URL, {'format': 'ndjson', 'drug': 'Ibuprofen'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="reports.ndjson"')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)['drug'] for line in lines], ['Ibuprofen'])
+
+    async def test_asgi_endpoint_streams(self):
+        response = await self.async_client.get(self.URL, {'format': 'csv', 'compress': 'gzip'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        data = b''.join([chunk async for chunk in response.streaming_content])
+        expected = await sync_to_async(lambda: b''.join(export_stream(Report.objects.all(), 'csv')))()
+        self.assertEqual(gzip.decompress(data), expected)
+
+
+class IngestTests(TestCase):
+    """Uploads are stored batch by batch with a result streamed back for every line"""
+
+    URL = '/api/process-reports/ingest/'
+    TEXT = 'Patient developed severe nausea after taking Aspirin 500mg. Patient recovered.'
+
+    def ingest(self, body, content_type='application/x-ndjson', **params):
+        url = self.URL + ('?' + '&'.join(f'{k}={v}' for k, v in params.items()) if params else '')
+        response = APIClient().generic('POST', url, body, content_type=content_type)
+        if response.status_code != 200:
+            return response, None
+        return response, [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def expected(self, text):
+        return dict(ReportResponseSerializer(nlp_processor.process_report(text)).data)
+
+    @override_settings(INGEST_BATCH_SIZE=2)
+    def test_ndjson_results_per_line(self):
+        body = '\n'.join([
+            json.dumps({'report': self.TEXT}),
+            json.dumps('Mild rash after Ibuprofen.'),
+            '',
+            '{not json',
+            json.dumps({'text': self.TEXT}),
+            json.dumps({'report': ''}),
+            json.dumps(self.TEXT),
+        ])
+        response, results = self.ingest(body)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([result.get('line') for result in results], [1, 2, 4, 5, 6, 7, None])
+        stored = [result for result in results if 'id' in result]
+        self.assertEqual([result['line'] for result in stored], [1, 2, 7])
+        self.assertEqual({k: v for k, v in stored[0].items() if k not in ('id', 'line')}, self.expected(self.TEXT))
+        self.assertTrue(results[2]['error'].startswith('Invalid JSON'))
+        self.assertEqual(results[-1], {'summary': {'created': 3, 'failed': 3}})
+        self.assertEqual(
+            list(Report.objects.order_by('id').values_list('id', flat=True)), [result['id'] for result in stored]
+        )
+        self.assertEqual(verify_rollups(), [])
+
+    def test_oversized_line_skipped(self):
+        with mock.patch('reports.ingest.MAX_LINE_BYTES', 64):
+            _, results = self.ingest(json.dumps('x' * 200) + '\n' + json.dumps(self.TEXT[:40]))
+        self.assertEqual(results[0], {'line': 1, 'error': 'Line longer than 64 bytes'})
+        self.assertEqual(results[1]['line'], 2)
+        self.assertIn('id', results[1])
+
+    def test_csv_upload(self):
+        body = 'source,Report\r\nemail,"Two lines:\nnausea after Aspirin."\r\nphone,\r\n,\r\nfax,' + self.TEXT + '\r\n'
+        _, results = self.ingest(body, content_type='text/csv')
+        self.assertEqual([result.get('line') for result in results], [3, 4, 6, None])
+        self.assertIn('id', results[0])
+        self.assertIn('error', results[1])
+        self.assertEqual(Report.objects.get(id=results[0]['id']).original_report, 'Two lines:\nnausea after Aspirin.')
+        self.assertEqual(results[-1], {'summary': {'created': 2, 'failed': 1}})
+
+    def test_failed_report_only_fails_its_line(self):
+        process_reports = extraction_executor.process_reports
+
+        def failing(texts):
+            if any('BOOM' in text for text in texts):
+                raise RuntimeError('extraction failed')
+            return process_reports(texts)
+
+        with mock.patch.object(extraction_executor, 'process_reports', side_effect=failing):
+            _, results = self.ingest('\n'.join(json.dumps(text) for text in [self.TEXT, 'BOOM', self.TEXT]))
+        self.assertEqual([('id' in result, result.get('error')) for result in results[:3]], [
+            (True, None), (False, 'Error processing report: extraction failed'), (True, None)
+        ])
+        self.assertEqual(Report.objects.count(), 2)
+
+    def test_unusable_uploads_rejected(self):
+        self.assertEqual(self.ingest('report', content_type='text/plain')[0].status_code, 400)
+        self.assertEqual(self.ingest('text\r\nhello\r\n', content_type='text/csv')[0].status_code, 400)
+        self.assertEqual(self.ingest('[]', format='xml')[0].status_code, 400)
+        # ?format= wins over the Content-Type header
+        _, results = self.ingest('report\r\n' + self.TEXT + '\r\n', content_type='text/plain', format='csv')
+        self.assertEqual(results[-1], {'summary': {'created': 1, 'failed': 0}})
+
+    async def test_asgi_endpoint_streams(self):
+        response = await self.async_client.post(
+            self.URL, json.dumps(self.TEXT) + '\n' + json.dumps(''), content_type='application/x-ndjson'
+        )
+        lines = b''.join([chunk async for chunk in response.streaming_content]).splitlines()
+        self.assertEqual(json.loads(lines[-1]), {'summary': {'created': 1, 'failed': 1}})
+        self.assertEqual(await Report.objects.acount(), 1)
+
+
+class SimilarityIndexTests(TestCase):
+    """The memory-mapped TF-IDF index and its delta log agree with exact cosine similarity"""
+
+    TEXTS = [
+        'Severe nausea and vomiting after Aspirin, patient recovered',
+        'Nausea and vomiting after Aspirin overdose',
+        'Skin rash and itching after Penicillin injection',
+        'Itching rash spreading after Penicillin',
+        'Headache and dizziness after Ibuprofen',
+        'Liver injury with jaundice after Acetaminophen',
+        'Jaundice and abdominal pain after Acetaminophen',
+    ]
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = self.tmp / 'similarity.idx'
+        override = override_settings(SIMILARITY_INDEX_PATH=str(self.path))
+        override.enable()
+        self.addCleanup(override.disable)
+        # The commit hooks also feed this process's sketch delta; flush it inside the test transaction
+        self.addCleanup(sketch_store.flush)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reports = [make_report(text) for text in self.TEXTS]
+
+    def exact_scores(self, text):
+        """Cosine similarity of ``text`` with every stored report, from unrounded TF-IDF vectors"""
+        rows = list(Report.objects.values_list('id', 'original_report'))
+        terms = [term_frequencies(narrative) for _, narrative in rows]
+        df = np.zeros(NUM_FEATURES)
+        for features, _ in terms:
+            df[features] += 1
+        idf = inverse_document_frequency(df, len(rows))
+
+        def vector(features, tfs):
+            weights = tfs * idf[features]
+            return dict(zip(features.tolist(), (weights / np.linalg.norm(weights)).tolist()))
+
+        query = vector(*term_frequencies(text))
+        scores = {}
+        for (report_id, _), (features, tfs) in zip(rows, terms):
+            score = sum(weight * query.get(feature, 0) for feature, weight in vector(features, tfs).items())
+            if score > 0:
+                scores[report_id] = score
+        return scores
+
+    def assert_matches_exact(self, index, text, exclude=None):
+        expected = self.exact_scores(text)
+        expected.pop(exclude, None)
+        found = dict(index.similar(text, k=MAX_K, exclude=exclude))
+        self.assertEqual(set(found), set(expected))
+        for report_id, score in expected.items():
+            self.assertAlmostEqual(found[report_id], score, places=2)
+
+    def test_build_matches_exact_cosine(self):
+        stats = build_index(similarity_index, chunk_size=3)
+        self.assertEqual(stats['reports'], len(self.TEXTS))
+        self.assertEqual(similarity_index.stats()['delta_reports'], 0)
+        self.assertEqual(glob.glob(str(self.path) + '.*.delta'), [])
+        for report in self.reports:
+            self.assert_matches_exact(similarity_index, report.original_report, exclude=report.id)
+        # Another process maps the same file
+        self.assert_matches_exact(SimilarityIndex(self.path), self.TEXTS[2])
+
+    def test_delta_log_follows_writes(self):
+        build_index(similarity_index)
+        edited, deleted = self.reports[2], self.reports[4]
+        with self.captureOnCommitCallbacks(execute=True):
+            added = make_report('Severe nausea after Aspirin, vomiting, patient recovered')
+            edited.original_report = 'Blurred vision on Tamoxifen'
+            edited.save()
+            deleted.delete()
+
+        other_process = SimilarityIndex(self.path)
+        for index in (similarity_index, other_process):
+            self.assertEqual(index.similar(self.TEXTS[0], k=1, exclude=self.reports[0].id)[0][0], added.id)
+            self.assertNotIn(edited.id, dict(index.similar('Skin rash after Penicillin')))
+            self.assertEqual(index.similar('Vision blurred, Tamoxifen')[0][0], edited.id)
+            self.assertNotIn(deleted.id, dict(index.similar(self.TEXTS[4])))
+        self.assertEqual(similarity_index.report_count, len(self.TEXTS))
+
+    def test_rebuild_keeps_changes_made_during_build(self):
+        build_index(similarity_index)
+        edited, deleted = self.reports[0], self.reports[-1]
+
+        def progress(read):
+            # Another process edits and deletes reports the build has already read
+            if read == 2:
+                Report.objects.filter(id=edited.id).update(original_report='Blurred vision on Tamoxifen')
+                similarity_index.add_rows([(edited.id, 'Blurred vision on Tamoxifen')])
+                Report.objects.filter(id=deleted.id).delete()
+                similarity_index.remove_rows([deleted.id])
+
+        build_index(similarity_index, chunk_size=2, progress=progress)
+        self.assertEqual(similarity_index.generation, 2)
+        self.assertEqual(glob.glob(str(self.path) + '.*.delta'), [str(self.path) + '.2.delta'])
+        self.assertEqual(similarity_index.similar('Vision blurred, Tamoxifen')[0][0], edited.id)
+        self.assertNotIn(edited.id, dict(similarity_index.similar(self.TEXTS[0])))
+        self.assertNotIn(deleted.id, dict(similarity_index.similar(self.TEXTS[-1])))
+
+    def test_endpoint(self):
+        build_index(similarity_index)
+        client = APIClient()
+        url = f'/api/reports/{self.reports[2].id}/similar/'
+        response = client.get(url, {'k': 2})
+        results = response.json()['results']
+        self.assertEqual([result['id'] for result in results][:1], [self.reports[3].id])
+        self.assertLessEqual(len(results), 2)
+        self.assertEqual([result['score'] for result in results],
+                         sorted((result['score'] for result in results), reverse=True))
+        self.assertEqual(client.get(url, {'k': 0}).status_code, 400)
+        self.assertEqual(client.get(url, {'k': 'many'}).status_code, 400)
+        self.assertEqual(client.get('/api/reports/999999/similar/').status_code, 404)
+
+
+class ReprocessTests(TestCase):
+    """Stale reports are re-extracted in chunks, with derived tables kept in step and resumable runs"""
+
+    TEXTS = [
+        'Patient developed severe nausea after taking Aspirin 500mg. Patient recovered.',
+        'Mild headache and dizziness after Ibuprofen 200mg, symptoms are ongoing.',
+        'Fatal anaphylaxis following penicillin injection.',
+        'Moderate rash after Amoxicillin, resolved.',
+        'Vomiting after Metformin.',
+    ]
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.checkpoint = self.tmp / 'reprocess.checkpoint'
+        self.executor = ExtractionExecutor(mode='inline')
+        # Stored by an older extractor that found nothing but 'Unknown'
+        self.reports = [make_report(text, drug='Unknown', adverse_events=()) for text in self.TEXTS]
+        Report.objects.update(extractor_version='old')
+
+    def assert_up_to_date(self):
+        for report in Report.objects.order_by('id'):
+            expected = nlp_processor.process_report(report.original_report)
+            self.assertEqual({field: getattr(report, field) for field in EXTRACTED_FIELDS},
+                             {field: expected[field] for field in EXTRACTED_FIELDS})
+            self.assertEqual(report.extractor_version, nlp_processor.version)
+        self.assertEqual(verify_rollups(), [])
+        self.assertEqual(
+            sorted(ReportAdverseEvent.objects.values_list('report_id', 'event')),
+            sorted((report.id, event) for report in Report.objects.all() for event in report.adverse_events)
+        )
+
+    def test_stale_reports_reextracted(self):
+        current = make_report(self.TEXTS[0], drug='Unknown')
+        self.assertEqual(stale_reports().count(), len(self.TEXTS))
+        stats = reprocess_reports(executor=self.executor, chunk_size=2)
+        self.assertEqual(stats['processed'], len(self.TEXTS))
+        self.assertEqual(stats['changed'], len(self.TEXTS))
+        self.assertEqual(stale_reports().count(), 0)
+        # Reports of the current version are left alone
+        self.assertEqual(Report.objects.get(id=current.id).drug, 'Unknown')
+        current.delete()
+        self.assert_up_to_date()
+        self.assertEqual(reprocess_reports(executor=self.executor)['processed'], 0)
+
+    def test_unchanged_results_only_bump_version(self):
+        reprocess_reports(executor=self.executor)
+        Report.objects.update(extractor_version='old')
+        stats = reprocess_reports(executor=self.executor)
+        self.assertEqual((stats['processed'], stats['changed']), (len(self.TEXTS), 0))
+        self.assert_up_to_date()
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        class Interrupted(Exception):
+            pass
+
+        def interrupt(state):
+            raise Interrupted
+
+        everything = Report.objects.all()
+        with self.assertRaises(Interrupted):
+            reprocess_reports(everything, self.executor, chunk_size=2, checkpoint=self.checkpoint, progress=interrupt)
+        saved = read_checkpoint(self.checkpoint, nlp_processor.version)
+        self.assertEqual((saved['last_id'], saved['processed']), (self.reports[1].id, 2))
+        # A checkpoint from another extractor version is ignored
+        self.assertIsNone(read_checkpoint(self.checkpoint, 'other'))
+
+        seen = []
+        stats = reprocess_reports(everything, self.executor, chunk_size=2, checkpoint=self.checkpoint,
+                                  progress=lambda state: seen.append(state['last_id']))
+        self.assertEqual(stats['resumed_from'], self.reports[1].id)
+        self.assertEqual(seen, [self.reports[3].id, self.reports[4].id])
+        self.assertEqual(stats['processed'], len(self.TEXTS))
+        self.assertFalse(self.checkpoint.exists())
+        self.assert_up_to_date()
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('reprocess_reports', '--dry-run', '--checkpoint', str(self.checkpoint), stdout=out)
+        self.assertIn(f'{len(self.TEXTS)} reports are stale', out.getvalue())
+        self.assertEqual(stale_reports().count(), len(self.TEXTS))
+
+        out = io.StringIO()
+        call_command('reprocess_reports', '--workers', '1', '--checkpoint', str(self.checkpoint), stdout=out)
+        self.assertIn(f'Re-extracted {len(self.TEXTS)} reports ({len(self.TEXTS)} changed)', out.getvalue())
+        self.assert_up_to_date()
+
+
+class IdempotencyTests(TestCase):
+    """Idempotency-Key handling on /api/process-report/"""
+
+    URL = '/api/process-report/'
+    TEXT = 'Patient developed severe nausea after taking Aspirin 500mg.'
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def post(self, text, key):
+        return self.client.post(self.URL, {'report': text}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_stored_response(self):
+        first = self.post(self.TEXT, 'key-1')
+        self.assertEqual(first.status_code, 201)
+        replay = self.post(self.TEXT, 'key-1')
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(Report.objects.count(), 1)
+
+    def test_different_report_is_422(self):
+        self.post(self.TEXT, 'key-2')
+        response = self.post('A different report about a rash.', 'key-2')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Report.objects.count(), 1)
+
+    def test_in_progress_is_409(self):
+        IdempotencyKey.objects.create(key='key-3', fingerprint=text_digest(self.TEXT), created_at=timezone.now())
+        response = self.post(self.TEXT, 'key-3')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Report.objects.count(), 0)
+
+
+class BatchProcessingTests(TestCase):
+    """/api/process-reports/batch/ extracts like the single-report path and saves in one go"""
+
+    URL = '/api/process-reports/batch/'
+    TEXTS = [
+        'Patient developed severe nausea after taking Aspirin 500mg. Patient recovered.',
+        'Mild headache and dizziness after Ibuprofen 200mg, symptoms are ongoing.',
+        'Patient developed severe nausea after taking Aspirin 500mg. Patient recovered.',
+        'Fatal anaphylaxis following penicillin injection.',
+    ]
+
+    def test_results_match_single_reports(self):
+        response = APIClient().post(self.URL, {'reports': self.TEXTS}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['count'], len(self.TEXTS))
+        self.assertEqual(response.json()['results'], [nlp_processor.process_report(text) for text in self.TEXTS])
+        self.assertEqual(list(Report.objects.order_by('id').values_list('original_report', flat=True)), self.TEXTS)
+        self.assertEqual(verify_rollups(), [])
+
+    def test_invalid_batches_rejected(self):
+        client = APIClient()
+        self.assertEqual(client.post(self.URL, {'reports': []}, format='json').status_code, 400)
+        self.assertEqual(client.post(self.URL, {'reports': ['x'] * 1001}, format='json').status_code, 400)
+        self.assertEqual(Report.objects.count(), 0)
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursors of /api/reports/ walk every report once, newest first"""
+
+    def setUp(self):
+        self.client = APIClient()
+        now = timezone.now()
+        self.reports = [make_report(f'Report number {i} about nausea.') for i in range(7)]
+        # Two reports share a timestamp so the id tie-break is exercised
+        for i, report in enumerate(self.reports):
+            report.created_at = now - timedelta(minutes=i // 2)
+        Report.objects.bulk_update(self.reports, ['created_at'])
+
+    def test_cursor_round_trip(self):
+        report = Report.objects.get(id=self.reports[0].id)
+        self.assertEqual(decode_cursor(encode_cursor(report)), (report.created_at, report.id))
+
+    def test_pages_cover_every_report(self):
+        seen, cursor = [], None
+        while True:
+            params = {'page_size': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/reports/', params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            seen.extend(report['id'] for report in body['reports'])
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+        expected = Report.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_bad_cursor_is_400(self):
+        for cursor in ['not-a-cursor', 'bm90fGE=']:
+            response = self.client.get('/api/reports/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+
+@override_settings(ROOT_URLCONF='regulatory_assistant.asgi_urls')
+class AsyncViewTests(TestCase):
+    """The ASGI views answer like the sync ones, through the async ORM helpers"""
+
+    URL = '/api/process-report/'
+    TEXT = 'Patient developed severe nausea after taking Aspirin 500mg.'
+
+    async def post(self, text, key=None):
+        headers = {'Idempotency-Key': key} if key else {}
+        return await self.async_client.post(self.URL, {'report': text}, content_type='application/json',
+                                            headers=headers)
+
+    async def test_idempotent_replay(self):
+        first = await self.post(self.TEXT, 'async-key')
+        self.assertEqual(first.status_code, 201)
+        replay = await self.post(self.TEXT, 'async-key')
+        self.assertEqual(replay.json(), first.json())
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual((await self.post('A different report about a rash.', 'async-key')).status_code, 422)
+        self.assertEqual(await Report.objects.acount(), 1)
+
+    async def test_views_share_report_processing(self):
+        with override_settings(REPORT_PROCESSING_ASYNC=True):
+            queued = await self.post(self.TEXT)
+        self.assertEqual(queued.status_code, 202)
+        self.assertEqual(await ProcessingJob.objects.acount(), 1)
+
+        with override_settings(REPORT_DEDUP_WINDOW=60):
+            created = await self.post(self.TEXT)
+            sync_copy = await sync_to_async(APIClient().post)(self.URL, {'report': self.TEXT}, format='json')
+            async_copy = await self.post(self.TEXT)
+        report = await Report.objects.aget()
+        for response in (sync_copy, async_copy):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), created.json())
+            self.assertEqual(response['Content-Location'], f'/api/reports/{report.id}/')
+
+    async def test_listing_and_analytics_match_sync_helpers(self):
+        for i in range(5):
+            await sync_to_async(make_report)(f'Report number {i} about a mild headache after Aspirin.',
+                                             adverse_events=('headache',))
+        params = {'page_size': '2'}
+        while True:
+            expected = await sync_to_async(list_reports)(params)
+            reports, next_cursor, size = await alist_reports(params)
+            self.assertEqual(([report.id for report in reports], next_cursor, size),
+                             ([report.id for report in expected[0]], expected[1], expected[2]))
+            if next_cursor is None:
+                break
+            params = {'page_size': '2', 'cursor': next_cursor}
+
+        self.assertEqual(await arollup_analytics(), await sync_to_async(rollup_analytics)())
+        distinct = await adistinct_analytics()
+        self.assertEqual(distinct, await sync_to_async(distinct_analytics)())
+        # The five texts are near-duplicates of one another
+        self.assertEqual(distinct['total_reports'], 1)
+        response = await self.async_client.get('/api/analytics/', {'mode': 'distinct'})
+        self.assertEqual(response.json(), distinct)
+
+
+class NearDuplicateTests(TestCase):
+    """Near-duplicate reports link to the earliest matching representative"""
+
+    TEXT = ('Patient is a 54 year old male who developed severe nausea, vomiting and dizziness '
+            'two hours after the first dose of Aspirin 500mg. Symptoms resolved the next day.')
+
+    def test_links_near_duplicate(self):
+        original = make_report(self.TEXT)
+        copy = make_report(self.TEXT.replace('54 year', '55 year'))
+        unrelated = make_report('Ibuprofen was followed by a mild skin rash on the left arm that is still ongoing.')
+        copy.refresh_from_db()
+        unrelated.refresh_from_db()
+        self.assertIsNone(Report.objects.get(id=original.id).duplicate_of_id)
+        self.assertEqual(copy.duplicate_of_id, original.id)
+        self.assertGreaterEqual(copy.duplicate_similarity, 0.8)
+        self.assertIsNone(unrelated.duplicate_of_id)
+
+    def test_relinks_when_representative_deleted(self):
+        original = make_report(self.TEXT)
+        first = make_report(self.TEXT.replace('54 year', '55 year'))
+        second = make_report(self.TEXT.replace('54 year', '56 year'))
+        original.delete()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertIsNone(first.duplicate_of_id)
+        self.assertEqual(second.duplicate_of_id, first.id)
+
+    def test_distinct_analytics_follow_relinking(self):
+        def assert_distinct_counts():
+            self.assertEqual(
+                distinct_analytics(),
+                compute_analytics(Report.objects.filter(duplicate_of__isnull=True))
+            )
+            self.assertEqual(verify_rollups(), [])
+
+        original = make_report(self.TEXT)
+        first = make_report(self.TEXT.replace('54 year', '55 year'), severity='severe')
+        make_report(self.TEXT.replace('54 year', '56 year'), adverse_events=('vomiting',))
+        make_report('Ibuprofen was followed by a mild skin rash on the left arm that is still ongoing.',
+                    drug='Ibuprofen', adverse_events=('rash',), outcome='ongoing')
+        self.assertEqual(distinct_analytics()['total_reports'], 2)
+        self.assertEqual(rollup_analytics()['total_reports'], 4)
+        assert_distinct_counts()
+
+        original.delete()
+        assert_distinct_counts()
+        self.assertEqual(distinct_analytics()['severity_distribution'], {'severe': 1, 'mild': 1})
+
+        # An edit that breaks the match makes the report a representative of its own
+        first.refresh_from_db()
+        second = Report.objects.get(duplicate_of=first)
+        second.original_report = 'Metformin caused mild vomiting in an elderly patient, now recovered.'
+        second.save()
+        self.assertIsNone(second.duplicate_of_id)
+        assert_distinct_counts()
+        self.assertEqual(distinct_analytics(timezone.localdate(), timezone.localdate())['total_reports'], 3)
+
+
+class JobQueueTests(TestCase):
+    """Only the worker holding a job's current claim stores its result"""
+
+    def test_requeued_job_is_not_finished_twice(self):
+        job = enqueue('Patient developed a rash after Ibuprofen 200mg.')
+        stale = claim_jobs(10)
+        # requeue_stale hands the job back and another worker claims it
+        ProcessingJob.objects.filter(id=job.id).update(status=ProcessingJob.STATUS_PENDING, claim_token='')
+        current = claim_jobs(10)
+
+        self.assertEqual(process_jobs(stale), (0, 0))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ProcessingJob.STATUS_PROCESSING)
+        self.assertEqual(job.claim_token, current[0].claim_token)
+
+        self.assertEqual(process_jobs(current), (1, 0))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ProcessingJob.STATUS_DONE)
+        self.assertEqual(Report.objects.count(), 1)
+
+
+class SignalEngineTests(TestCase):
+    """Disproportionality statistics and the shared invalidation of cached counts"""
+
+    def test_statistics_match_two_by_two_table(self):
+        # Drug 0 / event 0: a=10, b=20, c=30, d=20
+        stats = disproportionality(np.array([[10, 20], [30, 5]]), np.array([30, 50]), 80)
+        self.assertAlmostEqual(stats['prr'][0, 0], (10 / 30) / (30 / 50))
+        self.assertAlmostEqual(stats['ror'][0, 0], (10 * 20) / (20 * 30))
+        self.assertAlmostEqual(stats['chi2'][0, 0], 80 * (abs(10 * 20 - 20 * 30) - 40) ** 2 / (30 * 50 * 40 * 40))
+        prr_se = math.sqrt(1 / 10 - 1 / 30 + 1 / 30 - 1 / 50)
+        self.assertAlmostEqual(stats['prr_lower'][0, 0], (10 / 30) / (30 / 50) * math.exp(-1.959963984540054 * prr_se))
+
+    def test_empty_cell_is_corrected(self):
+        stats = disproportionality(np.array([[3, 0], [0, 4]]), np.array([3, 4]), 7)
+        self.assertTrue(np.isfinite(stats['ror']).all())
+        self.assertAlmostEqual(stats['ror'][0, 0], (3.5 * 4.5) / (0.5 * 0.5))
+
+    def test_counts_follow_writes(self):
+        engine = SignalEngine(rebuild_interval=3600)
+        for _ in range(3):
+            make_report('Aspirin then nausea.')
+        make_report('Ibuprofen then rash.', drug='Ibuprofen', adverse_events=['rash'])
+        signal = engine.signals(min_count=1, drug='Aspirin')['signals'][0]
+        self.assertEqual((signal['adverse_event'], signal['count'], signal['drug_reports']), ('nausea', 3, 3))
+
+        # New reports are added incrementally
+        make_report('Aspirin then nausea again.')
+        self.assertEqual(engine.signals(min_count=1, drug='Aspirin')['signals'][0]['count'], 4)
+
+    def test_only_drug_or_event_edits_invalidate(self):
+        report = make_report('Aspirin then nausea.')
+        generation = current_generation()
+        report.severity = 'severe'
+        report.save()
+        self.assertEqual(current_generation(), generation)
+
+        report.drug = 'Ibuprofen'
+        report.save()
+        self.assertEqual(current_generation(), generation + 1)
+        report.adverse_events = ['rash']
+        report.save()
+        self.assertEqual(current_generation(), generation + 2)
+
+    def test_invalidation_reaches_other_engines(self):
+        engine, other = SignalEngine(rebuild_interval=3600), SignalEngine(rebuild_interval=3600)
+        report = make_report('Aspirin then nausea.')
+        self.assertEqual(engine.signals(min_count=1)['total_reports'], 1)
+        other.refresh()
+        report.delete()
+        self.assertEqual(other.signals(min_count=1)['total_reports'], 0)
+
+    def test_limit_below_one_rejected(self):
+        with self.assertRaises(ValueError):
+            SignalEngine().signals(limit=0)
+
+
+class SketchTests(TestCase):
+    """Approximate analytics sketches: merging, error bounds and changes to stored reports"""
+
+    SEVERITIES = ['mild', 'moderate', 'severe']
+    OUTCOMES = ['recovered', 'ongoing', 'fatal']
+
+    def rows(self, count, seed=0):
+        rng = random.Random(seed)
+        return [
+            (f'drug-{int(rng.paretovariate(1.2))}', [f'event-{rng.randint(0, 40)}' for _ in range(rng.randint(0, 3))],
+             rng.choice(self.SEVERITIES), rng.choice(self.OUTCOMES))
+            for _ in range(count)
+        ]
+
+    def sketch(self, rows):
+        sketch = ReportSketch(width=256, depth=4, capacity=20, precision=10)
+        for row in rows:
+            sketch.add(*row)
+        return sketch
+
+    def test_merge_equals_single_pass(self):
+        rows = self.rows(2000)
+        whole = self.sketch(rows)
+        merged = self.sketch(rows[:700])
+        merged.merge(self.sketch(rows[700:]))
+        merged = ReportSketch.from_bytes(merged.to_bytes())
+        self.assertEqual(merged.analytics(), whole.analytics())
+        self.assertTrue((merged.drugs.sketch.table == whole.drugs.sketch.table).all())
+
+    def test_estimates_within_error_bounds(self):
+        rows = self.rows(5000, seed=1)
+        sketch = self.sketch(rows)
+        true_counts = {}
+        for drug, _, _, _ in rows:
+            true_counts[drug] = true_counts.get(drug, 0) + 1
+        bound = sketch.analytics()['error_bounds']['drug_count_max_overestimate']
+        for drug, count in true_counts.items():
+            estimate = sketch.drugs.sketch.estimate(drug)
+            self.assertGreaterEqual(estimate, count)
+            self.assertLessEqual(estimate, count + bound)
+        # Top drugs by estimate are the true top drugs
+        top = sorted(true_counts, key=lambda drug: (-true_counts[drug], drug))[:3]
+        self.assertEqual(list(sketch.drugs.top(3)), top)
+        error = sketch.distinct_drugs.relative_error
+        self.assertAlmostEqual(sketch.distinct_drugs.count(), len(true_counts), delta=4 * error * len(true_counts))
+
+    def test_delete_and_edit_keep_exact_counts(self):
+        self.addCleanup(sketch_store.flush)
+        sketch_store.rebuild([])
+        with self.captureOnCommitCallbacks(execute=True):
+            first = make_report('Aspirin then nausea.', severity='mild')
+            second = make_report('Ibuprofen then rash.', drug='Ibuprofen', adverse_events=['rash'], severity='severe')
+        with self.captureOnCommitCallbacks(execute=True):
+            first.severity = 'moderate'
+            first.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        sketch_store.flush()
+
+        analytics = sketch_store.load().analytics()
+        self.assertEqual(analytics['total_reports'], 1)
+        self.assertEqual(analytics['severity_distribution'], {'moderate': 1})
+        self.assertEqual(analytics['outcome_distribution'], {'recovered': 1})
+        # The deleted report's drug is still counted until a rebuild
+        self.assertEqual(analytics['error_bounds']['reports_changed_since_rebuild'], 1)
+        self.assertIn('Ibuprofen', analytics['common_drugs'])
+
+        rebuilt = sketch_store.rebuild_from_reports().analytics()
+        self.assertEqual(rebuilt['common_drugs'], {'Aspirin': 1})
+        self.assertEqual(rebuilt['error_bounds']['reports_changed_since_rebuild'], 0)
+
+    def test_rebuild_discards_older_deltas(self):
+        other = SketchStore()  # another worker process
+        self.addCleanup(other.flush)
+        sketch_store.rebuild([])
+        make_report('Aspirin then nausea.')
+        # Counted by the other process before the rebuild, which counts it again
+        other.add_rows([('Aspirin', ['nausea'], 'mild', 'recovered')])
+        sketch_store.rebuild_from_reports()
+        other.flush()
+        self.assertEqual(sketch_store.load().reports, 1)
+
+        # Deltas begun after the rebuild are merged
+        other.add_rows([('Aspirin', ['nausea'], 'mild', 'recovered')])
+        other.flush()
+        self.assertEqual(sketch_store.load().reports, 2)
+
+    def test_deltas_saved_during_rebuild_are_kept(self):
+        other = SketchStore()
+        self.addCleanup(other.flush)
+
+        def rows():
+            # Saved by another process while the rebuild is still reading reports
+            other.add_rows([('Aspirin', ['nausea'], 'mild', 'recovered')])
+            other.flush()
+            yield ('Ibuprofen', ['rash'], 'severe', 'ongoing')
+
+        # With nothing stored yet the delta is merged into the rebuilt sketch
+        sketch_store.rebuild(rows())
+        self.assertEqual(sketch_store.load().reports, 2)
+
+        # Otherwise it waits until the rebuilt sketch is stored
+        sketch_store.rebuild(rows())
+        self.assertEqual(sketch_store.load().reports, 1)
+        other.flush()
+        self.assertEqual(sketch_store.load().reports, 2)
+
+
+class RuleStoreTests(TestCase):
+    """Extraction rules are validated, measured and hot reloaded without dropping the working set"""
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = self.tmp / 'rules.json'
+        with open(nlp_processor.rules.source, encoding='utf-8') as source:
+            self.rules = json.load(source)
+        self.write('1')
+        self.store = RuleStore(lambda: str(self.path), lambda: 0.0)
+
+    def write(self, version, content=None):
+        """Replace the rules file atomically, like a deployment would"""
+        tmp_path = self.tmp / 'rules.json.tmp'
+        tmp_path.write_text(content if content is not None else json.dumps(dict(self.rules, version=version)))
+        os.replace(tmp_path, self.path)
+
+    def test_reload_on_change(self):
+        first = self.store.current()
+        self.assertEqual(first.version, '1')
+        self.write('2')
+        self.assertEqual(self.store.current().version, '2')
+        # Extractions holding the old rules keep them
+        self.assertEqual(first.version, '1')
+        self.assertTrue(first.match_keywords('severe nausea'))
+
+    def test_broken_file_keeps_working_rules(self):
+        self.store.current()
+        self.write('2', content='{"version": "2", "known_drugs": "aspirin"}')
+        self.assertEqual(self.store.current().version, '1')
+        self.assertIn('known_drugs', self.store.status()['error'])
+        self.write('3')
+        self.assertEqual(self.store.current().version, '3')
+        self.assertIsNone(self.store.status()['error'])
+
+    def test_request_reload(self):
+        first = self.store.current()
+        self.store.request_reload()
+        self.assertIsNot(self.store.current(), first)
+
+    def test_compile_stats_measure_compiled_rules(self):
+        self.assertFalse(tracemalloc.is_tracing())
+        rules = RuleSet(dict(self.rules, version='1'))
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertGreater(rules.compile_stats['keywords']['bytes'], 0)
+        self.assertEqual(rules.status()['memory_bytes'], rules.compile_stats['bytes'])
+
+    def test_invalid_rules_rejected(self):
+        with self.assertRaises(ValueError):
+            RuleSet({'known_drugs': []})
+        with self.assertRaises(ValueError):
+            RuleSet(dict(self.rules, adverse_events={'nausea': 'sick'}))
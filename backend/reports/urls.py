@@ -4,8 +4,17 @@ from . import views
 urlpatterns = [
     path('', views.api_root, name='api_root'),
     path('process-report/', views.process_report, name='process_report'),
+    path('process-reports/batch/', views.process_reports_batch, name='process_reports_batch'),
+    path('process-reports/ingest/', views.ingest_reports, name='ingest_reports'),
     path('reports/', views.get_reports, name='get_reports'),
+    path('reports/export/', views.export_reports, name='export_reports'),
+    path('reports/search/', views.search_reports_view, name='search_reports'),
     path('reports/<int:report_id>/', views.get_report_detail, name='get_report_detail'),
+    path('reports/<int:report_id>/similar/', views.similar_reports, name='similar_reports'),
+    path('jobs/<int:job_id>/', views.get_job_status, name='get_job_status'),
     path('translate/', views.translate_text, name='translate_text'),
     path('analytics/', views.get_analytics, name='get_analytics'),
+    path('analytics/trends/', views.get_trends, name='get_trends'),
+    path('analytics/signals/', views.get_signals, name='get_signals'),
+    path('health/ready/', views.readiness, name='readiness'),
 ]
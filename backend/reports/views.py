@@ -1,13 +1,70 @@
+from asgiref.sync import async_to_sync, sync_to_async
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import Report
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from .models import Report, ProcessingJob
 from .serializers import (
-    ReportSerializer, ProcessReportSerializer, ReportResponseSerializer,
-    TranslationRequestSerializer, TranslationResponseSerializer
+    ReportSerializer, ProcessReportSerializer, ProcessReportBatchSerializer, ReportResponseSerializer,
+    TranslationRequestSerializer, TranslationResponseSerializer, ProcessingJobSerializer
 )
+from .executor import ExtractionTimeout, extraction_executor
 from .nlp_processor import nlp_processor
+from .processing import process_report_text
+from .services import create_reports
+from .idempotency import IdempotencyError, claim_key, clean_key, complete_key
+from .analytics import (
+    check_analytics_mode, distinct_analytics, parse_date_range, rollup_analytics, trend_range, trend_series
+)
+from .disproportionality import signal_engine
+from .sketches import sketch_store
+from .pagination import filter_reports, list_reports, next_page_url, page_size
+from .search import search_reports
+from .similarity import MAX_K, similarity_index
+from .export import EXPORT_FORMATS, check_export_format, export_stream
+from .ingest import csv_records, ingest_format, ingest_stream, ndjson_records
+
+
+class ThreadedStream:
+    """Async iterator over a synchronous byte stream, advanced one chunk at a time in a sync thread.
+    
+    Django 4.2 under ASGI reads a synchronous streaming body to the end
+    before sending its first byte; this keeps the chunks flowing as they
+    are produced. Calls run in the request's thread-sensitive sync thread,
+    so database cursors opened by the stream stay on one connection.
+    """
+    
+    _done = object()
+    
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        chunk = await sync_to_async(next)(self._chunks, self._done)
+        if chunk is self._done:
+            raise StopAsyncIteration
+        return chunk
+    
+    def close(self):
+        # StreamingHttpResponse.close() calls this from the sync thread, even if streaming stopped early
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def streaming_response(request, chunks, **kwargs) -> StreamingHttpResponse:
+    """A StreamingHttpResponse that sends each chunk as soon as it is ready, under WSGI or ASGI"""
+    if isinstance(request, ASGIRequest):
+        chunks = ThreadedStream(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
 
 
 @api_view(['GET'])
@@ -18,8 +75,18 @@ def api_root(request):
         'version': '1.0.0',
         'endpoints': {
             'process_report': '/api/process-report/',
+            'process_reports_batch': '/api/process-reports/batch/',
+            'ingest_reports': '/api/process-reports/ingest/',
             'reports': '/api/reports/',
+            'search_reports': '/api/reports/search/?q=',
+            'export_reports': '/api/reports/export/?format=ndjson|csv',
+            'similar_reports': '/api/reports/<id>/similar/?k=',
             'translate': '/api/translate/',
+            'job_status': '/api/jobs/<id>/',
+            'analytics': '/api/analytics/',
+            'trends': '/api/analytics/trends/',
+            'signals': '/api/analytics/signals/',
+            'readiness': '/api/health/ready/',
             'admin': '/admin/'
         }
     })
@@ -33,37 +100,89 @@ def process_report(request):
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    report_text = serializer.validated_data['report']
     try:
-        # Process the report using NLP
-        processed_data = nlp_processor.process_report(serializer.validated_data['report'])
+        key = clean_key(request.headers.get('Idempotency-Key'))
+        stored = claim_key(key, report_text) if key else None
+    except IdempotencyError as e:
+        return Response({'error': str(e)}, status=e.status_code)
+    
+    # A retry of a request that already finished gets the same response again
+    if stored is not None:
+        response = Response(stored[1], status=stored[0])
+        response['Idempotent-Replayed'] = 'true'
+        return response
+    
+    body, status_code, headers = async_to_sync(process_report_text)(report_text)
+    response = Response(body, status=status_code, headers=headers)
+    if key:
+        complete_key(key, response.status_code, response.data)
+    return response
+
+
+@api_view(['POST'])
+def process_reports_batch(request):
+    """Process a batch of adverse event reports and store them in one transaction"""
+    serializer = ProcessReportBatchSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        report_texts = serializer.validated_data['reports']
+        processed_reports = extraction_executor.process_reports(report_texts)
         
-        # Save to database
-        report = Report.objects.create(
-            original_report=serializer.validated_data['report'],
-            drug=processed_data['drug'],
-            adverse_events=processed_data['adverse_events'],
-            severity=processed_data['severity'],
-            outcome=processed_data['outcome']
-        )
+        # Save all reports with a single INSERT batch and commit
+        create_reports(report_texts, processed_reports)
         
-        # Return the processed data
-        response_serializer = ReportResponseSerializer(processed_data)
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        response_serializer = ReportResponseSerializer(processed_reports, many=True)
+        return Response(
+            {'count': len(processed_reports), 'results': response_serializer.data},
+            status=status.HTTP_201_CREATED
+        )
         
+    except ExtractionTimeout as e:
+        return Response(
+            {'error': f'Error processing reports: {str(e)}'},
+            status=status.HTTP_504_GATEWAY_TIMEOUT
+        )
     except Exception as e:
         return Response(
-            {'error': f'Error processing report: {str(e)}'}, 
+            {'error': f'Error processing reports: {str(e)}'}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
+# A plain Django view so the upload is read line by line instead of through DRF's parsers
+@csrf_exempt
+@require_POST
+def ingest_reports(request):
+    """Process a large NDJSON or CSV upload in batches, streaming back a result per line"""
+    try:
+        upload_format = ingest_format(request.GET.get('format'), request.content_type)
+        records = csv_records(request) if upload_format == 'csv' else ndjson_records(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return streaming_response(request, ingest_stream(records), content_type='application/x-ndjson')
+
+
 @api_view(['GET'])
 def get_reports(request):
-    """Get all processed reports"""
+    """Get processed reports, newest first, one page at a time"""
+    try:
+        reports, next_cursor, size = list_reports(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
     try:
-        reports = Report.objects.all()
         serializer = ReportSerializer(reports, many=True)
-        return Response({'reports': serializer.data}, status=status.HTTP_200_OK)
+        return Response({
+            'reports': serializer.data,
+            'page_size': size,
+            'next_cursor': next_cursor,
+            'next': next_page_url(request, next_cursor)
+        }, status=status.HTTP_200_OK)
     except Exception as e:
         return Response(
             {'error': f'Error fetching reports: {str(e)}'}, 
@@ -71,6 +190,56 @@ def get_reports(request):
         )
 
 
+@api_view(['GET'])
+def search_reports_view(request):
+    """Full-text search over report narratives, best matches first"""
+    query = request.query_params.get('q', '')
+    try:
+        size = page_size(request.query_params)
+        queryset = filter_reports(request.query_params)
+        results = search_reports(query, queryset, limit=size)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        reports = ReportSerializer([result['report'] for result in results], many=True).data
+        return Response({
+            'query': query,
+            'page_size': size,
+            'results': [
+                dict(report, score=result['score'], snippet=result['snippet'])
+                for report, result in zip(reports, results)
+            ]
+        }, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {'error': f'Error searching reports: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+# A plain Django view: DRF would treat ?format= as a renderer override
+@require_GET
+def export_reports(request):
+    """Stream every report matching the listing filters as NDJSON or CSV"""
+    export_format = request.GET.get('format', 'ndjson')
+    compress = request.GET.get('compress', '') == 'gzip'
+    try:
+        check_export_format(export_format)
+        queryset = filter_reports(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    filename = f'reports.{export_format}' + ('.gz' if compress else '')
+    response = streaming_response(
+        request,
+        export_stream(queryset, export_format, compress),
+        content_type='application/gzip' if compress else EXPORT_FORMATS[export_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @api_view(['GET'])
 def get_report_detail(request, report_id):
     """Get a specific report by ID"""
@@ -85,6 +254,48 @@ def get_report_detail(request, report_id):
         )
 
 
+@api_view(['GET'])
+def similar_reports(request, report_id):
+    """Reports whose narratives are most similar to this one, best matches first"""
+    report = get_object_or_404(Report, id=report_id)
+    try:
+        k = int(request.query_params.get('k', 10))
+    except ValueError:
+        return Response({'error': 'k must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= k <= MAX_K:
+        return Response({'error': f'k must be between 1 and {MAX_K}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # Ask for a few extra neighbours in case some were deleted after this process last read the log
+        neighbours = similarity_index.similar(report.original_report, k + 10, exclude=report.id)
+        found = Report.objects.in_bulk([report_id for report_id, _ in neighbours])
+        results = [
+            dict(ReportSerializer(found[neighbour_id]).data, score=round(score, 4))
+            for neighbour_id, score in neighbours
+            if neighbour_id in found
+        ][:k]
+        return Response({'report_id': report.id, 'k': k, 'results': results}, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {'error': f'Error finding similar reports: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+def get_job_status(request, job_id):
+    """Get the status and result of an asynchronous processing job"""
+    job = get_object_or_404(ProcessingJob, id=job_id)
+    try:
+        serializer = ProcessingJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response(
+            {'error': f'Error fetching job: {str(e)}'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
 @api_view(['POST'])
 def translate_text(request):
     """Translate text to French or Swahili"""
@@ -118,40 +329,23 @@ def translate_text(request):
 @api_view(['GET'])
 def get_analytics(request):
     """Get analytics data for reports"""
+    mode = request.query_params.get('mode', 'exact')
     try:
-        reports = Report.objects.all()
-        
-        # Severity distribution
-        severity_counts = {}
-        for report in reports:
-            severity = report.severity
-            severity_counts[severity] = severity_counts.get(severity, 0) + 1
-        
-        # Outcome distribution
-        outcome_counts = {}
-        for report in reports:
-            outcome = report.outcome
-            outcome_counts[outcome] = outcome_counts.get(outcome, 0) + 1
-        
-        # Most common adverse events
-        adverse_event_counts = {}
-        for report in reports:
-            for event in report.adverse_events:
-                adverse_event_counts[event] = adverse_event_counts.get(event, 0) + 1
-        
-        # Most common drugs
-        drug_counts = {}
-        for report in reports:
-            drug = report.drug
-            drug_counts[drug] = drug_counts.get(drug, 0) + 1
-        
-        analytics_data = {
-            'total_reports': reports.count(),
-            'severity_distribution': severity_counts,
-            'outcome_distribution': outcome_counts,
-            'common_adverse_events': dict(sorted(adverse_event_counts.items(), key=lambda x: x[1], reverse=True)[:10]),
-            'common_drugs': dict(sorted(drug_counts.items(), key=lambda x: x[1], reverse=True)[:10])
-        }
+        start, end = parse_date_range(request.query_params)
+        check_analytics_mode(mode, start, end)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        if mode == 'approximate':
+            # Constant-time answers from the count-min / HyperLogLog sketches
+            analytics_data = sketch_store.load().analytics()
+        elif mode == 'distinct':
+            # The rollups keep cluster representatives apart from their near-duplicates
+            analytics_data = distinct_analytics(start, end)
+        else:
+            # Read the incrementally maintained rollups instead of scanning reports
+            analytics_data = rollup_analytics(start, end)
         
         return Response(analytics_data, status=status.HTTP_200_OK)
         
@@ -160,3 +354,69 @@ def get_analytics(request):
             {'error': f'Error generating analytics: {str(e)}'}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+@api_view(['GET'])
+def get_trends(request):
+    """Get report and adverse event counts bucketed by hour, day or week"""
+    interval = request.query_params.get('interval', 'day')
+    try:
+        start, end = parse_date_range(request.query_params)
+        start, end = trend_range(interval, start, end)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        trends = trend_series(interval, start, end, drug=request.query_params.get('drug') or None)
+        return Response(trends, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        return Response(
+            {'error': f'Error generating trends: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+def get_signals(request):
+    """Get drug/adverse event pairs reported disproportionately often (PRR, ROR, chi-square)"""
+    params = request.query_params
+    try:
+        options = {
+            'min_count': int(params.get('min_count', settings.SIGNAL_MIN_COUNT)),
+            'min_prr': float(params.get('min_prr', 0)),
+            'min_ror': float(params.get('min_ror', 0)),
+            'min_chi2': float(params.get('min_chi2', 0)),
+            'drug': params.get('drug') or None,
+            'adverse_event': params.get('adverse_event') or None,
+            'order_by': params.get('order_by', 'prr'),
+            'limit': min(int(params.get('limit', 100)), 1000),
+        }
+    except ValueError as e:
+        return Response({'error': f'Invalid parameter: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        result = signal_engine.signals(**options)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response(
+            {'error': f'Error detecting signals: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    
+    result['criteria'] = {key: value for key, value in options.items() if key.startswith('min_')}
+    return Response(result, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def readiness(request):
+    """Report whether the NLP model is loaded and the API can serve requests"""
+    executor_status = extraction_executor.status()
+    nlp_status = nlp_processor.status()
+    nlp_status['ready'] = executor_status['ready']
+    nlp_status['executor'] = executor_status
+    return Response(
+        nlp_status,
+        status=status.HTTP_200_OK if nlp_status['ready'] else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
@@ -11,6 +11,7 @@ function App() {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [history, setHistory] = useState([]);
+  const [historyCursor, setHistoryCursor] = useState(null);
   const [analytics, setAnalytics] = useState(null);
   const [translation, setTranslation] = useState(null);
   const [translationLoading, setTranslationLoading] = useState(false);
@@ -23,10 +24,14 @@ function App() {
     fetchAnalytics();
   }, []);
 
-  const fetchHistory = async () => {
+  const fetchHistory = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/reports/`);
-      setHistory(response.data.reports || []);
+      const response = await axios.get(`${API_BASE_URL}/reports/`, {
+        params: cursor ? { cursor } : {}
+      });
+      const reports = response.data.reports || [];
+      setHistory(previous => (cursor ? [...previous, ...reports] : reports));
+      setHistoryCursor(response.data.next_cursor || null);
     } catch (err) {
       console.error('Error fetching history:', err);
     }
@@ -263,6 +268,14 @@ function App() {
                     </div>
                   </div>
                 ))}
+                {historyCursor && (
+                  <button
+                    className="btn btn-secondary"
+                    onClick={() => fetchHistory(historyCursor)}
+                  >
+                    Load more
+                  </button>
+                )}
               </div>
             )}
           </div>